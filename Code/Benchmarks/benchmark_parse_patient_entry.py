@@ -0,0 +1,114 @@
+"""Time the parsing of journal table entries against the original character by character parser.
+
+The equivalence of the parsers is checked by Tests/test_parse_patient_entry.py.
+
+Run from the Code directory with:
+    python -m Benchmarks.benchmark_parse_patient_entry
+"""
+
+# Python imports.
+import argparse
+import random
+import timeit
+
+# User imports.
+from DataProcessing.JournalTable import parse_patient_entry
+
+# Globals.
+INSERT_PREFIX = "insert into `journal`(`id`,`code`,`date`,`value1`,`value2`,`text`) values ("
+
+
+def reference_parse(line):
+    """Parse an entry in the file of the patient-code associations using the original character by character parser.
+
+    :param line:    The line in the file to parse.
+    :type line:     str
+    :return:        The entries on the line.
+    :rtype:         list
+
+    """
+
+    line = line[75:]
+    line = line[:-3]
+    entries = []
+    currentEntry = ""
+    inQuoteBlock = False
+    for i in line:
+        if i == ',' and not inQuoteBlock:
+            entries.append(currentEntry)
+            currentEntry = ""
+        elif i in ["'", '"']:
+            inQuoteBlock = not inQuoteBlock
+        else:
+            currentEntry += i
+    entries.append(currentEntry)
+    code = entries[1].split(',')[0]
+    entries[1] = code
+    return entries
+
+
+def generate_lines(numLines, fractionQuotedCommas, seed=0):
+    """Generate random journal table lines.
+
+    :param numLines:                The number of lines to generate.
+    :type numLines:                 int
+    :param fractionQuotedCommas:    The fraction of lines that should contain a comma within a quote block.
+    :type fractionQuotedCommas:     float
+    :param seed:                    The seed for the random number generator.
+    :type seed:                     int
+    :return:                        The generated lines (including the insert syntax and line ending).
+    :rtype:                         list[str]
+
+    """
+
+    rng = random.Random(seed)
+    codes = ["C10E", "C10F", "XaJ8.", "G30..", "44J3", "246A", "bd3j"]
+    lines = []
+    for _ in range(numLines):
+        code = rng.choice(codes)
+        text = "null"
+        if rng.random() < fractionQuotedCommas:
+            if rng.random() < 0.5:
+                code = "2469,v=130,w=80"
+            else:
+                text = "'TAKE ONE, TWICE A DAY'"
+        lines.append("{:s}{:d},'{:s}','{:d}-{:02d}-{:02d}',{:.4f},{:.4f},{:s});\n".format(
+            INSERT_PREFIX, rng.randint(1, 10 ** 6), code, rng.randint(1950, 2015), rng.randint(1, 12),
+            rng.randint(1, 28), rng.choice([0, 120, 7.25]), rng.choice([0, 45]), text
+        ))
+    return lines
+
+
+def main(numLines, fractionQuotedCommas, repeats):
+    """Time the parser against the reference parser.
+
+    :param numLines:                The number of random lines to parse.
+    :type numLines:                 int
+    :param fractionQuotedCommas:    The fraction of random lines that should contain a comma within a quote block.
+    :type fractionQuotedCommas:     float
+    :param repeats:                 The number of times to repeat the timing.
+    :type repeats:                  int
+
+    """
+
+    lines = generate_lines(numLines, fractionQuotedCommas)
+    timings = {
+        "Reference": min(timeit.repeat(lambda: [reference_parse(i) for i in lines], number=1, repeat=repeats)),
+        "Line": min(timeit.repeat(lambda: [parse_patient_entry.main(i) for i in lines], number=1, repeat=repeats)),
+        "Batch": min(timeit.repeat(lambda: parse_patient_entry.main_batch(lines), number=1, repeat=repeats))
+    }
+    for i in ["Reference", "Line", "Batch"]:
+        print("{:<10s}{:>10.0f} lines/s{:>8.1f}x".format(
+            i, numLines / timings[i], timings["Reference"] / timings[i]
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the parsing of journal table entries.")
+    parser.add_argument("-l", "--lines", default=100000, help="The number of lines to parse. Default: 100000.",
+                        type=int)
+    parser.add_argument("-q", "--quoted", default=0.05,
+                        help="The fraction of lines with a comma in a quote block. Default: 0.05.", type=float)
+    parser.add_argument("-r", "--repeats", default=3, help="The number of timing repeats. Default: 3.", type=int)
+    args = parser.parse_args()
+    main(args.lines, args.quoted, args.repeats)
@@ -0,0 +1,348 @@
+"""Time the stages of the journal table pipeline on synthetic data at a range of scales.
+
+For each scale a synthetic journal table with approximately that many entries is generated, and each stage is then run
+in its own process so that its peak memory use can be measured. The rows processed per second and the peak resident
+set size of each stage are printed and saved as JSON, along with the commit being benchmarked, so that the results of
+different versions can be compared.
+
+Run from the Code directory with:
+    python -m Benchmarks.benchmark_pipeline -s 10000 100000 -o BenchmarkResults.json
+"""
+
+# Python imports.
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# User imports.
+from Benchmarks import generate_synthetic_data
+from DataProcessing.JournalTable import columnar_cache
+from DataProcessing.JournalTable import file_generator
+from DataProcessing.JournalTable import generate_datasets
+from DataProcessing.JournalTable import parse_patient_entry
+from DataProcessing.JournalTable import process_table
+from DataProcessing.JournalTable import save_patient_data
+from Libraries.JsonschemaManipulation import Configuration
+from Utilities import instrumentation
+
+# Globals.
+BENCHMARK_CONFIG = {"DataProcessing": {"FilterCacheSize": 0, "PatientsToKeep": []}}  # Overrides of the defaults.
+CODES_PER_VISIT = 3  # The mean number of codes recorded at each synthetic visit.
+DIR_TOP = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+READ_BLOCK_SIZE = 1 << 22  # The approximate number of bytes of the journal table parsed at once.
+SCALES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 5 * 10 ** 7]  # The default numbers of journal table entries.
+STAGES = [  # The stages benchmarked, in the order they are run.
+    "parse_patient_entry.main", "parse_patient_entry.main_batch", "process_table.main", "generate_datasets.main",
+    "save_patient_data.main"
+]
+VISITS_PER_PATIENT = 20  # The mean number of synthetic visits per patient.
+
+
+def main(scales, fileResults, numProcesses=1, dirWorking=None, label=None):
+    """Benchmark the stages of the pipeline at each scale and save the results.
+
+    :param scales:          The approximate numbers of journal table entries to benchmark with.
+    :type scales:           list[int]
+    :param fileResults:     The location of the JSON file to save the results to. The file is rewritten after each
+                                scale, so the results of completed scales are kept if a later scale fails.
+    :type fileResults:      str
+    :param numProcesses:    The number of processes the pipeline stages should use.
+    :type numProcesses:     int
+    :param dirWorking:      The location of the directory to save the synthetic data and outputs in. A temporary
+                                directory is used and removed afterwards if this is not supplied.
+    :type dirWorking:       str | None
+    :param label:           A label to record with the results (e.g. the name of the version being benchmarked).
+    :type label:            str | None
+    :return:                The results, as saved to fileResults.
+    :rtype:                 dict
+
+    """
+
+    isTemporary = dirWorking is None
+    dirWorking = tempfile.mkdtemp(prefix="Benchmark_") if isTemporary else dirWorking
+    os.makedirs(dirWorking, exist_ok=True)
+    results = {
+        "Label": label, "Commit": _get_commit(), "Date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "Python": platform.python_version(), "Platform": platform.platform(), "NumCPUs": os.cpu_count(),
+        "NumProcesses": numProcesses, "Results": []
+    }
+    context = multiprocessing.get_context("spawn")  # Workers don't inherit the memory use of this process.
+
+    try:
+        for scale in scales:
+            # Generate the synthetic data for the scale.
+            dirScale = os.path.join(dirWorking, "Rows_{:d}".format(scale))
+            shutil.rmtree(dirScale, ignore_errors=True)
+            numPatients = max(1, round(scale / (VISITS_PER_PATIENT * CODES_PER_VISIT)))
+            startTime = time.perf_counter()
+            counts = generate_synthetic_data.main(
+                dirScale, numPatients, visitsPerPatient=VISITS_PER_PATIENT, codesPerVisit=CODES_PER_VISIT
+            )
+            print("Generated {:d} entries for {:d} patients in {:.1f}s.".format(
+                counts["NumRows"], counts["NumPatients"], time.perf_counter() - startTime
+            ))
+
+            # Run each stage in its own process.
+            for stage in STAGES:
+                resultsQueue = context.Queue()
+                process = context.Process(target=_run_stage, args=(stage, dirScale, numProcesses, resultsQueue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    print("\nThe {:s} stage failed at a scale of {:d} rows.\n".format(stage, scale))
+                    sys.exit(1)
+                stageResults = resultsQueue.get()
+                stageResults.update({"Scale": scale, "Stage": stage, "NumPatients": counts["NumPatients"]})
+                stageResults["RowsPerSecond"] = stageResults["Rows"] / stageResults["Seconds"]
+                results["Results"].append(stageResults)
+                print("{:>10d} {:<32s}{:>12.0f} rows/s{:>10.1f} MB peak RSS{:>10.2f}s".format(
+                    scale, stage, stageResults["RowsPerSecond"], stageResults["PeakRSS"] / (1 << 20),
+                    stageResults["Seconds"]
+                ))
+            shutil.rmtree(dirScale)
+
+            with open(fileResults, 'w') as fidResults:
+                json.dump(results, fidResults, indent=2)
+    finally:
+        if isTemporary:
+            shutil.rmtree(dirWorking, ignore_errors=True)
+
+    return results
+
+
+def _benchmark_generate_datasets(dirScale, numProcesses):
+    """Time the generation of the datasets from the processed journal table.
+
+    :param dirScale:        The location of the directory containing the synthetic and processed data.
+    :type dirScale:         str
+    :param numProcesses:    The number of processes to use.
+    :type numProcesses:     int
+    :return:                The number of journal table entries and the seconds taken.
+    :rtype:                 tuple
+
+    """
+
+    dirProcessedData = os.path.join(dirScale, "_ProcessedJournalTable_")
+    dirOutput = _make_output_directory(dirScale, "Datasets")
+    config = _load_config()
+    startTime = time.perf_counter()
+    generate_datasets.main(dirProcessedData, dirOutput, config, numProcesses)
+    return _count_processed_rows(dirProcessedData), time.perf_counter() - startTime
+
+
+def _benchmark_parse(dirScale, isBatch):
+    """Time the parsing of the entries of the journal table.
+
+    Only the parsing is timed, with the journal table read in blocks so that memory use does not grow with its size.
+
+    :param dirScale:    The location of the directory containing the synthetic data.
+    :type dirScale:     str
+    :param isBatch:     Whether to parse each block with main_batch rather than each line with main.
+    :type isBatch:      bool
+    :return:            The number of entries parsed and the seconds taken.
+    :rtype:             tuple
+
+    """
+
+    numRows = 0
+    seconds = 0
+    with open(os.path.join(dirScale, "journal.sql"), 'r') as fidJournal:
+        while True:
+            lines = fidJournal.readlines(READ_BLOCK_SIZE)
+            if not lines:
+                break
+            lines = [i for i in lines if i.startswith("insert")]
+            startTime = time.perf_counter()
+            if isBatch:
+                parse_patient_entry.main_batch(lines)
+            else:
+                for i in lines:
+                    parse_patient_entry.main(i)
+            seconds += time.perf_counter() - startTime
+            numRows += len(lines)
+    return numRows, seconds
+
+
+def _benchmark_process_table(dirScale, numProcesses):
+    """Time the processing of the journal and patient tables.
+
+    :param dirScale:        The location of the directory containing the synthetic data.
+    :type dirScale:         str
+    :param numProcesses:    The number of processes to use.
+    :type numProcesses:     int
+    :return:                The number of journal table entries and the seconds taken.
+    :rtype:                 tuple
+
+    """
+
+    dirProcessedData = _make_output_directory(dirScale, "_ProcessedJournalTable_")
+    startTime = time.perf_counter()
+    process_table.main(dirScale, dirProcessedData, numProcesses)
+    return _count_processed_rows(dirProcessedData), time.perf_counter() - startTime
+
+
+def _benchmark_save_patient_data(dirScale):
+    """Time the saving of the patient histories to the datasets.
+
+    Only the calls to save_patient_data.main are timed, not the reading of the histories or the filtering of the
+    patients and codes.
+
+    :param dirScale:    The location of the directory containing the processed data.
+    :type dirScale:     str
+    :return:            The number of history entries saved and the seconds taken.
+    :rtype:             tuple
+
+    """
+
+    dirProcessedData = os.path.join(dirScale, "_ProcessedJournalTable_")
+    dirOutput = _make_output_directory(dirScale, "SavedHistories")
+    config = _load_config()
+    filterResults = generate_datasets._filter_data(
+        os.path.join(dirProcessedData, "PatientDemographics.tsv"), os.path.join(dirProcessedData, "Codes.txt"), config
+    )
+    validPatientData = filterResults["ValidPatientData"]
+    valueColumns = file_generator.value_columns(filterResults["ValidCodes"], filterResults["CodeAssociatedValues"])
+    rawValuePolicy = config.get_param(["DataProcessing", "RawValuePolicy"])[1]
+    outputFiles = file_generator.open_files(
+        dirOutput, filterResults["ValidCodes"], config.get_param(["DataProcessing", "OutputFormat"])[1],
+        valueColumns=valueColumns
+    )
+    patientHistories = generate_datasets._read_histories_cache(
+        columnar_cache.load(dirProcessedData), validPatientData, filterResults["ValidCodes"]
+    )
+
+    numRows = 0
+    seconds = 0
+    for patientID, patientHistory in patientHistories:
+        startTime = time.perf_counter()
+        save_patient_data.main(
+            patientID, patientHistory, validPatientData.gender(validPatientData.find(patientID)), outputFiles,
+            valueColumns=valueColumns, rawValuePolicy=rawValuePolicy
+        )
+        seconds += time.perf_counter() - startTime
+        numRows += len(patientHistory)
+    file_generator.close_files(outputFiles)
+    return numRows, seconds
+
+
+def _count_processed_rows(dirProcessedData):
+    """Determine the number of entries in a journal table from the summary of its processing.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :return:                    The number of entries in the journal table.
+    :rtype:                     int
+
+    """
+
+    with open(os.path.join(dirProcessedData, "Manifest.json"), 'r') as fidManifest:
+        return json.load(fidManifest)["Statistics"]["NumEvents"]
+
+
+def _get_commit():
+    """Determine the git commit of the code being benchmarked.
+
+    :return:    The hash of the commit, or None if it can not be determined.
+    :rtype:     str | None
+
+    """
+
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=DIR_TOP, stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_config():
+    """Load the default configuration with the benchmark's overrides applied.
+
+    :return:    The configuration.
+    :rtype:     JsonschemaManipulation.Configuration
+
+    """
+
+    fileConfigSchema = os.path.join(DIR_TOP, "ConfigurationFiles", "ConfigurationSchema.json")
+    config = Configuration.Configuration()
+    config.set_from_json(os.path.join(DIR_TOP, "ConfigurationFiles", "DefaultConfig.json"), fileConfigSchema)
+    config.set_from_json(BENCHMARK_CONFIG, fileConfigSchema)
+    return config
+
+
+def _make_output_directory(dirScale, name):
+    """Create an empty directory within the directory of a scale.
+
+    :param dirScale:    The location of the directory of the scale.
+    :type dirScale:     str
+    :param name:        The name of the directory to create.
+    :type name:         str
+    :return:            The location of the created directory.
+    :rtype:             str
+
+    """
+
+    dirOutput = os.path.join(dirScale, name)
+    shutil.rmtree(dirOutput, ignore_errors=True)
+    os.makedirs(dirOutput)
+    return dirOutput
+
+
+def _run_stage(stage, dirScale, numProcesses, resultsQueue):
+    """Run a stage of the pipeline within a worker process and measure it.
+
+    :param stage:           The stage to run (one of STAGES).
+    :type stage:            str
+    :param dirScale:        The location of the directory containing the synthetic data.
+    :type dirScale:         str
+    :param numProcesses:    The number of processes the stage should use.
+    :type numProcesses:     int
+    :param resultsQueue:    The queue to put the measurements on. These are the number of rows processed, the seconds
+                                and CPU seconds taken and the peak resident set size in bytes (the largest of this
+                                process and any processes it started), recorded as
+                                {"Rows": int, "Seconds": float, "CPUSeconds": float, "PeakRSS": int}.
+    :type resultsQueue:     multiprocessing.Queue
+
+    """
+
+    startCPU = time.process_time()
+    if stage == "parse_patient_entry.main":
+        numRows, seconds = _benchmark_parse(dirScale, False)
+    elif stage == "parse_patient_entry.main_batch":
+        numRows, seconds = _benchmark_parse(dirScale, True)
+    elif stage == "process_table.main":
+        numRows, seconds = _benchmark_process_table(dirScale, numProcesses)
+    elif stage == "generate_datasets.main":
+        numRows, seconds = _benchmark_generate_datasets(dirScale, numProcesses)
+    else:
+        numRows, seconds = _benchmark_save_patient_data(dirScale)
+    cpuSeconds = time.process_time() - startCPU
+
+    resultsQueue.put({
+        "Rows": numRows, "Seconds": seconds, "CPUSeconds": cpuSeconds, "PeakRSS": instrumentation.get_peak_rss(True)
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the journal table pipeline.")
+    parser.add_argument("-d", "--dir", default=None,
+                        help="The location to save the synthetic data in. Default: a temporary directory.", type=str)
+    parser.add_argument("-l", "--label", default=None, help="A label to record with the results. Default: none.",
+                        type=str)
+    parser.add_argument("-o", "--output", default="BenchmarkResults.json",
+                        help="The location to save the results to. Default: BenchmarkResults.json.", type=str)
+    parser.add_argument("-p", "--processes", default=1,
+                        help="The number of processes the pipeline should use. Default: 1.", type=int)
+    parser.add_argument("-s", "--scales", default=SCALES, nargs='+',
+                        help="The numbers of journal table entries to benchmark with. Default: {:s}.".format(
+                            ' '.join([str(i) for i in SCALES])), type=int)
+    args = parser.parse_args()
+    main(args.scales, args.output, args.processes, args.dir, args.label)
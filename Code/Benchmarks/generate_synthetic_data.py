@@ -0,0 +1,172 @@
+"""Generate synthetic journal.sql and patient.sql files in the layout expected by the journal table processing.
+
+Each patient has a number of visits, with a number of codes recorded on the date of each visit. The codes are drawn
+from a vocabulary whose frequencies follow a Zipf distribution, so a few codes are very common and most are rare. A
+fraction of the entries have quoted free text containing commas, and a fraction have values embedded in their code
+(e.g. '2469,v=130,w=80'). The entries of a patient are written consecutively, as they are in a real journal table.
+
+Run from the Code directory with:
+    python -m Benchmarks.generate_synthetic_data OUTPUT_DIRECTORY
+"""
+
+# Python imports.
+import argparse
+import datetime
+import os
+import string
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+END_DATE = datetime.date(2015, 12, 31)  # The latest date an entry can be recorded on.
+FIRST_PATIENT_ID = 26000  # The ID of the first patient generated.
+FREE_TEXT = [  # The free text recorded with entries that have any, all quoted and most containing commas.
+    "'TAKE ONE, TWICE A DAY'", "'ONE TO BE TAKEN FOUR TIMES A DAY'", "'1 TABLET, AT NIGHT, WITH FOOD'",
+    "'APPLY THINLY, AS DIRECTED'", "'REVIEW IN 6 MONTHS, SEE NOTES'", "'NORMAL, NO ACTION'"
+]
+JOURNAL_PREFIX = "insert into `journal`(`id`,`code`,`date`,`value1`,`value2`,`text`) values ("
+PATIENT_BATCH_SIZE = 10000  # The number of patients generated at once.
+PATIENT_PREFIX = "insert into `patient`(`id`,`year_of_birth`,`practice_id`,`gender`)          values ("
+YEARS_OF_BIRTH = (1920, 2000)  # The range of the years of birth of the patients.
+
+
+def main(dirOutput, numPatients, numCodes=1000, visitsPerPatient=20, codesPerVisit=3, zipfExponent=1.1,
+         fractionFreeText=0.1, fractionEmbeddedValues=0.05, seed=0):
+    """Generate a synthetic journal table and patient table.
+
+    :param dirOutput:               The location of the directory to save journal.sql and patient.sql in.
+    :type dirOutput:                str
+    :param numPatients:             The number of patients to generate.
+    :type numPatients:              int
+    :param numCodes:                The number of codes in the vocabulary.
+    :type numCodes:                 int
+    :param visitsPerPatient:        The mean number of visits of each patient (every patient has at least one).
+    :type visitsPerPatient:         float
+    :param codesPerVisit:           The mean number of codes recorded at each visit (every visit has at least one).
+    :type codesPerVisit:            float
+    :param zipfExponent:            The exponent of the Zipf distribution of the code frequencies.
+    :type zipfExponent:             float
+    :param fractionFreeText:        The fraction of entries with quoted free text.
+    :type fractionFreeText:         float
+    :param fractionEmbeddedValues:  The fraction of entries with values embedded in their code.
+    :type fractionEmbeddedValues:   float
+    :param seed:                    The seed for the random number generator.
+    :type seed:                     int
+    :return:                        The number of patients and entries written, recorded as
+                                        {"NumPatients": int, "NumRows": int}.
+    :rtype:                         dict
+
+    """
+
+    os.makedirs(dirOutput, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    # Create the vocabulary, with the probability of the code at each rank proportional to 1 / rank^zipfExponent.
+    codes = _generate_codes(numCodes, rng)
+    codeProbabilities = 1 / np.arange(1, numCodes + 1) ** zipfExponent
+    cumulativeProbabilities = np.cumsum(codeProbabilities / codeProbabilities.sum())
+
+    numRows = 0
+    endOrdinal = END_DATE.toordinal()
+    with open(os.path.join(dirOutput, "journal.sql"), 'w') as fidJournal, \
+            open(os.path.join(dirOutput, "patient.sql"), 'w') as fidPatient:
+        fidJournal.write("-- Synthetic journal table\n")
+        fidPatient.write("-- Synthetic patient table\n")
+        for batchStart in range(0, numPatients, PATIENT_BATCH_SIZE):
+            batchSize = min(PATIENT_BATCH_SIZE, numPatients - batchStart)
+
+            # Generate the patients.
+            patientIDs = np.arange(batchStart, batchStart + batchSize) + FIRST_PATIENT_ID
+            yearsOfBirth = rng.integers(YEARS_OF_BIRTH[0], YEARS_OF_BIRTH[1] + 1, batchSize)
+            fidPatient.writelines([
+                "{:s}{:d},{:d},{:d},{:d});\n".format(PATIENT_PREFIX, i, j, k, l) for i, j, k, l in zip(
+                    patientIDs.tolist(), yearsOfBirth.tolist(), rng.integers(1, 100, batchSize).tolist(),
+                    rng.integers(0, 2, batchSize).tolist()
+                )
+            ])
+
+            # Generate the visits, each on a date between the start of the year of birth and the end date.
+            numVisits = 1 + rng.poisson(max(visitsPerPatient - 1, 0), batchSize)
+            visitPatients = np.repeat(np.arange(batchSize), numVisits)
+            birthOrdinals = np.array([datetime.date(i, 1, 1).toordinal() for i in yearsOfBirth.tolist()])
+            visitOrdinals = birthOrdinals[visitPatients] + (
+                rng.random(visitPatients.size) * (endOrdinal - birthOrdinals[visitPatients] + 1)
+            ).astype(np.int64)
+            visitDates = [datetime.date.fromordinal(i).isoformat() for i in visitOrdinals.tolist()]
+
+            # Generate the entries of each visit.
+            numEntries = 1 + rng.poisson(max(codesPerVisit - 1, 0), visitPatients.size)
+            entryVisits = np.repeat(np.arange(visitPatients.size), numEntries)
+            numBatchRows = entryVisits.size
+            entryCodes = np.minimum(np.searchsorted(cumulativeProbabilities, rng.random(numBatchRows)), numCodes - 1)
+            isEmbedded = rng.random(numBatchRows) < fractionEmbeddedValues
+            isFreeText = rng.random(numBatchRows) < fractionFreeText
+            freeText = rng.integers(0, len(FREE_TEXT), numBatchRows)
+            values1 = np.where(rng.random(numBatchRows) < 0.3, np.round(rng.gamma(2, 40, numBatchRows), 4), 0)
+            values2 = np.where(rng.random(numBatchRows) < 0.2, np.round(rng.gamma(2, 20, numBatchRows), 4), 0)
+
+            # Write the entries.
+            lines = []
+            for patientID, visit, code, embedded, text, textIndex, value1, value2 in zip(
+                    patientIDs[visitPatients[entryVisits]].tolist(), entryVisits.tolist(), entryCodes.tolist(),
+                    isEmbedded.tolist(), isFreeText.tolist(), freeText.tolist(), values1.tolist(), values2.tolist()):
+                code = codes[code]
+                if embedded:
+                    code = "{:s},v={:.0f},w={:.0f}".format(code, value1, value2)
+                lines.append("{:s}{:d},'{:s}','{:s}',{:.4f},{:.4f},{:s});\n".format(
+                    JOURNAL_PREFIX, patientID, code, visitDates[visit], value1, value2,
+                    FREE_TEXT[textIndex] if text else "null"
+                ))
+            fidJournal.writelines(lines)
+            numRows += numBatchRows
+
+    return {"NumPatients": numPatients, "NumRows": numRows}
+
+
+def _generate_codes(numCodes, rng):
+    """Generate a vocabulary of distinct codes in the style of Read codes (e.g. C10E. or XaJ8.).
+
+    :param numCodes:    The number of codes to generate.
+    :type numCodes:     int
+    :param rng:         The random number generator to use.
+    :type rng:          np.random.Generator
+    :return:            The codes, in rank order.
+    :rtype:             list[str]
+
+    """
+
+    characters = np.array(list(string.ascii_uppercase + string.ascii_lowercase + string.digits))
+    codes = []
+    seen = set()
+    while len(codes) < numCodes:
+        code = ''.join(rng.choice(characters, 4)) + ('.' if rng.random() < 0.5 else '')
+        if code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return codes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic journal table and patient table.")
+    parser.add_argument("output", help="The location of the directory to save journal.sql and patient.sql in.",
+                        type=str)
+    parser.add_argument("-p", "--patients", default=10000, help="The number of patients. Default: 10000.", type=int)
+    parser.add_argument("-c", "--codes", default=1000, help="The size of the code vocabulary. Default: 1000.",
+                        type=int)
+    parser.add_argument("-v", "--visits", default=20, help="The mean number of visits per patient. Default: 20.",
+                        type=float)
+    parser.add_argument("-k", "--codesPerVisit", default=3,
+                        help="The mean number of codes per visit. Default: 3.", type=float)
+    parser.add_argument("-z", "--zipf", default=1.1,
+                        help="The exponent of the Zipf distribution of code frequencies. Default: 1.1.", type=float)
+    parser.add_argument("-t", "--freeText", default=0.1,
+                        help="The fraction of entries with quoted free text. Default: 0.1.", type=float)
+    parser.add_argument("-e", "--embedded", default=0.05,
+                        help="The fraction of entries with values embedded in the code. Default: 0.05.", type=float)
+    parser.add_argument("-s", "--seed", default=0, help="The seed for the random number generator. Default: 0.",
+                        type=int)
+    args = parser.parse_args()
+    counts = main(args.output, args.patients, args.codes, args.visits, args.codesPerVisit, args.zipf, args.freeText,
+                  args.embedded, args.seed)
+    print("Wrote {:d} entries for {:d} patients.".format(counts["NumRows"], counts["NumPatients"]))
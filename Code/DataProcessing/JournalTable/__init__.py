@@ -1,2 +1,6 @@
+from . import cache_manifest
+from . import dataset_service
 from . import generate_datasets
-from . import process_table
\ No newline at end of file
+from . import process_table
+from . import patient_stream
+from .patient_stream import iter_patients, minibatches, time_step_vectors
@@ -0,0 +1,221 @@
+"""Functions to record and check the state of the source files that a processed journal table was created from.
+
+The manifest is saved as Manifest.json in the processed data directory. For each source file it records the size and
+modification time of the file when it was processed, along with a hash of the bytes that were processed. It also
+records where the final patient record begins in the journal table, so that an update can re-process that record
+along with any data appended after it, whether the journal table was sorted before it was processed and the codec the
+processed journal table was compressed with. Source files may be compressed, in which case the name of the file found
+is recorded, and switching between a compressed and uncompressed source file makes the processed data stale.
+"""
+
+# Python imports.
+import hashlib
+import json
+import os
+
+# User imports.
+from Utilities import compressed_files
+
+# Globals.
+APPENDED = "Appended"  # Status of a processed journal table whose source files have only had data appended to them.
+FRESH = "Fresh"  # Status of a processed journal table whose source files are unchanged.
+HASH_BLOCK_SIZE = 1 << 22  # The number of bytes to read at once when hashing a file.
+MANIFEST_FILE = "Manifest.json"  # The name of the manifest file within the processed data directory.
+MANIFEST_VERSION = 3  # The version of the manifest format.
+SOURCE_FILES = ["journal.sql", "patient.sql"]  # The source files a processed journal table is created from.
+STALE = "Stale"  # Status of a processed journal table that must be re-created from scratch.
+
+
+def check(dirSQLFiles, dirProcessedData, isSorted=False, compression=None):
+    """Determine whether a processed journal table is up to date with its source files.
+
+    The size and modification time of each source file is compared to the manifest. Only when they differ is the
+    file hashed, in which case the bytes that were processed must be unchanged for the file to count as appended to.
+    A processed journal table with no final record recorded (e.g. one that was sorted) is stale once appended to.
+
+    :param dirSQLFiles:         The location of the directory containing the SQL files of the patient data.
+    :type dirSQLFiles:          str
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param isSorted:            Whether the journal table should be sorted before it is processed.
+    :type isSorted:             bool
+    :param compression:         The codec the processed journal table should be compressed with, or None for no
+                                    compression.
+    :type compression:          str | None
+    :return:                    The status of the processed data (one of FRESH, APPENDED or STALE) and the current state
+                                    of the source files, recorded as {"Status": str, "Sources": dict}.
+    :rtype:                     dict
+
+    """
+
+    manifest = read(dirProcessedData)
+    if manifest is None or manifest["IsSorted"] != isSorted or manifest["Compression"] != compression:
+        return {"Status": STALE, "Sources": None}
+
+    status = FRESH
+    sources = {}
+    for i in SOURCE_FILES:
+        fileSource = compressed_files.find_file(os.path.join(dirSQLFiles, i))
+        recorded = manifest["Sources"][i]
+        if fileSource is None or os.path.basename(fileSource) != recorded["File"]:
+            return {"Status": STALE, "Sources": None}
+        fileStats = os.stat(fileSource)
+        if fileStats.st_size == recorded["Size"] and fileStats.st_mtime == recorded["MTime"]:
+            sources[i] = recorded
+            continue
+
+        # The file may have changed, so check that the bytes that were processed are unchanged and hash any new bytes.
+        if fileStats.st_size < recorded["Size"]:
+            return {"Status": STALE, "Sources": None}
+        hasher = hash_file(fileSource, recorded["Size"])
+        if hasher.hexdigest() != recorded["Hash"]:
+            return {"Status": STALE, "Sources": None}
+        hasher = hash_file(fileSource, fileStats.st_size, recorded["Size"], hasher)
+        sources[i] = {
+            "File": recorded["File"], "Hash": hasher.hexdigest(), "MTime": fileStats.st_mtime,
+            "Size": fileStats.st_size
+        }
+        if fileStats.st_size > recorded["Size"]:
+            if manifest["FinalRecord"] is None:
+                # Without a final record there is nothing to update from.
+                return {"Status": STALE, "Sources": None}
+            status = APPENDED
+
+    return {"Status": status, "Sources": sources}
+
+
+def describe_sources(dirSQLFiles):
+    """Record the current state of the source files.
+
+    :param dirSQLFiles: The location of the directory containing the SQL files of the patient data.
+    :type dirSQLFiles:  str
+    :return:            The name of the file found (which may be compressed), size, modification time and hash of each
+                            source file indexed by the uncompressed file name.
+    :rtype:             dict
+
+    """
+
+    sources = {}
+    for i in SOURCE_FILES:
+        fileSource = compressed_files.find_file(os.path.join(dirSQLFiles, i))
+        fileStats = os.stat(fileSource)
+        sources[i] = {
+            "File": os.path.basename(fileSource), "Hash": hash_file(fileSource, fileStats.st_size).hexdigest(),
+            "MTime": fileStats.st_mtime, "Size": fileStats.st_size
+        }
+    return sources
+
+
+def hash_file(fileName, end, start=0, hasher=None):
+    """Hash a byte range of a file.
+
+    :param fileName:    The location of the file to hash.
+    :type fileName:     str
+    :param end:         The byte offset of the end of the range.
+    :type end:          int
+    :param start:       The byte offset of the start of the range.
+    :type start:        int
+    :param hasher:      The hash object to update with the range (a new one is created if none is supplied).
+    :type hasher:       hashlib._Hash
+    :return:            The hash object updated with the bytes in the range.
+    :rtype:             hashlib._Hash
+
+    """
+
+    hasher = hasher if hasher else hashlib.sha256()
+    with open(fileName, 'rb') as fid:
+        fid.seek(start)
+        position = start
+        while position < end:
+            block = fid.read(min(HASH_BLOCK_SIZE, end - position))
+            if not block:
+                break
+            hasher.update(block)
+            position += len(block)
+    return hasher
+
+
+def read(dirProcessedData):
+    """Read the manifest of a processed journal table.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :return:                    The manifest, or None if there is no manifest of the current version.
+    :rtype:                     dict | None
+
+    """
+
+    fileManifest = os.path.join(dirProcessedData, MANIFEST_FILE)
+    if not os.path.isfile(fileManifest):
+        return None
+    with open(fileManifest, 'r') as fidManifest:
+        manifest = json.load(fidManifest)
+    return manifest if manifest.get("Version") == MANIFEST_VERSION else None
+
+
+def refresh(dirProcessedData, sources):
+    """Record a new state of unchanged source files in the manifest of a processed journal table.
+
+    This avoids re-hashing source files whose modification time has changed without their content changing.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param sources:             The state of the source files, as returned by check.
+    :type sources:              dict
+
+    """
+
+    manifest = read(dirProcessedData)
+    if manifest["Sources"] != sources:
+        write(
+            dirProcessedData, sources, manifest["FinalRecord"], manifest["Statistics"], manifest["IsSorted"],
+            manifest["Compression"]
+        )
+
+
+def remove(dirProcessedData):
+    """Remove the manifest of a processed journal table, making the processed data stale until a manifest is written.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+
+    """
+
+    fileManifest = os.path.join(dirProcessedData, MANIFEST_FILE)
+    if os.path.isfile(fileManifest):
+        os.remove(fileManifest)
+
+
+def write(dirProcessedData, sources, finalRecord, statistics, isSorted=False, compression=None):
+    """Write the manifest of a processed journal table.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param sources:             The state of the source files when they were processed, as returned by
+                                    describe_sources.
+    :type sources:              dict
+    :param finalRecord:         Where the final patient record begins in the journal table, recorded as
+                                    {"Offset": int, "NumEvents": int, "NumValidEvents": int} where the numbers of events
+                                    are those at or after the offset. None if there are no patient records or the
+                                    processed journal table can not be updated (e.g. the journal table was sorted).
+    :type finalRecord:          dict | None
+    :param statistics:          The number of events and valid events in the whole journal table, recorded as
+                                    {"NumEvents": int, "NumValidEvents": int}.
+    :type statistics:           dict
+    :param isSorted:            Whether the journal table was sorted before it was processed.
+    :type isSorted:             bool
+    :param compression:         The codec the processed journal table was compressed with, or None for no compression.
+    :type compression:          str | None
+
+    """
+
+    # Write the manifest to a temporary file that then replaces any existing manifest, so that a partially written
+    # manifest is never read.
+    fileManifest = os.path.join(dirProcessedData, MANIFEST_FILE)
+    with open(fileManifest + ".tmp", 'w') as fidManifest:
+        json.dump(
+            {"Version": MANIFEST_VERSION, "Sources": sources, "FinalRecord": finalRecord, "Statistics": statistics,
+             "IsSorted": isSorted, "Compression": compression},
+            fidManifest, indent=2, sort_keys=True
+        )
+    os.replace(fileManifest + ".tmp", fileManifest)
@@ -0,0 +1,351 @@
+"""Binary columnar cache of a processed journal table that can be memory-mapped when generating datasets.
+
+The cache is stored in a directory containing one file per column. Every column has one entry per row of the processed
+journal table (in the same order as JournalTable.tsv), except for the offsets of the patient records:
+    Patients.bin - int32 index of the row's patient ID in the PatientIDs dictionary.
+    Codes.bin - int32 index of the row's code in the Codes dictionary.
+    Dates.bin - int32 proleptic Gregorian ordinal of the row's date.
+    Years.bin - int32 year of the row's date.
+    Visits.bin - int32 visit number of the row within the patient's history.
+    Val1.bin - float32 first value of the row.
+    Val2.bin - float32 second value of the row.
+    PatientOffsets.bin - int64 index of the first row of each patient record, followed by the total number of rows. A
+        patient will only have more than one record if their history is not recorded consecutively.
+    FreeText.txt - the free text of each row, one row per line.
+    Dictionary.json - the PatientIDs and Codes dictionaries along with the number of rows and records. This file is
+        written last, so a cache without it is incomplete.
+"""
+
+# Python imports.
+import array
+import json
+import os
+import shutil
+
+# User imports.
+from Utilities import read_reversed_lines
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+CACHE_DIRECTORY = "ColumnarCache"  # The name of the cache directory within the processed data directory.
+CACHE_VERSION = 1  # The version of the cache format.
+COLUMNS = [  # The name, array typecode and NumPy type of each column with one entry per row.
+    ("Patients", 'i', np.int32), ("Codes", 'i', np.int32), ("Dates", 'i', np.int32), ("Years", 'i', np.int32),
+    ("Visits", 'i', np.int32), ("Val1", 'f', np.float32), ("Val2", 'f', np.float32)
+]
+FLUSH_SIZE = 1 << 20  # The number of rows to buffer before writing the columns out.
+
+
+class CacheWriter:
+    """Write the columnar cache of a processed journal table one patient record at a time."""
+
+    def __init__(self, dirCache, isAppend=False):
+        """Initialise the writer, creating the (empty) cache directory unless appending to an existing cache.
+
+        :param dirCache:    The location of the cache directory.
+        :type dirCache:     str
+        :param isAppend:    Whether the records should be appended to the existing cache in the directory.
+        :type isAppend:     bool
+
+        """
+
+        self._dirCache = dirCache
+        self._columns = {i[0]: array.array(i[1]) for i in COLUMNS}
+        if isAppend:
+            dictionary = _read_dictionary(dirCache)
+            self._patientIndices = {j: i for i, j in enumerate(dictionary["PatientIDs"])}
+            self._codeIndices = {j: i for i, j in enumerate(dictionary["Codes"])}
+            self._offsets = array.array('q')
+            with open(os.path.join(dirCache, "PatientOffsets.bin"), 'rb') as fidOffsets:
+                self._offsets.frombytes(fidOffsets.read())
+        else:
+            if os.path.exists(dirCache):
+                shutil.rmtree(dirCache)
+            os.makedirs(dirCache)
+            self._patientIndices = {}
+            self._codeIndices = {}
+            self._offsets = array.array('q', [0])
+        self._columnFiles = {
+            i[0]: open(os.path.join(dirCache, "{:s}.bin".format(i[0])), 'ab' if isAppend else 'wb') for i in COLUMNS
+        }
+        self._fidFreeText = open(os.path.join(dirCache, "FreeText.txt"), 'a' if isAppend else 'w')
+
+    def add_patient(self, patientID, patientRows, dateOrdinals):
+        """Add a patient's record to the cache.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientRows:     The rows of the patient's record, formatted as in JournalTable.tsv (i.e. as a list of
+                                    the patient ID, code, date, year, visit number, Val1, Val2 and free text strings).
+        :type patientRows:      list[list[str]]
+        :param dateOrdinals:    The date ordinal of each row.
+        :type dateOrdinals:     list[int]
+
+        """
+
+        patientIndex = self._patientIndices.setdefault(patientID, len(self._patientIndices))
+        codeIndices = self._codeIndices
+        self._columns["Patients"].extend([patientIndex] * len(patientRows))
+        self._columns["Codes"].extend([codeIndices.setdefault(i[1], len(codeIndices)) for i in patientRows])
+        self._columns["Dates"].extend(dateOrdinals)
+        self._columns["Years"].extend([int(i[3]) for i in patientRows])
+        self._columns["Visits"].extend([int(i[4]) for i in patientRows])
+        self._columns["Val1"].extend([float(i[5]) for i in patientRows])
+        self._columns["Val2"].extend([float(i[6]) for i in patientRows])
+        self._fidFreeText.write(''.join(["{:s}\n".format(i[7]) for i in patientRows]))
+        self._offsets.append(self._offsets[-1] + len(patientRows))
+        if len(self._columns["Patients"]) >= FLUSH_SIZE:
+            self._flush()
+
+    def close(self):
+        """Write out any buffered rows and the dictionaries, and close the cache files."""
+
+        self._flush()
+        for i in self._columnFiles.values():
+            i.close()
+        self._fidFreeText.close()
+        with open(os.path.join(self._dirCache, "PatientOffsets.bin"), 'wb') as fidOffsets:
+            self._offsets.tofile(fidOffsets)
+        _write_dictionary(
+            self._dirCache, sorted(self._patientIndices, key=self._patientIndices.get),
+            sorted(self._codeIndices, key=self._codeIndices.get), self._offsets[-1], len(self._offsets) - 1
+        )
+
+    def _flush(self):
+        """Write out the buffered rows."""
+
+        for i in COLUMNS:
+            self._columns[i[0]].tofile(self._columnFiles[i[0]])
+            self._columns[i[0]] = array.array(i[1])
+
+
+class ColumnarCache:
+    """A read-only, memory-mapped view of a columnar cache.
+
+    Each column is available as a NumPy array attribute named after the column (e.g. cache.Codes), and the offsets of
+    the patient records as cache.PatientOffsets. Only the columns that are accessed are ever read from disk.
+
+    """
+
+    def __init__(self, dirCache, dictionary):
+        """Initialise the view of the cache.
+
+        :param dirCache:    The location of the cache directory.
+        :type dirCache:     str
+        :param dictionary:  The contents of the Dictionary.json file of the cache.
+        :type dictionary:   dict
+
+        """
+
+        self.dirCache = dirCache
+        self.patientIDs = dictionary["PatientIDs"]
+        self.codes = dictionary["Codes"]
+        self.numRows = dictionary["NumRows"]
+        self.numRecords = dictionary["NumRecords"]
+        for i in COLUMNS:
+            setattr(self, i[0], _map_column(os.path.join(dirCache, "{:s}.bin".format(i[0])), i[2], self.numRows))
+        self.PatientOffsets = _map_column(os.path.join(dirCache, "PatientOffsets.bin"), np.int64, self.numRecords + 1)
+
+    def record_patients(self):
+        """Get the index of the patient each patient record belongs to.
+
+        :return:    The patient index of each record.
+        :rtype:     numpy.ndarray
+
+        """
+
+        return self.Patients[self.PatientOffsets[:-1]]
+
+
+def drop_final_record(dirCache):
+    """Remove the final patient record from a cache.
+
+    Patients and codes are added to the dictionaries in the order they first occur, so any that first occurred in the
+    removed record are at the end of the dictionaries and are removed from them as well.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+
+    """
+
+    dictionary = _read_dictionary(dirCache)
+    offsets = np.fromfile(os.path.join(dirCache, "PatientOffsets.bin"), dtype=np.int64)
+    numRecords = dictionary["NumRecords"] - 1
+    numRows = int(offsets[numRecords])
+    numRowsDropped = dictionary["NumRows"] - numRows
+    patientIDs = dictionary["PatientIDs"]
+    codes = dictionary["Codes"]
+    if numRows:
+        patientIDs = patientIDs[:int(np.fromfile(os.path.join(dirCache, "Patients.bin"), np.int32, numRows).max()) + 1]
+        codes = codes[:int(np.fromfile(os.path.join(dirCache, "Codes.bin"), np.int32, numRows).max()) + 1]
+    else:
+        patientIDs = []
+        codes = []
+
+    # Truncate the columns.
+    for i in COLUMNS:
+        os.truncate(os.path.join(dirCache, "{:s}.bin".format(i[0])), numRows * np.dtype(i[2]).itemsize)
+    os.truncate(os.path.join(dirCache, "PatientOffsets.bin"), (numRecords + 1) * np.dtype(np.int64).itemsize)
+    fileFreeText = os.path.join(dirCache, "FreeText.txt")
+    freeTextEnd = os.path.getsize(fileFreeText)
+    for ind, (offset, _) in enumerate(read_reversed_lines.main(fileFreeText)):
+        if ind == numRowsDropped:
+            break
+        freeTextEnd = offset
+    os.truncate(fileFreeText, freeTextEnd)
+    _write_dictionary(dirCache, patientIDs, codes, numRows, numRecords)
+
+
+def load(dirProcessedData):
+    """Load the columnar cache of a processed journal table if it exists.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :return:                    The memory-mapped cache, or None if there is no complete cache of the current version.
+    :rtype:                     ColumnarCache | None
+
+    """
+
+    return _load_directory(os.path.join(dirProcessedData, CACHE_DIRECTORY))
+
+
+def merge(dirShardCaches, dirCache, isAppend=False):
+    """Merge caches created from consecutive ranges of a journal table into a single cache.
+
+    :param dirShardCaches:  The locations of the caches to merge, in the order their ranges occur in the journal table.
+    :type dirShardCaches:   list[str]
+    :param dirCache:        The location to save the merged cache to.
+    :type dirCache:         str
+    :param isAppend:        Whether the caches should be appended to the existing cache at the location.
+    :type isAppend:         bool
+
+    """
+
+    if isAppend:
+        dictionary = _read_dictionary(dirCache)
+        patientIndices = {j: i for i, j in enumerate(dictionary["PatientIDs"])}
+        codeIndices = {j: i for i, j in enumerate(dictionary["Codes"])}
+        numRows = dictionary["NumRows"]
+        numRecords = dictionary["NumRecords"]
+    else:
+        if os.path.exists(dirCache):
+            shutil.rmtree(dirCache)
+        os.makedirs(dirCache)
+        patientIndices = {}
+        codeIndices = {}
+        numRows = 0
+        numRecords = 0
+    fileMode = 'ab' if isAppend else 'wb'
+    columnFiles = {i[0]: open(os.path.join(dirCache, "{:s}.bin".format(i[0])), fileMode) for i in COLUMNS}
+    with open(os.path.join(dirCache, "FreeText.txt"), 'a' if isAppend else 'w') as fidFreeText, \
+            open(os.path.join(dirCache, "PatientOffsets.bin"), fileMode) as fidOffsets:
+        if not isAppend:
+            np.zeros(1, dtype=np.int64).tofile(fidOffsets)
+        for i in dirShardCaches:
+            shardCache = _load_directory(i)
+
+            # Map the shard's dictionary indices to the merged dictionary indices.
+            patientMapping = np.array(
+                [patientIndices.setdefault(j, len(patientIndices)) for j in shardCache.patientIDs], dtype=np.int32
+            )
+            codeMapping = np.array(
+                [codeIndices.setdefault(j, len(codeIndices)) for j in shardCache.codes], dtype=np.int32
+            )
+
+            # Append the shard's columns.
+            for j in COLUMNS:
+                column = getattr(shardCache, j[0])
+                if j[0] == "Patients":
+                    column = patientMapping[column]
+                elif j[0] == "Codes":
+                    column = codeMapping[column]
+                np.asarray(column, dtype=j[2]).tofile(columnFiles[j[0]])
+            (shardCache.PatientOffsets[1:] + numRows).tofile(fidOffsets)
+            with open(os.path.join(shardCache.dirCache, "FreeText.txt"), 'r') as fidShardFreeText:
+                shutil.copyfileobj(fidShardFreeText, fidFreeText)
+            numRows += shardCache.numRows
+            numRecords += shardCache.numRecords
+    for i in columnFiles.values():
+        i.close()
+    _write_dictionary(
+        dirCache, sorted(patientIndices, key=patientIndices.get), sorted(codeIndices, key=codeIndices.get),
+        numRows, numRecords
+    )
+
+
+def _load_directory(dirCache):
+    """Load a columnar cache from its directory.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+    :return:            The memory-mapped cache, or None if there is no complete cache of the current version.
+    :rtype:             ColumnarCache | None
+
+    """
+
+    if not os.path.isfile(os.path.join(dirCache, "Dictionary.json")):
+        return None
+    dictionary = _read_dictionary(dirCache)
+    if dictionary.get("Version") != CACHE_VERSION:
+        return None
+    return ColumnarCache(dirCache, dictionary)
+
+
+def _map_column(fileColumn, dtype, length):
+    """Memory-map a column of the cache.
+
+    :param fileColumn:  The location of the column file.
+    :type fileColumn:   str
+    :param dtype:       The type of the column's entries.
+    :type dtype:        type
+    :param length:      The number of entries in the column.
+    :type length:       int
+    :return:            The read-only column.
+    :rtype:             numpy.ndarray
+
+    """
+
+    if length == 0:
+        # Empty files can't be memory-mapped.
+        return np.empty(0, dtype=dtype)
+    return np.memmap(fileColumn, dtype=dtype, mode='r', shape=(length,))
+
+
+def _read_dictionary(dirCache):
+    """Read the dictionary file of a cache.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+    :return:            The contents of the dictionary file.
+    :rtype:             dict
+
+    """
+
+    with open(os.path.join(dirCache, "Dictionary.json"), 'r') as fidDictionary:
+        return json.load(fidDictionary)
+
+
+def _write_dictionary(dirCache, patientIDs, codes, numRows, numRecords):
+    """Write the dictionary file of a cache, marking the cache as complete.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+    :param patientIDs:  The patient IDs, ordered by their index.
+    :type patientIDs:   list[str]
+    :param codes:       The codes, ordered by their index.
+    :type codes:        list[str]
+    :param numRows:     The number of rows in the cache.
+    :type numRows:      int
+    :param numRecords:  The number of patient records in the cache.
+    :type numRecords:   int
+
+    """
+
+    with open(os.path.join(dirCache, "Dictionary.json"), 'w') as fidDictionary:
+        json.dump(
+            {"Version": CACHE_VERSION, "NumRows": int(numRows), "NumRecords": int(numRecords),
+             "PatientIDs": patientIDs, "Codes": codes},
+            fidDictionary
+        )
@@ -0,0 +1,171 @@
+"""Class to serve requests to generate datasets from processed journal table data held in memory.
+
+The service loads the processed data once (see generate_datasets.load_resident) and then accepts requests over HTTP on
+localhost, so that many variants of the datasets can be generated without each paying to start a run, validate the
+full configuration and load the processed data. A request is a POST to /datasets whose body is a JSON configuration
+fragment in the same form as a configuration file (e.g. {"DataProcessing": {"MinCodes": 5}}), which overrides the
+configuration the service was started with. The datasets are saved in a new Request_N directory within the service's
+output directory, alongside the fragment as Config.json, and the response records the directory and the seconds taken.
+Requests are handled concurrently on separate threads, which only read the shared processed data.
+"""
+
+# Python imports.
+import copy
+import http.server
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+# User imports.
+from . import generate_datasets
+
+# 3rd party imports.
+import jsonschema
+
+# Globals.
+HOST = "127.0.0.1"  # The address the service listens on, so that only local connections are accepted.
+LOGGER = logging.getLogger(__name__)
+
+
+class DatasetService:
+    """Generate datasets for configuration fragments from processed journal table data held in memory."""
+
+    def __init__(self, dirProcessedData, dirOutput, config, fileConfigSchema, encoding=None):
+        """Initialise the service, loading the processed data into memory.
+
+        :param dirProcessedData:    The location of the directory containing the processed journal table files.
+        :type dirProcessedData:     str
+        :param dirOutput:           The location of the directory to save the datasets of each request within.
+        :type dirOutput:            str
+        :param config:              The configuration that the fragment of each request overrides.
+        :type config:               JsonschemaManipulation.Configuration
+        :param fileConfigSchema:    The location of the schema the configuration fragments are validated against.
+        :type fileConfigSchema:     str
+        :param encoding:            The encoding to convert strings in the configuration fragments to, if any.
+        :type encoding:             str | None
+
+        """
+
+        self._dirProcessedData = dirProcessedData
+        self._dirOutput = dirOutput
+        self._config = config
+        self._fileConfigSchema = fileConfigSchema
+        self._encoding = encoding
+        self._numRequests = 0
+        self._lock = threading.Lock()  # The lock guarding the number of requests.
+        startTime = time.perf_counter()
+        self._resident = generate_datasets.load_resident(dirProcessedData)
+        LOGGER.info("Loaded the processed data into memory in {:.3f}s.".format(time.perf_counter() - startTime))
+
+    def generate(self, configFragment):
+        """Generate the datasets for a configuration fragment.
+
+        :param configFragment:  The parameters overriding those of the service's configuration, in the same form as a
+                                    configuration file.
+        :type configFragment:   dict
+        :return:                The number of the request, the location of the directory the datasets were saved in
+                                    and the seconds taken, recorded as:
+                                    {"Output": str, "Request": int, "Seconds": float}
+        :rtype:                 dict
+
+        """
+
+        startTime = time.perf_counter()
+        with self._lock:
+            self._numRequests += 1
+            requestNumber = self._numRequests
+        dirRequest = os.path.join(self._dirOutput, "Request_{:d}".format(requestNumber))
+        os.makedirs(dirRequest)
+        try:
+            # Validate the fragment by setting it from the file it is recorded in.
+            fileConfig = os.path.join(dirRequest, "Config.json")
+            with open(fileConfig, 'w') as fidConfig:
+                json.dump(configFragment, fidConfig, indent=2)
+            config = copy.deepcopy(self._config)
+            if self._encoding:
+                config.set_from_json(fileConfig, self._fileConfigSchema, self._encoding)
+            else:
+                config.set_from_json(fileConfig, self._fileConfigSchema)
+            for i in ["CodesToIgnore", "CodesToKeep", "PatientsToIgnore", "PatientsToKeep"]:
+                patterns = config.get_param(["DataProcessing", i])[1]
+                if isinstance(patterns, str) and not os.path.isfile(patterns):
+                    raise ValueError("The file of IDs given for {:s} ({:s}) is not a file.".format(i, patterns))
+        except (jsonschema.ValidationError, ValueError):
+            shutil.rmtree(dirRequest)
+            raise
+
+        generate_datasets.main(self._dirProcessedData, dirRequest, config, resident=self._resident)
+        seconds = time.perf_counter() - startTime
+        LOGGER.info("Request {:d} saved its datasets in {:s} in {:.3f}s.".format(requestNumber, dirRequest, seconds))
+        return {"Output": dirRequest, "Request": requestNumber, "Seconds": seconds}
+
+    def serve(self, port):
+        """Serve requests on localhost until interrupted.
+
+        :param port:    The port to listen on.
+        :type port:     int
+
+        """
+
+        server = http.server.ThreadingHTTPServer((HOST, port), _RequestHandler)
+        server.service = self
+        LOGGER.info("Serving dataset generation requests at http://{:s}:{:d}/datasets.".format(HOST, port))
+        print("\nServing dataset generation requests at http://{:s}:{:d}/datasets. Press Ctrl+C to stop.\n".format(
+            HOST, port
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            LOGGER.info("Stopped serving dataset generation requests.")
+        finally:
+            server.server_close()
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle a request to a DatasetService, which is recorded as the service attribute of the server."""
+
+    def do_POST(self):
+        """Generate the datasets for the configuration fragment in the body of the request."""
+
+        if self.path.rstrip('/') != "/datasets":
+            self._respond(404, {"Error": "Requests must be sent to /datasets."})
+            return
+        try:
+            configFragment = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(configFragment, dict):
+                raise ValueError("The configuration fragment must be a JSON object.")
+            result = self.server.service.generate(configFragment)
+        except jsonschema.ValidationError as e:
+            self._respond(400, {"Error": "The configuration is not valid against the schema.\n{:s}".format(str(e))})
+        except ValueError as e:
+            self._respond(400, {"Error": str(e)})
+        except Exception as e:
+            LOGGER.exception("Failed to generate the datasets of a request.")
+            self._respond(500, {"Error": str(e)})
+        else:
+            self._respond(200, result)
+
+    def log_message(self, format, *args):
+        """Record each request in the log rather than writing it to stderr."""
+
+        LOGGER.info("{:s} {:s}".format(self.address_string(), format % args))
+
+    def _respond(self, status, content):
+        """Send a response with a JSON body.
+
+        :param status:  The HTTP status code of the response.
+        :type status:   int
+        :param content: The content of the body.
+        :type content:  dict
+
+        """
+
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,431 @@
+"""Classes to write the rows of a dataset in the supported output formats.
+
+Each writer accepts the rows of one patient at a time through write_rows, with each row recorded as a tuple of the
+patient's age in the time step and a dictionary mapping each code to its value in the time step. The TSV writer also
+accepts the raw values of a patient's time steps as arrays through write_value_rows. Datasets written in
+shards (e.g. by separate processes) can be combined with the merge method of the writer that wrote them. Text datasets
+are compressed with the codecs of compressed_files, while NPZ datasets use the compression of the NPZ format.
+"""
+
+# Python imports.
+import abc
+import array
+import os
+import shutil
+
+# User imports.
+from Utilities import compressed_files
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+FLUSH_SIZE = 1 << 20  # The number of non-zero entries sparse writers buffer before writing them to disk.
+
+
+class TSVWriter:
+    """Write a dataset as a TSV file with one code:value entry per non-zero value."""
+
+    extension = ".tsv"
+
+    def __init__(self, fileOutput, vocabulary, compression=None):
+        """Initialise the writer and write the header of the file.
+
+        The header contains the ID, age and gender followed by the codes in column index order.
+
+        :param fileOutput:  The location of the file to write.
+        :type fileOutput:   str
+        :param vocabulary:  The column index of each code.
+        :type vocabulary:   dict
+        :param compression: The codec to compress the file with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        self._columnNames = sorted(vocabulary, key=vocabulary.get)
+        self._columnPrefixes = np.array(["{:s}:".format(i) for i in self._columnNames], dtype=str)
+        self._fid = compressed_files.open_file(compressed_files.add_extension(fileOutput, compression), 'w')
+        self._fid.write("{:s}\n".format("\t".join(["_ID", "_Age", "_Gender"] + self._columnNames)))
+
+    def close(self):
+        """Close the file."""
+
+        self._fid.close()
+
+    @staticmethod
+    def merge(fileShards, fileOutput, compression=None):
+        """Merge datasets written by separate writers into one dataset.
+
+        :param fileShards:  The locations of the datasets to merge, in the order their rows should appear.
+        :type fileShards:   list[str]
+        :param fileOutput:  The location to save the merged dataset to (without the extension of any compression).
+        :type fileOutput:   str
+        :param compression: The codec to compress the merged dataset with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        with compressed_files.open_file(compressed_files.add_extension(fileOutput, compression), 'w') as fidOutput:
+            for ind, i in enumerate(fileShards):
+                with open(i, 'r') as fidShard:
+                    header = fidShard.readline()
+                    if ind == 0:
+                        fidOutput.write(header)
+                    shutil.copyfileobj(fidShard, fidOutput)
+
+    def write_rows(self, patientID, patientGender, rows):
+        """Write the rows of a patient.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient ('M' or 'F').
+        :type patientGender:    str
+        :param rows:            The age and values of the codes in each of the patient's time steps.
+        :type rows:             list[tuple]
+
+        """
+
+        patientInfo = "{:s}:{:s}\t{:s}:{}\t{:s}:{:s}\t{:s}\n"
+        self._fid.write(''.join([
+            patientInfo.format(
+                "_ID", patientID, "_Age", age, "_Gender", patientGender,
+                '\t'.join(["{:s}:{:d}".format(i, values[i]) for i in values])
+            )
+            for age, values in rows
+        ]))
+
+    def write_value_rows(self, patientID, patientGender, ages, rowOffsets, columns, values):
+        """Write the raw value rows of a patient with a single write.
+
+        The values of a row are written in the order given, with a column repeated when it has several values in the
+        row.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient ('M' or 'F').
+        :type patientGender:    str
+        :param ages:            The age in each row.
+        :type ages:             list
+        :param rowOffsets:      The offset of the first value of each row in columns and values, followed by their
+                                    length.
+        :type rowOffsets:       np.array
+        :param columns:         The column of each value.
+        :type columns:          np.array
+        :param values:          The values (float32).
+        :type values:           np.array
+
+        """
+
+        # Format the values with the shortest representation that reads back as the same float32.
+        entries = np.char.add(self._columnPrefixes[columns], values.astype(str)).tolist()
+        rowOffsets = rowOffsets.tolist()
+        patientInfo = "_ID:{:s}\t_Age:{}\t_Gender:{:s}\t{:s}\n"
+        self._fid.write(''.join([
+            patientInfo.format(patientID, age, patientGender, '\t'.join(entries[rowOffsets[i]:rowOffsets[i + 1]]))
+            for i, age in enumerate(ages)
+        ]))
+
+
+class _SparseWriter(abc.ABC):
+    """Base class for writers that record the codes as column indices, with the ID, age and gender in a side file.
+
+    The side file is an NPZ file containing the ID, Age and Gender arrays, with one entry per row of the dataset.
+    Subclasses must implement merge and _write_row.
+
+    """
+
+    extension = None
+
+    def __init__(self, fileOutput, vocabulary, compression=None):
+        """Initialise the writer.
+
+        :param fileOutput:  The location of the file to write.
+        :type fileOutput:   str
+        :param vocabulary:  The column index of each code.
+        :type vocabulary:   dict
+        :param compression: The codec to compress the file with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        self._fileOutput = fileOutput
+        self._compression = compression
+        self._vocabulary = vocabulary
+        self._IDs = []
+        self._ages = array.array('i')
+        self._genders = []
+
+    def close(self):
+        """Write the side file of the ID, age and gender of each row."""
+
+        fileRowInfo = "{:s}_RowInfo.npz".format(os.path.splitext(self._fileOutput)[0])
+        _save_npz(
+            fileRowInfo, self._compression, ID=np.array(self._IDs, dtype=str),
+            Age=np.frombuffer(self._ages, dtype=np.int32 if self._ages.typecode == 'i' else np.float64),
+            Gender=np.array(self._genders, dtype=str)
+        )
+
+    @staticmethod
+    @abc.abstractmethod
+    def merge(fileShards, fileOutput, compression=None):
+        """Merge datasets written by separate writers into one dataset.
+
+        :param fileShards:  The locations of the datasets to merge, in the order their rows should appear.
+        :type fileShards:   list[str]
+        :param fileOutput:  The location to save the merged dataset to (without the extension of any compression).
+        :type fileOutput:   str
+        :param compression: The codec to compress the merged dataset with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+    @staticmethod
+    def _merge_row_info(fileShards, fileOutput, compression=None):
+        """Merge the side files of datasets written by separate writers.
+
+        :param fileShards:  The locations of the datasets whose side files should be merged, in order.
+        :type fileShards:   list[str]
+        :param fileOutput:  The location of the merged dataset.
+        :type fileOutput:   str
+        :param compression: The codec the merged dataset is compressed with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        rowInfo = {"ID": [], "Age": [], "Gender": []}
+        for i in fileShards:
+            with np.load("{:s}_RowInfo.npz".format(os.path.splitext(i)[0])) as shardRowInfo:
+                for j in rowInfo:
+                    rowInfo[j].append(shardRowInfo[j])
+        _save_npz(
+            "{:s}_RowInfo.npz".format(os.path.splitext(fileOutput)[0]), compression,
+            **{i: np.concatenate(rowInfo[i]) for i in rowInfo}
+        )
+
+    def write_rows(self, patientID, patientGender, rows):
+        """Write the rows of a patient.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient ('M' or 'F').
+        :type patientGender:    str
+        :param rows:            The age and values of the codes in each of the patient's time steps.
+        :type rows:             list[tuple]
+
+        """
+
+        vocabulary = self._vocabulary
+        if rows and isinstance(rows[0][0], float) and self._ages.typecode == 'i':
+            # Fractional ages are being written, so switch to recording the ages as floats.
+            self._ages = array.array('d', self._ages)
+        for age, values in rows:
+            self._write_row(sorted([(vocabulary[i], values[i]) for i in values]))
+        self._IDs.extend([patientID] * len(rows))
+        self._ages.extend([age for age, _ in rows])
+        self._genders.extend([patientGender] * len(rows))
+
+    @abc.abstractmethod
+    def _write_row(self, entries):
+        """Write the non-zero entries of a row.
+
+        :param entries: The column index and value of each non-zero entry, sorted by column index.
+        :type entries:  list[tuple]
+
+        """
+
+
+class NPZWriter(_SparseWriter):
+    """Write a dataset as a CSR matrix in the NPZ format used by scipy.sparse.save_npz and load_npz.
+
+    The indices and data of the matrix are buffered on disk while the dataset is written, so memory use does not grow
+    with the number of non-zero entries.
+
+    """
+
+    extension = ".npz"
+
+    def __init__(self, fileOutput, vocabulary, compression=None):
+        """Initialise the writer.
+
+        :param fileOutput:  The location of the file to write.
+        :type fileOutput:   str
+        :param vocabulary:  The column index of each code.
+        :type vocabulary:   dict
+        :param compression: The codec to compress the file with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        super().__init__(fileOutput, vocabulary, compression)
+        self._fileIndices = "{:s}.indices.tmp".format(fileOutput)
+        self._fileData = "{:s}.data.tmp".format(fileOutput)
+        self._fidIndices = open(self._fileIndices, 'wb')
+        self._fidData = open(self._fileData, 'wb')
+        self._indices = array.array('i')
+        self._data = array.array('i')
+        self._indptr = array.array('q', [0])
+
+    def close(self):
+        """Write the CSR matrix and its side file, and remove the buffer files."""
+
+        self._flush()
+        self._fidIndices.close()
+        self._fidData.close()
+        numNonZero = self._indptr[-1]
+        indices = np.fromfile(self._fileIndices, dtype=np.int32, count=numNonZero)
+        data = np.fromfile(self._fileData, dtype=np.int32, count=numNonZero)
+        _save_npz(
+            self._fileOutput, self._compression, format=np.array("csr"),
+            shape=np.array([len(self._indptr) - 1, len(self._vocabulary)]), data=data, indices=indices,
+            indptr=np.frombuffer(self._indptr, dtype=np.int64)
+        )
+        os.remove(self._fileIndices)
+        os.remove(self._fileData)
+        super().close()
+
+    @staticmethod
+    def merge(fileShards, fileOutput, compression=None):
+        """Merge datasets written by separate writers into one dataset by stacking their matrices.
+
+        :param fileShards:  The locations of the datasets to merge, in the order their rows should appear.
+        :type fileShards:   list[str]
+        :param fileOutput:  The location to save the merged dataset to (without the extension of any compression).
+        :type fileOutput:   str
+        :param compression: The codec to compress the merged dataset with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        data = []
+        indices = []
+        indptr = [np.zeros(1, dtype=np.int64)]
+        numRows = 0
+        numColumns = 0
+        for i in fileShards:
+            with np.load(i) as matrix:
+                data.append(matrix["data"])
+                indices.append(matrix["indices"])
+                indptr.append(matrix["indptr"][1:] + indptr[-1][-1])
+                numRows += int(matrix["shape"][0])
+                numColumns = int(matrix["shape"][1])
+        _save_npz(
+            fileOutput, compression, format=np.array("csr"), shape=np.array([numRows, numColumns]),
+            data=np.concatenate(data), indices=np.concatenate(indices), indptr=np.concatenate(indptr)
+        )
+        _SparseWriter._merge_row_info(fileShards, fileOutput, compression)
+
+    def _flush(self):
+        """Write the buffered indices and data to the buffer files."""
+
+        self._indices.tofile(self._fidIndices)
+        self._data.tofile(self._fidData)
+        self._indices = array.array('i')
+        self._data = array.array('i')
+
+    def _write_row(self, entries):
+        """Write the non-zero entries of a row.
+
+        :param entries: The column index and value of each non-zero entry, sorted by column index.
+        :type entries:  list[tuple]
+
+        """
+
+        self._indices.extend([i[0] for i in entries])
+        self._data.extend([i[1] for i in entries])
+        self._indptr.append(self._indptr[-1] + len(entries))
+        if len(self._indices) >= FLUSH_SIZE:
+            self._flush()
+
+
+class SVMLightWriter(_SparseWriter):
+    """Write a dataset in the SVMlight format, with zero-based column indices and a label of 0 for every row.
+
+    The ID of the patient is recorded as a comment at the end of each row.
+
+    """
+
+    extension = ".svm"
+
+    def __init__(self, fileOutput, vocabulary, compression=None):
+        """Initialise the writer.
+
+        :param fileOutput:  The location of the file to write.
+        :type fileOutput:   str
+        :param vocabulary:  The column index of each code.
+        :type vocabulary:   dict
+        :param compression: The codec to compress the file with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        super().__init__(fileOutput, vocabulary, compression)
+        self._fid = compressed_files.open_file(compressed_files.add_extension(fileOutput, compression), 'w')
+        self._patientID = None  # The ID of the patient whose rows are being written.
+
+    def close(self):
+        """Close the file and write its side file."""
+
+        self._fid.close()
+        super().close()
+
+    @staticmethod
+    def merge(fileShards, fileOutput, compression=None):
+        """Merge datasets written by separate writers into one dataset.
+
+        :param fileShards:  The locations of the datasets to merge, in the order their rows should appear.
+        :type fileShards:   list[str]
+        :param fileOutput:  The location to save the merged dataset to (without the extension of any compression).
+        :type fileOutput:   str
+        :param compression: The codec to compress the merged dataset with, or None for no compression.
+        :type compression:  str | None
+
+        """
+
+        with compressed_files.open_file(compressed_files.add_extension(fileOutput, compression), 'w') as fidOutput:
+            for i in fileShards:
+                with open(i, 'r') as fidShard:
+                    shutil.copyfileobj(fidShard, fidOutput)
+        _SparseWriter._merge_row_info(fileShards, fileOutput, compression)
+
+    def write_rows(self, patientID, patientGender, rows):
+        """Write the rows of a patient.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient ('M' or 'F').
+        :type patientGender:    str
+        :param rows:            The age and values of the codes in each of the patient's time steps.
+        :type rows:             list[tuple]
+
+        """
+
+        self._patientID = patientID
+        super().write_rows(patientID, patientGender, rows)
+
+    def _write_row(self, entries):
+        """Write the non-zero entries of a row.
+
+        :param entries: The column index and value of each non-zero entry, sorted by column index.
+        :type entries:  list[tuple]
+
+        """
+
+        self._fid.write("0 {:s} # {:s}\n".format(' '.join(["{:d}:{:d}".format(*i) for i in entries]), self._patientID))
+
+
+def _save_npz(fileOutput, compression, **arrays):
+    """Save arrays to an NPZ file, using the compression of the NPZ format when any compression is requested.
+
+    :param fileOutput:  The location of the NPZ file to write.
+    :type fileOutput:   str
+    :param compression: The codec requested for the dataset, or None for no compression.
+    :type compression:  str | None
+    :param arrays:      The arrays to save, indexed by their name in the file.
+    :type arrays:       dict
+
+    """
+
+    if compression is None:
+        np.savez(fileOutput, **arrays)
+    else:
+        np.savez_compressed(fileOutput, **arrays)
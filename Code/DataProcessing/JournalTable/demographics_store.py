@@ -0,0 +1,187 @@
+"""Class and functions to hold the demographics of a set of patients in compact arrays.
+
+Rather than a dictionary per patient, the patients are given dense indices in the sorted order of their IDs. The IDs
+are held in a sorted array of byte strings that is binary searched to find a patient's index, with the year of birth of
+each patient held as an int16 and their gender as a uint8 (0 for female and 1 for male, as in the patient table).
+"""
+
+# Python imports.
+import array
+
+# User imports.
+from Utilities import compressed_files
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+GENDERS = ('F', 'M')  # The gender recorded by each gender code.
+
+
+class DemographicsStore:
+    """The year of birth and gender of a set of patients, indexed by the sorted order of the patients' IDs."""
+
+    def __init__(self, patientIDs, yearsOfBirth, genders):
+        """Initialise the store.
+
+        When a patient ID occurs more than once, the demographics given last for it are used.
+
+        :param patientIDs:      The ID of each patient.
+        :type patientIDs:       list[str]
+        :param yearsOfBirth:    The year of birth of each patient.
+        :type yearsOfBirth:     array.array | list[int]
+        :param genders:         The gender code of each patient (an index into GENDERS).
+        :type genders:          array.array | list[int]
+
+        """
+
+        patientIDs = np.array([i.encode() for i in patientIDs], dtype=bytes)
+        order = np.argsort(patientIDs, kind="stable")
+        patientIDs = patientIDs[order]
+        isLast = np.ones(patientIDs.size, dtype=bool)  # Whether each entry is the last given for its patient.
+        isLast[:-1] = patientIDs[1:] != patientIDs[:-1]
+        order = order[isLast]
+
+        self.patientIDs = patientIDs[isLast]
+        self.yearsOfBirth = np.asarray(yearsOfBirth, dtype=np.int16)[order]
+        self.genders = np.asarray(genders, dtype=np.uint8)[order]
+
+    def __contains__(self, patientID):
+        return self.find(patientID) >= 0
+
+    def __len__(self):
+        return self.patientIDs.size
+
+    def contains(self, patientIDs):
+        """Determine whether each of a collection of patients is in the store.
+
+        :param patientIDs:  The IDs of the patients.
+        :type patientIDs:   list[str]
+        :return:            Whether each patient is in the store.
+        :rtype:             np.array
+
+        """
+
+        patientIDs = np.array([i.encode() for i in patientIDs], dtype=bytes)
+        if not self.patientIDs.size or not patientIDs.size:
+            return np.zeros(patientIDs.size, dtype=bool)
+        positions = np.minimum(np.searchsorted(self.patientIDs, patientIDs), self.patientIDs.size - 1)
+        return self.patientIDs[positions] == patientIDs
+
+    def find(self, patientID):
+        """Determine the index of a patient.
+
+        :param patientID:   The ID of the patient.
+        :type patientID:    str
+        :return:            The index of the patient, or -1 if the patient is not in the store.
+        :rtype:             int
+
+        """
+
+        patientID = patientID.encode()
+        position = int(np.searchsorted(self.patientIDs, patientID))
+        if position < self.patientIDs.size and self.patientIDs[position] == patientID:
+            return position
+        return -1
+
+    def gender(self, index):
+        """Determine the gender of a patient.
+
+        :param index:   The index of the patient, as returned by find.
+        :type index:    int
+        :return:        The gender of the patient ('M' or 'F').
+        :rtype:         str
+
+        """
+
+        return GENDERS[self.genders[index]]
+
+    def year_of_birth(self, index):
+        """Determine the year of birth of a patient.
+
+        :param index:   The index of the patient, as returned by find.
+        :type index:    int
+        :return:        The year of birth of the patient.
+        :rtype:         int
+
+        """
+
+        return int(self.yearsOfBirth[index])
+
+
+class DemographicsBuilder:
+    """Collect the demographics of patients one at a time before storing them in a DemographicsStore."""
+
+    def __init__(self):
+        self._patientIDs = []
+        self._yearsOfBirth = array.array('h')
+        self._genders = array.array('B')
+
+    def add(self, patientID, yearOfBirth, gender):
+        """Add the demographics of a patient.
+
+        :param patientID:   The ID of the patient.
+        :type patientID:    str
+        :param yearOfBirth: The year of birth of the patient.
+        :type yearOfBirth:  int
+        :param gender:      The gender of the patient ('M' or 'F').
+        :type gender:       str
+
+        """
+
+        self._patientIDs.append(patientID)
+        self._yearsOfBirth.append(yearOfBirth)
+        self._genders.append(gender == 'M')
+
+    def build(self):
+        """Create the store of the demographics added.
+
+        :return:    The store of the demographics.
+        :rtype:     DemographicsStore
+
+        """
+
+        return DemographicsStore(self._patientIDs, self._yearsOfBirth, self._genders)
+
+
+def load_patient_table(filePatientTable):
+    """Extract the demographics of the patients in the patient table.
+
+    Every patient is loaded, as the processed data is shared by all filtering configurations. PatientsToKeep and
+    PatientsToIgnore are applied while the processed demographics are scanned when generating the datasets.
+
+    :param filePatientTable:    The location of the patient table SQL file, which may be compressed.
+    :type filePatientTable:     str
+    :return:                    The demographics of the patients in the table.
+    :rtype:                     DemographicsStore
+
+    """
+
+    builder = DemographicsBuilder()
+    with compressed_files.open_file(filePatientTable, 'r') as fidPatientTable:
+        for line in fidPatientTable:
+            if line.startswith("insert"):
+                # Found a line containing patient details.
+                line = line[84:]  # Strip of the SQL insert syntax at the beginning.
+                line = line[:-3]  # Strip off the ");\n" at the end.
+                chunks = line.split(',')
+                patientGender = 'M' if chunks[3] == '1' else 'F'  # A '1' indicates a male and a '0' a female.
+                builder.add(chunks[0], int(chunks[1]), patientGender)
+    return builder.build()
+
+
+def merge(stores):
+    """Combine the demographics held in several stores into a single store.
+
+    :param stores:  The stores to combine. When a patient is in more than one store, the demographics in the last store
+                        containing them are used.
+    :type stores:   list[DemographicsStore]
+    :return:        The store of the demographics of every patient in any of the stores.
+    :rtype:         DemographicsStore
+
+    """
+
+    return DemographicsStore(
+        [i.decode() for j in stores for i in j.patientIDs.tolist()], np.concatenate([i.yearsOfBirth for i in stores]),
+        np.concatenate([i.genders for i in stores])
+    )
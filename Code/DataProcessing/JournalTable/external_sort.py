@@ -0,0 +1,138 @@
+"""Function to sort the entries of a journal table by patient and date using a bounded amount of memory.
+
+Entries are collected until their estimated size reaches the memory limit, at which point they are sorted and written
+to a temporary run file. The runs are then merged together, with at most MERGE_FAN_IN runs merged at once, so that
+runs are merged over multiple passes when there are many of them. The sort is stable, so entries with the same patient
+and date remain in the order they occur in the journal table.
+"""
+
+# Python imports.
+import heapq
+import logging
+import operator
+import os
+import shutil
+
+# User imports.
+from Utilities import instrumentation
+
+# Globals.
+ENTRY_OVERHEAD = 512  # The estimated memory used by a parsed entry in addition to the characters in its fields.
+LOGGER = logging.getLogger(__name__)
+MERGE_FAN_IN = 64  # The maximum number of runs to merge at once.
+OUTPUT_BLOCK_SIZE = 1 << 14  # The number of sorted entries yielded at once.
+SORT_KEY = operator.itemgetter(0, 2)  # The key that entries are sorted by, the patient ID followed by the date.
+
+
+def main(entryBlocks, memoryLimit, dirTemporary):
+    """Sort the entries of a journal table by patient ID and date.
+
+    :param entryBlocks:     The blocks of parsed journal table entries to sort, with each entry a list of fields as
+                                returned by parse_patient_entry.main.
+    :type entryBlocks:      iterable
+    :param memoryLimit:     The approximate number of bytes of memory to use for holding entries.
+    :type memoryLimit:      int
+    :param dirTemporary:    The location of the directory to save the runs in. This is removed once sorting finishes.
+    :type dirTemporary:     str
+    :return:                A generator of blocks of the sorted entries.
+    :rtype:                 generator
+
+    """
+
+    os.makedirs(dirTemporary, exist_ok=True)
+    try:
+        # Split the entries into sorted runs.
+        runs = []
+        entries = []
+        entriesSize = 0
+        for block in entryBlocks:
+            for i in block:
+                entries.append(i)
+                entriesSize += ENTRY_OVERHEAD + sum(map(len, i))
+                if entriesSize >= memoryLimit:
+                    with instrumentation.timer("Sorting"):
+                        entries.sort(key=SORT_KEY)
+                        runs.append(_write_run(dirTemporary, len(runs), entries))
+                    entries = []
+                    entriesSize = 0
+        with instrumentation.timer("Sorting"):
+            entries.sort(key=SORT_KEY)
+
+        if not runs:
+            # All entries fit within the memory limit, so no merging is needed.
+            LOGGER.info("Sorted the journal table entries in memory.")
+            sortedEntries = iter(entries)
+        else:
+            if entries:
+                with instrumentation.timer("Sorting"):
+                    runs.append(_write_run(dirTemporary, len(runs), entries))
+            entries = None
+
+            # Merge the runs in groups until few enough remain to merge in a single pass.
+            numRuns = len(runs)
+            numPasses = 1
+            runNumber = numRuns  # The number of the next run file to write.
+            while len(runs) > MERGE_FAN_IN:
+                numPasses += 1
+                mergedRuns = []
+                for i in range(0, len(runs), MERGE_FAN_IN):
+                    group = runs[i:i + MERGE_FAN_IN]
+                    with instrumentation.timer("Sorting"):
+                        mergedRuns.append(_write_run(
+                            dirTemporary, runNumber, heapq.merge(*[_read_run(j) for j in group], key=SORT_KEY)
+                        ))
+                    runNumber += 1
+                    for j in group:
+                        os.remove(j)
+                runs = mergedRuns
+            LOGGER.info("Sorted the journal table entries using {:d} runs and {:d} merge passes.".format(
+                numRuns, numPasses
+            ))
+            sortedEntries = heapq.merge(*[_read_run(i) for i in runs], key=SORT_KEY)
+
+        # Yield the sorted entries in blocks.
+        block = []
+        for i in sortedEntries:
+            block.append(i)
+            if len(block) == OUTPUT_BLOCK_SIZE:
+                yield block
+                block = []
+        if block:
+            yield block
+    finally:
+        shutil.rmtree(dirTemporary, ignore_errors=True)
+
+
+def _read_run(fileRun):
+    """Read the entries of a run.
+
+    :param fileRun: The location of the run file.
+    :type fileRun:  str
+    :return:        A generator of the entries in the run.
+    :rtype:         generator
+
+    """
+
+    with open(fileRun, 'r') as fidRun:
+        for line in fidRun:
+            yield line[:-1].split('\t')
+
+
+def _write_run(dirTemporary, runNumber, entries):
+    """Write a sorted run of entries to a file, with one tab separated entry per line.
+
+    :param dirTemporary:    The location of the directory to save the run in.
+    :type dirTemporary:     str
+    :param runNumber:       The number of the run, used to name the file.
+    :type runNumber:        int
+    :param entries:         The sorted entries in the run.
+    :type entries:          iterable
+    :return:                The location of the run file.
+    :rtype:                 str
+
+    """
+
+    fileRun = os.path.join(dirTemporary, "Run_{:d}.tsv".format(runNumber))
+    with open(fileRun, 'w') as fidRun:
+        fidRun.writelines("{:s}\n".format('\t'.join(i)) for i in entries)
+    return fileRun
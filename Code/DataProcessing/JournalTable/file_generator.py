@@ -3,6 +3,23 @@
 # Python imports.
 import os
 
+# User imports.
+from . import dataset_writers
+
+# Globals.
+OUTPUT_WRITERS = {  # The writer used for each output format.
+    "NPZ": dataset_writers.NPZWriter,
+    "SVMLight": dataset_writers.SVMLightWriter,
+    "TSV": dataset_writers.TSVWriter
+}
+REPRESENTATIONS = [  # The type of data and time step of each dataset, along with whether it is only written as a TSV.
+    ("BinaryIndicator", "History", False), ("BinaryIndicator", "Visits", False),
+    ("BinaryIndicator", "Visits_C", False), ("BinaryIndicator", "Years", False), ("BinaryIndicator", "Years_C", False),
+    ("CodeCount", "History", False), ("CodeCount", "Visits", False), ("CodeCount", "Visits_C", False),
+    ("CodeCount", "Years", False), ("CodeCount", "Years_C", False),
+    ("RawData", "History", True), ("RawData", "Visits", True), ("RawData", "Years", True)
+]
+
 
 def close_files(fileDict):
     """Close a collection of opened files.
@@ -17,43 +34,232 @@ def close_files(fileDict):
             fileDict[i][j].close()
 
 
-def open_files(dirOutput, variablesUsed):
+def open_files(dirOutput, validCodes, outputFormat="TSV", outputs=None, compression=None, valueColumns=None):
     """Generate the names of the cleaned dataset files to be generated.
 
-    The intended contents of the files can be found in the README.
+    The intended contents of the files can be found in the README. The non-cumulative visit and year datasets are
+    recorded under Visits and Years, and the cumulative ones under Visits_C and Years_C. Each code is given a fixed
+    column index, determined by sorting the codes, which is saved in a file called Vocabulary.tsv. The TSV header lists
+    the codes in this order after the ID, age and gender, while the NPZ and SVMLight formats use the index as the code's
+    column. The raw data files are only created for the TSV format. When compression is requested, TSV and SVMLight
+    files are named with the extension of the codec (e.g. CodeCount_History.tsv.gz), while NPZ files use the
+    compression of the NPZ format. The columns of the raw data files are the values recorded for the codes (see
+    value_columns), named by the code and value (e.g. 42W4_Val1).
 
     :param dirOutput:       Location of the directory containing the dataset files.
     :type dirOutput:        str
-    :param variablesUsed:   The codes used as variables in the dataset (plus the ID, age and gender).
-    :type variablesUsed:    set
-    :return:                The cleaned dataset files open for writing.
+    :param validCodes:      The codes used as variables in the dataset.
+    :type validCodes:       set
+    :param outputFormat:    The format to write the datasets in (one of the keys of OUTPUT_WRITERS).
+    :type outputFormat:     str
+    :param outputs:         The names of the datasets to create (e.g. CodeCount_Years), or None to create them all.
+    :type outputs:          list[str] | None
+    :param compression:     The codec to compress the dataset files with, or None for no compression.
+    :type compression:      str | None
+    :param valueColumns:    The columns of the values of each code in the raw data files (see value_columns), or None
+                                if no code has values.
+    :type valueColumns:     dict | None
+    :return:                The writers of the cleaned dataset files, indexed by type of data and then time step.
     :rtype:                 dict
 
     """
 
-    # Create the file names.
-    outputFileIDs = {
-        "BinaryIndicator": {
-            "History": open(os.path.join(dirOutput, "BinaryIndicator_History.tsv"), 'w'),
-            "Visits": open(os.path.join(dirOutput, "BinaryIndicator_Visits.tsv"), 'w'),
-            "Years": open(os.path.join(dirOutput, "BinaryIndicator_Years.tsv"), 'w')
-        },
-        "CodeCount": {
-            "History": open(os.path.join(dirOutput, "CodeCount_History.tsv"), 'w'),
-            "Visits": open(os.path.join(dirOutput, "CodeCount_Visits.tsv"), 'w'),
-            "Years": open(os.path.join(dirOutput, "CodeCount_Years.tsv"), 'w')
-        },
-        "RawData": {
-            "History": open(os.path.join(dirOutput, "RawData_History.tsv"), 'w'),
-            "Visits": open(os.path.join(dirOutput, "RawData_Visits.tsv"), 'w'),
-            "Years": open(os.path.join(dirOutput, "RawData_Years.tsv"), 'w')
-        }
+    # Determine the column index of each code and save it.
+    vocabulary = save_vocabulary(dirOutput, validCodes)
+    rawVocabulary = {
+        "{:s}_{:s}".format(i, valueKey): column for i in (valueColumns or {}) for valueKey, column in valueColumns[i]
     }
 
-    # Write the header.
-    header = "{:s}\n".format("\t".join(variablesUsed))
-    for i in outputFileIDs:
-        for j in outputFileIDs[i]:
-            outputFileIDs[i][j].write(header)
+    # Create the files.
+    outputFileIDs = {}
+    for i, j, fileName, writerClass in _dataset_files(outputFormat, outputs):
+        if i not in outputFileIDs:
+            outputFileIDs[i] = {}
+        outputFileIDs[i][j] = writerClass(
+            os.path.join(dirOutput, fileName), rawVocabulary if i == "RawData" else vocabulary, compression
+        )
 
     return outputFileIDs
+
+
+def merge_files(dirShards, dirOutput, outputFormat="TSV", outputs=None, compression=None):
+    """Merge the dataset files written to separate directories into one set of dataset files.
+
+    :param dirShards:       The locations of the directories containing the dataset files to merge, in the order their
+                                rows should appear.
+    :type dirShards:        list[str]
+    :param dirOutput:       Location of the directory to save the merged dataset files to.
+    :type dirOutput:        str
+    :param outputFormat:    The format the datasets were written in (one of the keys of OUTPUT_WRITERS).
+    :type outputFormat:     str
+    :param outputs:         The names of the datasets that were written, or None if they all were.
+    :type outputs:          list[str] | None
+    :param compression:     The codec to compress the merged dataset files with, or None for no compression. The
+                                dataset files being merged must not be compressed.
+    :type compression:      str | None
+
+    """
+
+    for _, _, fileName, writerClass in _dataset_files(outputFormat, outputs):
+        writerClass.merge(
+            [os.path.join(i, fileName) for i in dirShards], os.path.join(dirOutput, fileName), compression
+        )
+
+
+def queue_writes(fileDict, writerStage):
+    """Wrap a collection of opened files so that the rows written to them are written by a pipeline stage.
+
+    The files must be closed with close_files once the writer stage has been closed.
+
+    :param fileDict:    The writers of the dataset files, indexed by type of data and then time step.
+    :type fileDict:     dict
+    :param writerStage: The stage to write the rows on.
+    :type writerStage:  pipeline.WriterStage
+    :return:            Writers with the same indices, that submit the rows to the writer stage.
+    :rtype:             dict
+
+    """
+
+    return {i: {j: _QueuedWriter(fileDict[i][j], writerStage) for j in fileDict[i]} for i in fileDict}
+
+
+def save_vocabulary(dirOutput, validCodes):
+    """Determine the column index of each code, in sorted code order, and save them in a file called Vocabulary.tsv.
+
+    :param dirOutput:   Location of the directory containing the dataset files.
+    :type dirOutput:    str
+    :param validCodes:  The codes used as variables in the dataset.
+    :type validCodes:   set
+    :return:            The column index of each code.
+    :rtype:             dict
+
+    """
+
+    vocabulary = sorted(validCodes)
+    with open(os.path.join(dirOutput, "Vocabulary.tsv"), 'w') as fidVocabulary:
+        fidVocabulary.write("Code\tColumn\n")
+        for ind, i in enumerate(vocabulary):
+            fidVocabulary.write("{:s}\t{:d}\n".format(i, ind))
+    return {j: i for i, j in enumerate(vocabulary)}
+
+
+def select_outputs(outputFormat, outputs=None):
+    """Determine the names of the datasets that will be written in an output format.
+
+    :param outputFormat:    The format to write the datasets in (one of the keys of OUTPUT_WRITERS).
+    :type outputFormat:     str
+    :param outputs:         The names of the datasets requested, or None (or an empty list) to request them all.
+    :type outputs:          list[str] | None
+    :return:                The names of the requested datasets that can be written in the format, in the order they
+                                appear in REPRESENTATIONS.
+    :rtype:                 list[str]
+
+    """
+
+    return [
+        "{:s}_{:s}".format(i, j) for i, j, isTSVOnly in REPRESENTATIONS
+        if (not outputs or "{:s}_{:s}".format(i, j) in outputs) and (outputFormat == "TSV" or not isTSVOnly)
+    ]
+
+
+def value_columns(validCodes, codeAssociatedValues):
+    """Determine the column of each value recorded for the codes in the raw data files.
+
+    Each code is given a column for each of Val1 and Val2 that it has a non-zero value recorded for in the journal
+    table, with the columns ordered by code and then value.
+
+    :param validCodes:              The codes used as variables in the dataset.
+    :type validCodes:               set
+    :param codeAssociatedValues:    Whether each code has Val1 and Val2 values, recorded as
+                                        {code: {"Val1": bool, "Val2": bool}}.
+    :type codeAssociatedValues:     dict
+    :return:                        The value (Val1 or Val2) and column of each column of each code with values.
+    :rtype:                         dict
+
+    """
+
+    valueColumns = {}
+    numColumns = 0
+    for i in sorted(validCodes):
+        columns = []
+        for valueKey in ("Val1", "Val2"):
+            if codeAssociatedValues.get(i, {}).get(valueKey):
+                columns.append((valueKey, numColumns))
+                numColumns += 1
+        if columns:
+            valueColumns[i] = tuple(columns)
+    return valueColumns
+
+
+def _dataset_files(outputFormat, outputs=None):
+    """Determine the dataset files that are written in an output format.
+
+    :param outputFormat:    The format to write the datasets in (one of the keys of OUTPUT_WRITERS).
+    :type outputFormat:     str
+    :param outputs:         The names of the datasets to write, or None to write them all.
+    :type outputs:          list[str] | None
+    :return:                The type of data, time step, file name and writer class of each dataset file.
+    :rtype:                 list[tuple]
+
+    """
+
+    writerClass = OUTPUT_WRITERS[outputFormat]
+    selectedOutputs = set(select_outputs(outputFormat, outputs))
+    return [
+        (i, j, "{:s}_{:s}{:s}".format(i, j, writerClass.extension), writerClass) for i, j, _ in REPRESENTATIONS
+        if "{:s}_{:s}".format(i, j) in selectedOutputs
+    ]
+
+
+class _QueuedWriter:
+    """Submit the rows written to a dataset writer to a pipeline stage rather than writing them immediately."""
+
+    def __init__(self, writer, writerStage):
+        """Initialise the queued writer.
+
+        :param writer:      The writer of the dataset file.
+        :type writer:       object
+        :param writerStage: The stage to write the rows on.
+        :type writerStage:  pipeline.WriterStage
+
+        """
+
+        self._writer = writer
+        self._writerStage = writerStage
+
+    def write_rows(self, patientID, patientGender, rows):
+        """Submit the rows of a patient to be written.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient.
+        :type patientGender:    str
+        :param rows:            The rows of the patient, which must not be changed once submitted.
+        :type rows:             list
+
+        """
+
+        self._writerStage.submit(self._writer.write_rows, patientID, patientGender, rows)
+
+    def write_value_rows(self, patientID, patientGender, ages, rowOffsets, columns, values):
+        """Submit the raw value rows of a patient to be written.
+
+        :param patientID:       The ID of the patient.
+        :type patientID:        str
+        :param patientGender:   The gender of the patient.
+        :type patientGender:    str
+        :param ages:            The age in each row.
+        :type ages:             list
+        :param rowOffsets:      The offset of the first value of each row in columns and values, followed by their
+                                    length.
+        :type rowOffsets:       np.array
+        :param columns:         The column of each value.
+        :type columns:          np.array
+        :param values:          The values, which must not be changed once submitted.
+        :type values:           np.array
+
+        """
+
+        self._writerStage.submit(
+            self._writer.write_value_rows, patientID, patientGender, ages, rowOffsets, columns, values
+        )
@@ -0,0 +1,108 @@
+"""Functions to save and load the results of the patient and code filtering stage of dataset generation.
+
+The results are saved in the _FilterCache_ directory within the processed data directory, with one pickle file per
+set of filtering parameters. Each file is named after a fingerprint of the filtering parameters (including the state of
+any files of IDs they refer to), the version of the cache format and the state of the processed files that the
+filtering reads, so a change to any of them results in the filtering being repeated. The number of files kept is capped,
+with the least recently used files removed first.
+"""
+
+# Python imports.
+import hashlib
+import json
+import os
+import pickle
+
+# Globals.
+FILTER_CACHE_DIRECTORY = "_FilterCache_"  # The name of the cache directory within the processed data directory.
+FILTER_CACHE_VERSION = 2  # The version of the cache format.
+FILTER_FILES = ["Codes.txt", "PatientDemographics.tsv"]  # The processed files that the filtering reads.
+FILTER_PARAMETERS = [  # The DataProcessing parameters that determine the results of the filtering.
+    "CodesToIgnore", "CodesToKeep", "IterativeFiltering", "MinCodes", "MinPatients", "PatientsToIgnore",
+    "PatientsToKeep"
+]
+
+
+def fingerprint(config, dirProcessedData):
+    """Create the fingerprint that the results of filtering a processed journal table are saved under.
+
+    :param config:              The object containing the configuration parameters for the flat file generation.
+    :type config:               JsonschemaManipulation.Configuration
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :return:                    The fingerprint.
+    :rtype:                     str
+
+    """
+
+    filesState = {}
+    for i in FILTER_FILES:
+        fileStats = os.stat(os.path.join(dirProcessedData, i))
+        filesState[i] = [fileStats.st_size, fileStats.st_mtime_ns]
+    parameters = {}
+    for i in FILTER_PARAMETERS:
+        value = config.get_param(["DataProcessing", i])[1]
+        if isinstance(value, str):
+            # The parameter is the location of a file of IDs, so the file's contents may change without it changing.
+            fileStats = os.stat(value)
+            value = {"File": os.path.abspath(value), "State": [fileStats.st_size, fileStats.st_mtime_ns]}
+        parameters[i] = value
+    description = {"Files": filesState, "Version": FILTER_CACHE_VERSION, "Parameters": parameters}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def load(dirProcessedData, key):
+    """Load the saved results of filtering a processed journal table.
+
+    Loading a file marks it as the most recently used.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param key:                 The fingerprint the results were saved under.
+    :type key:                  str
+    :return:                    The results of the filtering, or None if no results are saved under the fingerprint.
+    :rtype:                     dict | None
+
+    """
+
+    fileResults = os.path.join(dirProcessedData, FILTER_CACHE_DIRECTORY, "{:s}.pkl".format(key))
+    try:
+        with open(fileResults, 'rb') as fidResults:
+            results = pickle.load(fidResults)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(fileResults)
+    return results
+
+
+def save(dirProcessedData, key, results, maxEntries):
+    """Save the results of filtering a processed journal table, removing the least recently used results over the cap.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param key:                 The fingerprint to save the results under.
+    :type key:                  str
+    :param results:             The results of the filtering.
+    :type results:              dict
+    :param maxEntries:          The maximum number of results to keep saved. No results are saved when this is 0.
+    :type maxEntries:           int
+
+    """
+
+    if maxEntries < 1:
+        return
+    dirCache = os.path.join(dirProcessedData, FILTER_CACHE_DIRECTORY)
+    os.makedirs(dirCache, exist_ok=True)
+
+    # Write the results to a temporary file first, so that a partially written file is never loaded.
+    fileResults = os.path.join(dirCache, "{:s}.pkl".format(key))
+    fileTemporary = "{:s}.{:d}.tmp".format(fileResults, os.getpid())
+    with open(fileTemporary, 'wb') as fidResults:
+        pickle.dump(results, fidResults, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fileTemporary, fileResults)
+
+    # Remove the least recently used results.
+    savedResults = [os.path.join(dirCache, i) for i in os.listdir(dirCache) if i.endswith(".pkl")]
+    savedResults.sort(key=os.path.getmtime, reverse=True)
+    for i in savedResults[maxEntries:]:
+        os.remove(i)
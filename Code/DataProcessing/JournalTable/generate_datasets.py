@@ -2,40 +2,465 @@
 
 # Python imports.
 from collections import defaultdict
+import datetime
 import logging
+import multiprocessing
 import os
-import re
+import shutil
 import sys
+import threading
 
 # User imports.
+from . import columnar_cache
+from . import demographics_store
 from . import file_generator
+from . import filter_cache
+from . import incidence_matrix
+from . import patient_index
+from . import pattern_matcher
 from . import save_patient_data
+from Utilities import calculate_age
+from Utilities import compressed_files
+from Utilities import instrumentation
+from Utilities import iso_dates
+from Utilities import pipeline
+
+# 3rd party imports.
+import numpy as np
 
 # Globals.
+BLOCKS_PER_PROCESS = 4  # The number of blocks of patients to split the histories into per process.
 LOGGER = logging.getLogger(__name__)
+PIPELINE_BATCH_SIZE = 64  # The number of patients, or of writes of their rows, passed between threads at once.
+_WORKER_DATA = None  # The data needed to generate the datasets made available to the worker processes.
+
+
+def filter_patients(dirProcessedData, config):
+    """Determine the patients and codes used in the datasets generated with a configuration.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param config:              The object containing the configuration parameters for the flat file generation.
+    :type config:               JsonschemaManipulation.Configuration
+    :return:                    The results of the filtering, recorded as:
+                                    {"ValidPatientData": demographics_store.DemographicsStore,
+                                     "PatientsPerCode": {code: int}, "ValidCodes": set,
+                                     "CodeAssociatedValues": {code: {"Val1": bool, "Val2": bool}}}
+    :rtype:                     dict
+
+    """
+
+    _, filePatientData, fileCodes = _find_input_files(dirProcessedData)
+    return _load_filter_results(dirProcessedData, filePatientData, fileCodes, config)
 
 
-def main(dirProcessedData, dirOutput, config):
+def load_resident(dirProcessedData):
+    """Load the processed data that the datasets are generated from into memory, so that it can be used to generate
+    many sets of datasets (see main) without being loaded again for each.
+
+    The lines of the patient demographics file and whether each code has values are held in memory, along with the
+    columnar cache of the journal table when there is one (whose columns are memory mapped, so stay in the page cache
+    once read) and the results of filtering the patients and codes for the most recently used filtering parameters.
+    The data is only read once loaded, so it can be shared by datasets being generated concurrently on separate
+    threads.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :return:                    The processed data held in memory.
+    :rtype:                     dict
+
+    """
+
+    _, filePatientData, fileCodes = _find_input_files(dirProcessedData)
+    with open(filePatientData, 'r') as fidPatientData:
+        _ = fidPatientData.readline()  # Strip the header.
+        patientLines = fidPatientData.readlines()
+    return {
+        "Cache": columnar_cache.load(dirProcessedData), "CodeAssociatedValues": _read_code_values(fileCodes),
+        "FilterLock": threading.Lock(), "FilterResults": {}, "PatientLines": patientLines
+    }
+
+
+def main(dirProcessedData, dirOutput, config, numProcesses=1, progressInterval=None, resident=None):
     """Generate flat file datasets by processing a set of pre-processed journal table files.
 
     Patient history data is assumed to be stored in a file called JournalTable.tsv. Within this
     file a patient's history is assumed to be recorded consecutively (i.e. a patient has all their records recorded
     one after the other with no other patient's records in between).
 
+    When more than one process is requested, the patients are split into contiguous blocks. Each block is saved to its
+    own shard of every dataset file by a worker process, and the shards are then merged in block order, giving the same
+    datasets as generating them in a single process. A compressed processed journal table can not be split, so when
+    there is no columnar cache it is read by a single process. Without a columnar cache, the records of the patients
+    are read by seeking to them using the patient index of the journal table when they make up a small part of it
+    (see patient_index.find_records), in which case they are also read by a single process.
+
+    When the PipelineQueueSize parameter is non-zero and the datasets are generated by a single process, the patient
+    histories are read, and the dataset rows written, on separate threads connected to the main thread by queues of
+    at most that many batches of patients (see pipeline).
+
     :param dirProcessedData:    The location of the directory containing the processed journal table files.
     :type dirProcessedData:     str
     :param dirOutput:           The location of the directory where the flat files should be saved.
     :type dirOutput:            str
     :param config:              The object containing the configuration parameters for the flat file generation.
     :type config:               JsonschemaManipulation.Configuration
+    :param numProcesses:        The number of processes to use when generating the datasets.
+    :type numProcesses:         int
+    :param progressInterval:    The minimum number of seconds between reports of the progress, or None to report it
+                                    every 1000 patients.
+    :type progressInterval:     float | None
+    :param resident:            The processed data held in memory (see load_resident), or None to read it from disk.
+    :type resident:             dict | None
+
+    """
+
+    fileJournalTable, filePatientData, fileCodes = _find_input_files(dirProcessedData)
+    LOGGER.info("Starting journal table dataset generation.")
+
+    # Filter the patients and codes.
+    filterResults = _load_filter_results(dirProcessedData, filePatientData, fileCodes, config, resident)
+    validPatientData = filterResults["ValidPatientData"]
+    validCodes = filterResults["ValidCodes"]
+
+    # Determine minimum number of visits and years needed for saving.
+    minVisits = config.get_param(["DataProcessing", "MinVisits"])[1]
+    minYears = config.get_param(["DataProcessing", "MinYears"])[1]
+    isFractional = config.get_param(["DataProcessing", "FractionalAges"])[1]
+
+    # Determine the columns of the raw data datasets and how several values in one time step are recorded.
+    valueColumns = file_generator.value_columns(validCodes, filterResults["CodeAssociatedValues"])
+    rawValuePolicy = config.get_param(["DataProcessing", "RawValuePolicy"])[1]
+
+    # Extract the information about each patient's history. The columnar cache of the journal table is used when it is
+    # present, as only the columns that are needed are then read and no text needs parsing.
+    cache = columnar_cache.load(dirProcessedData) if resident is None else resident["Cache"]
+    if cache is None:
+        LOGGER.info("Now generating patient histories from the journal table.")
+    else:
+        LOGGER.info("Now generating patient histories from the columnar cache of the journal table.")
+    outputFormat, outputs, compression = _select_outputs(config)
+    progress = instrumentation.ProgressReporter(LOGGER, "Saved {:d} patients", len(validPatientData), progressInterval)
+    instrumentation.count_files("BytesRead", [
+        fileJournalTable if cache is None else os.path.join(dirProcessedData, columnar_cache.CACHE_DIRECTORY)
+    ])
+    historyRecords = None  # The offsets and lengths of the patients' records, when they are read using the index.
+    if cache is None and compressed_files.get_codec(fileJournalTable) is None:
+        historyRecords = patient_index.find_records(dirProcessedData, validPatientData)
+        if historyRecords is not None:
+            LOGGER.info("Reading the {:d} records of the patients using the patient index.".format(
+                len(historyRecords)
+            ))
+    historyBlocks = []
+    if numProcesses > 1 and historyRecords is None:
+        # Split the patients into contiguous blocks.
+        if cache is None:
+            historyBlocks = _split_journal_table(fileJournalTable, numProcesses * BLOCKS_PER_PROCESS)
+        else:
+            historyBlocks = _split_cache(cache, numProcesses * BLOCKS_PER_PROCESS)
+    if len(historyBlocks) < 2:
+        # Create the files to record the generated datasets in.
+        outputFiles = file_generator.open_files(
+            dirOutput, validCodes, outputFormat, outputs, compression, valueColumns
+        )
+        if cache is None:
+            patientHistories = _read_histories_table(
+                fileJournalTable, validPatientData, validCodes, isFractional=isFractional, records=historyRecords
+            )
+        else:
+            patientHistories = _read_histories_cache(cache, validPatientData, validCodes, isFractional=isFractional)
+        patientHistories = instrumentation.timed_iter(patientHistories, "Parsing")
+        queueSize = config.get_param(["DataProcessing", "PipelineQueueSize"])[1]
+        if queueSize:
+            # The histories are read on the prefetching thread, so their parsing is timed there rather than including
+            # the time spent waiting for them.
+            patientHistories = pipeline.Prefetcher(
+                patientHistories, "GenerateDatasetsReader", queueSize, PIPELINE_BATCH_SIZE
+            )
+            with pipeline.WriterStage("GenerateDatasetsWriter", queueSize, PIPELINE_BATCH_SIZE) as writerStage:
+                patientsSaved = _save_histories(
+                    patientHistories, validPatientData, file_generator.queue_writes(outputFiles, writerStage),
+                    minVisits, minYears, progress, valueColumns, rawValuePolicy
+                )
+        else:
+            patientsSaved = _save_histories(
+                patientHistories, validPatientData, outputFiles, minVisits, minYears, progress, valueColumns,
+                rawValuePolicy
+            )
+        file_generator.close_files(outputFiles)
+        _count_outputs(patientsSaved, dirOutput)
+        return
+
+    # Save each block of patients to its own shards of the dataset files.
+    cache = None
+    file_generator.save_vocabulary(dirOutput, validCodes)
+    LOGGER.info("Generating the datasets as {:d} blocks of patients using {:d} processes.".format(
+        len(historyBlocks), numProcesses
+    ))
+    dirShards = os.path.join(dirOutput, "_Shards_")
+    shardArguments = [(i, os.path.join(dirShards, "Shard_{:d}".format(ind))) for ind, i in enumerate(historyBlocks)]
+    with multiprocessing.Pool(processes=numProcesses, initializer=_initialise_worker,
+                              initargs=(dirProcessedData, validPatientData, validCodes, outputFormat, outputs,
+                                        minVisits, minYears, isFractional, valueColumns, rawValuePolicy)) as pool:
+        patientsSaved = 0
+        for i, timers in pool.imap(_generate_shard, shardArguments):
+            # Output an update as each block is finished.
+            patientsSaved += i
+            progress.update(i)
+            instrumentation.add_timers(timers)
+
+    # Merge the shards back together in the order of the blocks. The shards are written uncompressed, so that only the
+    # merged datasets are compressed.
+    with instrumentation.timer("Writing"):
+        file_generator.merge_files([i[1] for i in shardArguments], dirOutput, outputFormat, outputs, compression)
+    shutil.rmtree(dirShards)
+    _count_outputs(patientsSaved, dirOutput)
+
+
+def main_batch(dirProcessedData, studies, progressInterval=None):
+    """Generate the flat file datasets of several configurations from a single pass over the patient histories.
+
+    The patients and codes of each configuration (a study) are filtered separately, and each study's datasets are saved
+    to its own output directory. The histories of the patients used by any study are then read once, keeping the codes
+    used by any study, and each patient's history is saved to the datasets of every study using the patient, keeping
+    only the codes that study uses. This gives the same datasets as calling main once per study, while the processed
+    journal table (or its columnar cache) is read once rather than once per study. As the ages in the histories depend
+    on FractionalAges, studies that differ in it are read in separate passes. The datasets are generated by a single
+    process.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param studies:             The configuration of each study and the location of the directory to save its datasets
+                                    in.
+    :type studies:              list[tuple]
+    :param progressInterval:    The minimum number of seconds between reports of the progress, or None to report it
+                                    every 1000 patients.
+    :type progressInterval:     float | None
+
+    """
+
+    _, filePatientData, fileCodes = _find_input_files(dirProcessedData)
+    LOGGER.info("Starting journal table dataset generation for {:d} studies.".format(len(studies)))
+
+    # Filter the patients and codes of each study, and create the files to record its datasets in.
+    studyData = []
+    for config, dirOutput in studies:
+        LOGGER.info("Preparing the datasets saved in {:s}.".format(dirOutput))
+        os.makedirs(dirOutput, exist_ok=True)
+        filterResults = _load_filter_results(dirProcessedData, filePatientData, fileCodes, config)
+        validCodes = filterResults["ValidCodes"]
+        valueColumns = file_generator.value_columns(validCodes, filterResults["CodeAssociatedValues"])
+        outputFormat, outputs, compression = _select_outputs(config)
+        studyData.append({
+            "DirOutput": dirOutput, "FractionalAges": config.get_param(["DataProcessing", "FractionalAges"])[1],
+            "MinVisits": config.get_param(["DataProcessing", "MinVisits"])[1],
+            "MinYears": config.get_param(["DataProcessing", "MinYears"])[1],
+            "OutputFiles": file_generator.open_files(
+                dirOutput, validCodes, outputFormat, outputs, compression, valueColumns
+            ),
+            "PatientsSaved": 0, "RawValuePolicy": config.get_param(["DataProcessing", "RawValuePolicy"])[1],
+            "ValidCodes": validCodes, "ValidPatientData": filterResults["ValidPatientData"],
+            "ValueColumns": valueColumns
+        })
+
+    # Read the histories of the patients used by the studies once for each setting of FractionalAges.
+    for isFractional in sorted({i["FractionalAges"] for i in studyData}):
+        passStudies = [i for i in studyData if i["FractionalAges"] == isFractional]
+        validPatientData = demographics_store.merge([i["ValidPatientData"] for i in passStudies])
+        validCodes = set().union(*[i["ValidCodes"] for i in passStudies])
+        LOGGER.info("Reading the histories of {:d} patients for {:d} studies.".format(
+            len(validPatientData), len(passStudies)
+        ))
+        patientHistories = read_histories(dirProcessedData, validPatientData, validCodes, isFractional)
+        progress = instrumentation.ProgressReporter(
+            LOGGER, "Read {:d} patients", len(validPatientData), progressInterval
+        )
+        _save_study_histories(patientHistories, validPatientData, validCodes, passStudies, progress)
+
+    for i in studyData:
+        file_generator.close_files(i["OutputFiles"])
+        LOGGER.info("Saved {:d} patients in {:s}.".format(i["PatientsSaved"], i["DirOutput"]))
+        _count_outputs(i["PatientsSaved"], i["DirOutput"])
+
+
+def read_histories(dirProcessedData, validPatientData, validCodes, isFractional=False):
+    """Read the histories of a set of patients from the processed data in a single process, without saving them.
+
+    The histories are read from the columnar cache of the journal table when it is present. Otherwise they are read
+    from the journal table, seeking to the records of the patients using the patient index when they make up a small
+    part of it (see patient_index.find_records).
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param validPatientData:    The demographics of the patients to read the histories of.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param validCodes:          The codes to keep in the histories.
+    :type validCodes:           set
+    :param isFractional:        Whether the ages should be fractional years calculated from the date of each entry,
+                                    rather than the difference between the year of the entry and the year of birth.
+    :type isFractional:         bool
+    :return:                    A generator of the ID and history of each patient with any of the codes, in the order
+                                    they appear in the journal table. The history is formatted as expected by
+                                    save_patient_data.main.
+    :rtype:                     generator
+
+    """
+
+    fileJournalTable = compressed_files.find_file(os.path.join(dirProcessedData, "JournalTable.tsv"))
+    cache = columnar_cache.load(dirProcessedData)
+    instrumentation.count_files("BytesRead", [
+        fileJournalTable if cache is None else os.path.join(dirProcessedData, columnar_cache.CACHE_DIRECTORY)
+    ])
+    if cache is not None:
+        return _read_histories_cache(cache, validPatientData, validCodes, isFractional=isFractional)
+    historyRecords = None
+    if compressed_files.get_codec(fileJournalTable) is None:
+        historyRecords = patient_index.find_records(dirProcessedData, validPatientData)
+    return _read_histories_table(
+        fileJournalTable, validPatientData, validCodes, isFractional=isFractional, records=historyRecords
+    )
+
+
+def _count_outputs(patientsSaved, dirOutput):
+    """Add the number of patients saved and the size of the dataset files to the counters of the instrumentation.
+
+    :param patientsSaved:   The number of patients saved, each of which is a row of the History datasets.
+    :type patientsSaved:    int
+    :param dirOutput:       The location of the directory containing the dataset files.
+    :type dirOutput:        str
+
+    """
+
+    instrumentation.count("Rows", patientsSaved)
+    instrumentation.count_files("BytesWritten", [dirOutput])
+
+
+def _create_matcher(config, parameter, matchIfEmpty):
+    """Create a matcher for the patterns recorded under a parameter of the DataProcessing configuration.
+
+    The parameter is either a list of patterns or the location of a file of IDs to match literally.
+
+    :param config:          The object containing the configuration parameters for the flat file generation.
+    :type config:           JsonschemaManipulation.Configuration
+    :param parameter:       The name of the parameter containing the patterns (e.g. PatientsToKeep).
+    :type parameter:        str
+    :param matchIfEmpty:    Whether every string should match when there are no patterns.
+    :type matchIfEmpty:     bool
+    :return:                The matcher for the patterns.
+    :rtype:                 pattern_matcher.PatternMatcher
+
+    """
+
+    patterns = config.get_param(["DataProcessing", parameter])[1]
+    if isinstance(patterns, str):
+        matcher = pattern_matcher.PatternMatcher.from_id_file(patterns, matchIfEmpty)
+    else:
+        matcher = pattern_matcher.PatternMatcher(patterns, matchIfEmpty)
+    LOGGER.info("{:s} contains {:d} literal, {:d} prefix and {:d} regular expression patterns.".format(
+        parameter, matcher.counts["Literal"], matcher.counts["Prefix"], matcher.counts["Regex"]
+    ))
+    return matcher
+
+
+def _filter_data(patientLines, codeAssociatedValues, config):
+    """Determine the patients and codes to use in the datasets.
+
+    :param patientLines:            The lines of the processed patient demographics file, excluding the header.
+    :type patientLines:             iterable
+    :param codeAssociatedValues:    Whether each code has values associated with it (see _read_code_values).
+    :type codeAssociatedValues:     dict
+    :param config:                  The object containing the configuration parameters for the flat file generation.
+    :type config:                   JsonschemaManipulation.Configuration
+    :return:                        The results of the filtering, recorded as:
+                                        {"ValidPatientData": demographics_store.DemographicsStore,
+                                         "PatientsPerCode": {code: int}, "ValidCodes": set,
+                                         "CodeAssociatedValues": {code: {"Val1": bool, "Val2": bool}}}
+    :rtype:                         dict
+
+    """
+
+    # Create patient and code ignore/keep pattern matchers.
+    patientsToIgnore = _create_matcher(config, "PatientsToIgnore", False)
+    patientsToKeep = _create_matcher(config, "PatientsToKeep", True)
+    codesToIgnore = _create_matcher(config, "CodesToIgnore", False)
+    codesToKeep = _create_matcher(config, "CodesToKeep", True)
+
+    # Determine the minimum number of valid codes a patient must be associated with and the minimum number of valid
+    # patients a code must be associated with before it is kept, and whether they are applied until both hold.
+    minCodes = config.get_param(["DataProcessing", "MinCodes"])[1]
+    minPatients = config.get_param(["DataProcessing", "MinPatients"])[1]
+    isIterative = config.get_param(["DataProcessing", "IterativeFiltering"])[1]
+
+    # Extract the patient demographics and determine which patients should be used. When the thresholds are applied
+    # iteratively, the codes of every patient to be used and not ignored are recorded in an incidence matrix instead.
+    validPatientData = demographics_store.DemographicsBuilder()
+    patientsPerCode = defaultdict(int)
+    incidence = incidence_matrix.IncidenceBuilder()
+    candidatePatients = []  # The demographics of the patients in the incidence matrix.
+    for line in patientLines:
+        chunks = (line.strip()).split('\t')
+        patientID = chunks[0]
+        yearOfBirth = int(chunks[1][:4])
+        patientGender = chunks[2]
+        codesPatientHas = chunks[3].split(',')
+        validCodesPatientHas = [i for i in codesPatientHas if codesToKeep.match(i) and (not codesToIgnore.match(i))]
+
+        if isIterative:
+            if patientsToKeep.match(patientID) and (not patientsToIgnore.match(patientID)):
+                incidence.add(validCodesPatientHas)
+                candidatePatients.append((patientID, yearOfBirth, patientGender))
+        elif patientsToKeep.match(patientID) and (not patientsToIgnore.match(patientID)) and \
+                        len(validCodesPatientHas) >= minCodes:
+            # Only record a patient if they are to be used, not to be ignored and are associated with enough codes
+            # that are to be kept and not ignored.
+            for i in validCodesPatientHas:
+                patientsPerCode[i] += 1
+            validPatientData.add(patientID, yearOfBirth, patientGender)
+
+    if isIterative:
+        # Remove patients and codes until every patient left has enough codes left and every code enough patients.
+        matrix, codes = incidence.build()
+        isPatientKept, isCodeKept, isEntryKept, numIterations = matrix.filter_min_degrees(minCodes, minPatients)
+        LOGGER.info(
+            "Applying MinCodes and MinPatients took {:d} iterations, leaving {:d} of {:d} patients, {:d} of {:d} codes "
+            "and {:d} of {:d} patient-code pairs.".format(
+                numIterations, int(isPatientKept.sum()), matrix.numPatients, int(isCodeKept.sum()), matrix.numCodes,
+                int(isEntryKept.sum()), len(matrix)
+            )
+        )
+        for i in np.flatnonzero(isPatientKept):
+            validPatientData.add(*candidatePatients[i])
+        keptPatientsPerCode = np.bincount(matrix.codeIndices[isPatientKept[matrix.rowIndices]], minlength=len(codes))
+        patientsPerCode = {codes[i]: int(keptPatientsPerCode[i]) for i in np.flatnonzero(keptPatientsPerCode)}
+        validCodes = {codes[i] for i in np.flatnonzero(isCodeKept & (keptPatientsPerCode > 0))}
+    else:
+        # Determine the valid codes (kept and not ignored) that are contained within a valid patient's history.
+        validCodes = {i for i in patientsPerCode if patientsPerCode[i] >= minPatients}
+    validPatientData = validPatientData.build()
+
+    return {
+        "ValidPatientData": validPatientData, "PatientsPerCode": dict(patientsPerCode), "ValidCodes": validCodes,
+        "CodeAssociatedValues": codeAssociatedValues
+    }
+
+
+def _find_input_files(dirProcessedData):
+    """Find the processed journal table files that the datasets are generated from, exiting if any are missing.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :return:                    The locations of the processed journal table, patient demographics and codes files.
+    :rtype:                     str, str, str
 
     """
 
     # Get the files for the SQL tables we're interested in. These would be the journal table and the patient table.
     isError = False
-    fileJournalTable = os.path.join(dirProcessedData, "JournalTable.tsv")
-    if not os.path.isfile(fileJournalTable):
-        LOGGER.error("There is no JournalTable.tsv file in the input directory ({:s}).".format(fileJournalTable))
+    fileJournalTable = compressed_files.find_file(os.path.join(dirProcessedData, "JournalTable.tsv"))
+    if fileJournalTable is None:
+        LOGGER.error("There is no JournalTable.tsv file (compressed or not) in the input directory ({:s}).".format(
+            dirProcessedData
+        ))
         isError = True
     filePatientData = os.path.join(dirProcessedData, "PatientDemographics.tsv")
     if not os.path.isfile(filePatientData):
@@ -48,49 +473,163 @@ def main(dirProcessedData, dirOutput, config):
     if isError:
         print("\nErrors were found while attempting to access the input files during flat file generation.\n")
         sys.exit()
+    return fileJournalTable, filePatientData, fileCodes
 
-    LOGGER.info("Starting journal table dataset generation.")
 
-    # Create patient and code ignore/keep regular expressions.
-    patientsToIgnore = ["{:s}$".format(i) for i in config.get_param(["DataProcessing", "PatientsToIgnore"])[1]]
-    patientsToIgnore = re.compile('|'.join(patientsToIgnore)) if patientsToIgnore else re.compile("a^")
-    patientsToKeep = ["{:s}$".format(i) for i in config.get_param(["DataProcessing", "PatientsToKeep"])[1]]
-    patientsToKeep = re.compile('|'.join(patientsToKeep)) if patientsToKeep else re.compile("")
-    codesToIgnore = ["{:s}$".format(i) for i in config.get_param(["DataProcessing", "CodesToIgnore"])[1]]
-    codesToIgnore = re.compile('|'.join(codesToIgnore)) if codesToIgnore else re.compile("a^")
-    codesToKeep = ["{:s}$".format(i) for i in config.get_param(["DataProcessing", "CodesToKeep"])[1]]
-    codesToKeep = re.compile('|'.join(codesToKeep)) if codesToKeep else re.compile("")
+def _fractional_ages(yearOfBirth, dateOrdinals):
+    """Calculate a patient's fractional age at a collection of dates, treating them as born on January 1st.
 
-    # Determine the minimum number of valid codes a patient must be associated with and the minimum number of valid
-    # patients a code must be associated with before it is kept.
-    minCodes = config.get_param(["DataProcessing", "MinCodes"])[1]
-    minPatients = config.get_param(["DataProcessing", "MinPatients"])[1]
+    :param yearOfBirth:     The patient's year of birth.
+    :type yearOfBirth:      int
+    :param dateOrdinals:    The day ordinals of the dates.
+    :type dateOrdinals:     np.array | list[int]
+    :return:                The fractional age at each date.
+    :rtype:                 np.array
+
+    """
+
+    born = np.full(len(dateOrdinals), datetime.date(yearOfBirth, 1, 1).toordinal(), dtype=np.int64)
+    return calculate_age.main_batch(born, dateOrdinals, True)
+
+
+def _generate_shard(shard):
+    """Save the patients in a block of the patient histories to shards of the dataset files within a worker process.
+
+    :param shard:   The (start, end) of the block and the location of the directory to save the shards of the dataset
+                        files in. The start and end are either records of the columnar cache or byte offsets of the
+                        processed journal table, depending on which the histories are read from.
+    :type shard:    tuple
+    :return:        The number of patients saved and the times recorded by the instrumentation timers.
+    :rtype:         tuple
+
+    """
+
+    (start, end), dirShard = shard
+    os.makedirs(dirShard)
+    validPatientData = _WORKER_DATA["ValidPatientData"]
+    validCodes = _WORKER_DATA["ValidCodes"]
+    if _WORKER_DATA["Cache"] is None:
+        patientHistories = _read_histories_table(
+            _WORKER_DATA["JournalTable"], validPatientData, validCodes, start, end, _WORKER_DATA["FractionalAges"]
+        )
+    else:
+        patientHistories = _read_histories_cache(
+            _WORKER_DATA["Cache"], validPatientData, validCodes, start, end, _WORKER_DATA["FractionalAges"]
+        )
+    outputFiles = file_generator.open_files(
+        dirShard, validCodes, _WORKER_DATA["OutputFormat"], _WORKER_DATA["Outputs"],
+        valueColumns=_WORKER_DATA["ValueColumns"]
+    )
+    patientsSaved = _save_histories(
+        instrumentation.timed_iter(patientHistories, "Parsing"), validPatientData, outputFiles,
+        _WORKER_DATA["MinVisits"], _WORKER_DATA["MinYears"], valueColumns=_WORKER_DATA["ValueColumns"],
+        rawValuePolicy=_WORKER_DATA["RawValuePolicy"]
+    )
+    file_generator.close_files(outputFiles)
+    return patientsSaved, instrumentation.take_timers()
+
+
+def _initialise_worker(dirProcessedData, validPatientData, validCodes, outputFormat, outputs, minVisits, minYears,
+                       isFractional, valueColumns, rawValuePolicy):
+    """Make the data needed to generate the datasets available to a worker process.
+
+    The columnar cache is loaded by each worker, as the memory mapped columns can not be shared between processes.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param validPatientData:    The demographics of the patients to save.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param validCodes:          The codes used as variables in the datasets.
+    :type validCodes:           set
+    :param outputFormat:        The format to write the datasets in.
+    :type outputFormat:         str
+    :param outputs:             The names of the datasets to write.
+    :type outputs:              list[str]
+    :param minVisits:           The minimum number of visits a patient needs before their visit data is saved.
+    :type minVisits:            int
+    :param minYears:            The minimum number of years a patient needs before their year data is saved.
+    :type minYears:             int
+    :param isFractional:        Whether the ages should be fractional years calculated from the date of each entry.
+    :type isFractional:         bool
+    :param valueColumns:        The columns of the values of each code in the raw data datasets.
+    :type valueColumns:         dict
+    :param rawValuePolicy:      How the raw data datasets record a column with several values in one time step.
+    :type rawValuePolicy:       str
+
+    """
+
+    global _WORKER_DATA
+    _WORKER_DATA = {
+        "Cache": columnar_cache.load(dirProcessedData), "FractionalAges": isFractional,
+        "JournalTable": compressed_files.find_file(os.path.join(dirProcessedData, "JournalTable.tsv")),
+        "MinVisits": minVisits,
+        "MinYears": minYears, "OutputFormat": outputFormat, "Outputs": outputs, "RawValuePolicy": rawValuePolicy,
+        "ValidCodes": validCodes, "ValidPatientData": validPatientData, "ValueColumns": valueColumns
+    }
+    instrumentation.start_worker()
+
+
+def _load_filter_results(dirProcessedData, filePatientData, fileCodes, config, resident=None):
+    """Filter the patients and codes, reusing the results of a previous run with the same filtering parameters when
+    they have been saved.
+
+    When the processed data is resident in memory, the results are instead reused from, and saved to, the results held
+    with it.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param filePatientData:     The location of the processed patient demographics file.
+    :type filePatientData:      str
+    :param fileCodes:           The location of the file of the codes in the processed journal table.
+    :type fileCodes:            str
+    :param config:              The object containing the configuration parameters for the flat file generation.
+    :type config:               JsonschemaManipulation.Configuration
+    :param resident:            The processed data held in memory (see load_resident), or None to read it from disk.
+    :type resident:             dict | None
+    :return:                    The results of the filtering (see _filter_data).
+    :rtype:                     dict
+
+    """
+
+    filterKey = filter_cache.fingerprint(config, dirProcessedData)
+    if resident is not None:
+        with resident["FilterLock"]:
+            filterResults = resident["FilterResults"].get(filterKey)
+        if filterResults is None:
+            filterResults = _filter_data(resident["PatientLines"], resident["CodeAssociatedValues"], config)
+            maxEntries = max(config.get_param(["DataProcessing", "FilterCacheSize"])[1], 1)
+            with resident["FilterLock"]:
+                resident["FilterResults"][filterKey] = filterResults
+                while len(resident["FilterResults"]) > maxEntries:
+                    # Remove the earliest results held.
+                    del resident["FilterResults"][next(iter(resident["FilterResults"]))]
+        else:
+            LOGGER.info("Reused the results of filtering the patients and codes held in memory.")
+        return filterResults
+    filterResults = filter_cache.load(dirProcessedData, filterKey)
+    if filterResults is None:
+        with open(filePatientData, 'r') as fidPatientData:
+            _ = fidPatientData.readline()  # Strip the header.
+            filterResults = _filter_data(fidPatientData, _read_code_values(fileCodes), config)
+        filter_cache.save(
+            dirProcessedData, filterKey, filterResults, config.get_param(["DataProcessing", "FilterCacheSize"])[1]
+        )
+    else:
+        LOGGER.info("Loaded the saved results of filtering the patients and codes.")
+    return filterResults
+
+
+def _read_code_values(fileCodes):
+    """Extract the information about whether codes have any values associated with them.
+
+    :param fileCodes:   The location of the file of the codes in the processed journal table.
+    :type fileCodes:    str
+    :return:            Whether each code has any Val1 and Val2 values, recorded as
+                            {code: {"Val1": bool, "Val2": bool}}.
+    :rtype:             dict
+
+    """
 
-    # Extract the patient demographics and determine which patients should be used.
-    validPatientData = {}
-    patientsPerCode = defaultdict(int)
-    with open(filePatientData, 'r') as fidPatientData:
-        _ = fidPatientData.readline()  # Strip the header.
-        for line in fidPatientData:
-            chunks = (line.strip()).split('\t')
-            patientID = chunks[0]
-            yearOfBirth = int(chunks[1][:4])
-            patientGender = chunks[2]
-            codesPatientHas = chunks[3].split(',')
-            validCodesPatientHas = [i for i in codesPatientHas if codesToKeep.match(i) and (not codesToIgnore.match(i))]
-
-            if patientsToKeep.match(patientID) and (not patientsToIgnore.match(patientID)) and \
-                            len(validCodesPatientHas) >= minCodes:
-                # Only record a patient if they are to be used, not to be ignored and are associated with enough codes
-                # that are to be kept and not ignored.
-                for i in validCodesPatientHas:
-                    patientsPerCode[i] += 1
-                validPatientData[patientID] = {"YearOfBirth": yearOfBirth, "Gender": patientGender}
-
-    # Determine the valid codes (kept and not ignored) that are contained within a valid patient's history.
-    validCodes = {i for i in patientsPerCode if patientsPerCode[i] >= minPatients}
-
-    # Extract the information about whether codes have any values associated with them.
     codeAssociatedValues = {}
     with open(fileCodes, 'r') as fidCodes:
         _ = fidCodes.readline()  # Strip the header.
@@ -98,23 +637,113 @@ def main(dirProcessedData, dirOutput, config):
             chunks = (line.strip()).split('\t')
             code = chunks[0]
             codeAssociatedValues[code] = {"Val1": bool(int(chunks[1])), "Val2": bool(int(chunks[2]))}
+    return codeAssociatedValues
 
-    # Determine minimum number of visits and years needed for saving.
-    minVisits = config.get_param(["DataProcessing", "MinVisits"])[1]
-    minYears = config.get_param(["DataProcessing", "MinYears"])[1]
 
-    # Create the files to record the generated datasets in.
-    outputFiles = file_generator.open_files(dirOutput, validCodes | {"_ID", "_Age", "_Gender"})
+def _read_histories_cache(cache, validPatientData, validCodes, startRecord=0, endRecord=None, isFractional=False):
+    """Extract the histories of the valid patients from the columnar cache of the journal table.
+
+    :param cache:               The memory-mapped columnar cache of the journal table.
+    :type cache:                columnar_cache.ColumnarCache
+    :param validPatientData:    The demographics of the patients to extract the histories of.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param validCodes:          The codes to keep in the histories.
+    :type validCodes:           set
+    :param startRecord:         The index of the first patient record to extract.
+    :type startRecord:          int
+    :param endRecord:           The index of the record to stop extracting at (defaults to the number of records).
+    :type endRecord:            int
+    :param isFractional:        Whether the ages should be fractional years calculated from the date of each entry,
+                                    rather than the difference between the year of the entry and the year of birth.
+    :type isFractional:         bool
+    :return:                    A generator of the ID and history of each patient, in the order they appear in the
+                                    journal table. The history is formatted as expected by save_patient_data.main.
+    :rtype:                     generator
+
+    """
+
+    # Determine the patient records that are needed and the codes that are valid.
+    isValidCode = np.array([i in validCodes for i in cache.codes], dtype=bool)
+    isValidPatient = validPatientData.contains(cache.patientIDs)
+    recordPatients = cache.record_patients()[startRecord:endRecord]
+    offsets = cache.PatientOffsets
 
-    # Extract the information about each patient's history.
-    LOGGER.info("Now generating patient histories.")
-    patientsSaved = 0
     currentPatient = None  # The ID of the patient who's record is currently being built.
     patientHistory = []  # The data for the current patient.
-    with open(fileJournalTable, 'r') as fidJournalTable:
-        _ = fidJournalTable.readline()  # Strip the header.
-        for line in fidJournalTable:
-            chunks = (line.strip()).split('\t')
+    for record in np.flatnonzero(isValidPatient[recordPatients]) + startRecord:
+        start = offsets[record]
+        rows = np.flatnonzero(isValidCode[cache.Codes[start:offsets[record + 1]]]) + start
+        if not rows.size:
+            # Skip records that contain no codes that are being used.
+            continue
+
+        patientID = cache.patientIDs[recordPatients[record - startRecord]]
+        if (patientID != currentPatient) and (currentPatient is not None):
+            # A new patient has been found, so yield the old patient and reset the patient data for the new patient.
+            yield currentPatient, patientHistory
+            patientHistory = []
+        currentPatient = patientID
+
+        # Add the patient-code associations in the record to the patient's history.
+        yearOfBirth = validPatientData.year_of_birth(validPatientData.find(patientID))
+        years = cache.Years[rows]
+        if isFractional:
+            ages = _fractional_ages(yearOfBirth, cache.Dates[rows]).tolist()
+        else:
+            ages = (years.astype(np.int64) - yearOfBirth).tolist()
+        for code, year, age, visitNumber, value1, value2 in zip(
+                cache.Codes[rows].tolist(), years.tolist(), ages, cache.Visits[rows].tolist(),
+                cache.Val1[rows].tolist(), cache.Val2[rows].tolist()):
+            patientHistory.append({
+                "Age": age, "Code": cache.codes[code], "Val1": value1, "Val2": value2, "Visit": visitNumber,
+                "Year": year
+            })
+
+    # Yield the final patient's data.
+    if currentPatient is not None:
+        yield currentPatient, patientHistory
+
+
+def _read_histories_table(fileJournalTable, validPatientData, validCodes, start=None, end=None, isFractional=False,
+                          records=None):
+    """Extract the histories of the valid patients from the processed journal table.
+
+    :param fileJournalTable:    The location of the processed journal table, which may be compressed.
+    :type fileJournalTable:     str
+    :param validPatientData:    The demographics of the patients to extract the histories of.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param validCodes:          The codes to keep in the histories.
+    :type validCodes:           set
+    :param start:               The byte offset of the first line to extract (defaults to the line after the header).
+                                    Only an uncompressed journal table can be read from a given offset.
+    :type start:                int
+    :param end:                 The byte offset to stop extracting at (defaults to the end of the file).
+    :type end:                  int
+    :param isFractional:        Whether the ages should be fractional years calculated from the date of each entry,
+                                    rather than the difference between the year of the entry and the year of birth.
+    :type isFractional:         bool
+    :param records:             The byte offset and number of lines of the records to extract (see
+                                    patient_index.find_records), or None to extract the records between start and end.
+                                    Only an uncompressed journal table can be read by record.
+    :type records:              list[tuple] | None
+    :return:                    A generator of the ID and history of each patient, in the order they appear in the
+                                    journal table. The history is formatted as expected by save_patient_data.main.
+    :rtype:                     generator
+
+    """
+
+    currentPatient = None  # The ID of the patient who's record is currently being built.
+    patientHistory = []  # The data for the current patient.
+    historyDates = []  # The day ordinal of each entry in the current patient's history, when ages are fractional.
+    linePatient = None  # The ID of the patient on the previous line.
+    patientIndex = -1  # The index in validPatientData of the patient on the previous line.
+    with compressed_files.open_file(fileJournalTable, 'rb') as fidJournalTable:
+        if records is None:
+            lines = _read_range(fidJournalTable, start, end)
+        else:
+            lines = patient_index.read_records(fidJournalTable, records)
+        for line in lines:
+            chunks = (line.decode().strip()).split('\t')
             patientID = chunks[0]
             code = chunks[1]
             year = int(chunks[3])
@@ -122,37 +751,252 @@ def main(dirProcessedData, dirOutput, config):
             value1 = float(chunks[5])
             value2 = float(chunks[6])
 
-            if (patientID not in validPatientData) or (code not in validCodes):
+            if patientID != linePatient:
+                # Only look the patient up once per run of their consecutive lines.
+                linePatient = patientID
+                patientIndex = validPatientData.find(patientID)
+            if (patientIndex < 0) or (code not in validCodes):
                 # Skip events that contain a patient or code that is not being used.
                 continue
 
             if (patientID != currentPatient) and (currentPatient is not None):
-                # A new patient has been found and this is not the first line of the file, so record the old
+                # A new patient has been found and this is not the first line of the file, so yield the old
                 # patient and reset the patient data for the new patient.
-
-                # Output an update.
-                patientsSaved += 1
-                if patientsSaved % 1000 == 0:
-                    LOGGER.info("Saved {:d} patients ({:.2f}%).".format(
-                        patientsSaved, (patientsSaved / len(validPatientData)) * 100
-                    ))
-
-                # Output the patient's information.
-                patientGender = validPatientData[currentPatient]["Gender"]
-                save_patient_data.main(currentPatient, patientHistory, patientGender, outputFiles, minVisits, minYears)
+                if isFractional:
+                    _set_fractional_ages(patientHistory, yearOfBirth, historyDates)
+                    historyDates = []
+                yield currentPatient, patientHistory
                 patientHistory = []
             currentPatient = patientID  # Update the current patient's ID to be this patient's.
 
             # Add this patient-code association to the patient's history.
-            patientAge = year - validPatientData[patientID]["YearOfBirth"]
-            patientHistory.append(
-                {"Age": patientAge, "Code": code, "Val1": value1, "Val2": value2, "Visit": visitNumber, "Year": year}
+            yearOfBirth = validPatientData.year_of_birth(patientIndex)
+            if isFractional:
+                historyDates.append(iso_dates.to_ordinal(chunks[2]))
+            patientHistory.append({
+                "Age": year - yearOfBirth, "Code": code, "Val1": value1, "Val2": value2, "Visit": visitNumber,
+                "Year": year
+            })
+
+    # Yield the final patient's data.
+    if currentPatient is not None:
+        if isFractional:
+            _set_fractional_ages(patientHistory, yearOfBirth, historyDates)
+        yield currentPatient, patientHistory
+
+
+def _read_range(fidJournalTable, start=None, end=None):
+    """Read the lines within a byte range of the processed journal table.
+
+    :param fidJournalTable: The processed journal table, opened in binary mode.
+    :type fidJournalTable:  io.BufferedReader
+    :param start:           The byte offset of the first line to read (defaults to the line after the header). Only an
+                                uncompressed journal table can be read from a given offset.
+    :type start:            int
+    :param end:             The byte offset to stop reading at (defaults to the end of the file).
+    :type end:              int
+    :return:                A generator of the lines in the range.
+    :rtype:                 generator
+
+    """
+
+    if start is None:
+        start = len(fidJournalTable.readline())  # Strip the header.
+    else:
+        fidJournalTable.seek(start)
+    end = float("inf") if end is None else end
+    position = start
+    for line in fidJournalTable:
+        if position >= end:
+            break
+        position += len(line)
+        yield line
+
+
+def _save_histories(patientHistories, validPatientData, outputFiles, minVisits, minYears, progress=None,
+                    valueColumns=None, rawValuePolicy="Last"):
+    """Save the histories of patients to the dataset files.
+
+    :param patientHistories:    The ID and history of each patient to save.
+    :type patientHistories:     iterable
+    :param validPatientData:    The demographics of the patients.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param outputFiles:         The writers of the dataset files.
+    :type outputFiles:          dict
+    :param minVisits:           The minimum number of visits a patient needs before their visit data is saved.
+    :type minVisits:            int
+    :param minYears:            The minimum number of years a patient needs before their year data is saved.
+    :type minYears:             int
+    :param progress:            The reporter to update as each patient is saved, or None to not report the progress.
+    :type progress:             instrumentation.ProgressReporter | None
+    :param valueColumns:        The columns of the values of each code in the raw data datasets, or None if no code
+                                    has values.
+    :type valueColumns:         dict | None
+    :param rawValuePolicy:      How the raw data datasets record a column with several values in one time step.
+    :type rawValuePolicy:       str
+    :return:                    The number of patients saved.
+    :rtype:                     int
+
+    """
+
+    patientsSaved = 0
+    for patientID, patientHistory in patientHistories:
+        # Output the patient's information.
+        patientGender = validPatientData.gender(validPatientData.find(patientID))
+        save_patient_data.main(
+            patientID, patientHistory, patientGender, outputFiles, minVisits, minYears, valueColumns, rawValuePolicy
+        )
+
+        # Output an update.
+        patientsSaved += 1
+        if progress is not None:
+            progress.update()
+    return patientsSaved
+
+
+def _save_study_histories(patientHistories, validPatientData, validCodes, studies, progress=None):
+    """Save the histories of patients to the dataset files of each study that uses them.
+
+    :param patientHistories:    The ID and history of each patient used by any of the studies.
+    :type patientHistories:     iterable
+    :param validPatientData:    The demographics of the patients used by any of the studies.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :param validCodes:          The codes used by any of the studies, which the histories are restricted to.
+    :type validCodes:           set
+    :param studies:             The data needed to save the datasets of each study (see main_batch). The number of
+                                    patients saved for each study is added to its PatientsSaved.
+    :type studies:              list[dict]
+    :param progress:            The reporter to update as each patient is saved, or None to not report the progress.
+    :type progress:             instrumentation.ProgressReporter | None
+
+    """
+
+    for patientID, patientHistory in instrumentation.timed_iter(patientHistories, "Parsing"):
+        patientGender = validPatientData.gender(validPatientData.find(patientID))
+        for study in studies:
+            if patientID not in study["ValidPatientData"]:
+                continue
+            studyHistory = patientHistory
+            if len(study["ValidCodes"]) < len(validCodes):
+                # Only keep the codes used by the study, skipping the patient if none of their codes are used.
+                studyHistory = [i for i in patientHistory if i["Code"] in study["ValidCodes"]]
+                if not studyHistory:
+                    continue
+            save_patient_data.main(
+                patientID, studyHistory, patientGender, study["OutputFiles"], study["MinVisits"], study["MinYears"],
+                study["ValueColumns"], study["RawValuePolicy"]
             )
+            study["PatientsSaved"] += 1
 
-        # Record the final patient's data if they are meant to have data extracted.
-        if currentPatient in validPatientData:
-            patientGender = validPatientData[currentPatient]["Gender"]
-            save_patient_data.main(currentPatient, patientHistory, patientGender, outputFiles, minVisits, minYears)
+        # Output an update.
+        if progress is not None:
+            progress.update()
 
-        # Close the open files.
-        file_generator.close_files(outputFiles)
+
+def _select_outputs(config):
+    """Determine the datasets to write, and the format and compression to write them with.
+
+    :param config:  The object containing the configuration parameters for the flat file generation.
+    :type config:   JsonschemaManipulation.Configuration
+    :return:        The format of the datasets, the names of the datasets that can be written in the format and the
+                        codec to compress the datasets with (None for no compression).
+    :rtype:         str, list[str], str | None
+
+    """
+
+    outputFormat = config.get_param(["DataProcessing", "OutputFormat"])[1]
+    requestedOutputs = config.get_param(["DataProcessing", "Outputs"])[1]
+    outputs = file_generator.select_outputs(outputFormat, requestedOutputs)
+    unavailableOutputs = sorted(set(requestedOutputs) - set(outputs))
+    if unavailableOutputs:
+        LOGGER.warning("The datasets {:s} can not be written in the {:s} format.".format(
+            ', '.join(unavailableOutputs), outputFormat
+        ))
+    LOGGER.info("Generating the datasets {:s}.".format(', '.join(outputs)))
+    compression = config.get_param(["DataProcessing", "OutputCompression"])[1]
+    compression = None if compression == "None" else compression
+    return outputFormat, outputs, compression
+
+
+def _set_fractional_ages(patientHistory, yearOfBirth, dateOrdinals):
+    """Replace the ages in a patient's history with their fractional age on the date of each entry.
+
+    :param patientHistory:  The patient's history.
+    :type patientHistory:   list[dict]
+    :param yearOfBirth:     The patient's year of birth.
+    :type yearOfBirth:      int
+    :param dateOrdinals:    The day ordinal of the date of each entry in the history.
+    :type dateOrdinals:     list[int]
+
+    """
+
+    for entry, age in zip(patientHistory, _fractional_ages(yearOfBirth, dateOrdinals).tolist()):
+        entry["Age"] = age
+
+
+def _split_cache(cache, numBlocks):
+    """Split the patient records of a columnar cache into contiguous blocks with similar numbers of rows.
+
+    A block boundary is never placed between consecutive records of the same patient, so no patient's history is split
+    between blocks. As a result, fewer blocks than requested may be returned.
+
+    :param cache:       The memory-mapped columnar cache of the journal table.
+    :type cache:        columnar_cache.ColumnarCache
+    :param numBlocks:   The number of blocks to split the records into.
+    :type numBlocks:    int
+    :return:            The (start, end) record indices of the non-empty blocks in order.
+    :rtype:             list[tuple]
+
+    """
+
+    recordPatients = cache.record_patients()
+    boundaries = [0]
+    for i in range(1, numBlocks):
+        # Find the first record starting at or after the target row, and then the first record of the next patient.
+        record = int(np.searchsorted(cache.PatientOffsets[:-1], (cache.numRows * i) // numBlocks))
+        record = max(record, boundaries[-1])
+        while 0 < record < cache.numRecords and recordPatients[record] == recordPatients[record - 1]:
+            record += 1
+        boundaries.append(record)
+    boundaries.append(cache.numRecords)
+    return [(i, j) for i, j in zip(boundaries, boundaries[1:]) if j > i]
+
+
+def _split_journal_table(fileJournalTable, numBlocks):
+    """Split the processed journal table into contiguous byte ranges that begin and end on patient boundaries.
+
+    :param fileJournalTable:    The location of the processed journal table.
+    :type fileJournalTable:     str
+    :param numBlocks:           The number of ranges to split the journal table into.
+    :type numBlocks:            int
+    :return:                    The (start, end) byte offsets of the non-empty ranges in order, excluding the header.
+                                    A compressed journal table can not be split, so is returned as a single range
+                                    covering the whole table.
+    :rtype:                     list[tuple]
+
+    """
+
+    if compressed_files.get_codec(fileJournalTable) is not None:
+        return [(None, None)]
+
+    fileSize = os.path.getsize(fileJournalTable)
+    with open(fileJournalTable, 'rb') as fidJournalTable:
+        headerSize = len(fidJournalTable.readline())
+        boundaries = [headerSize]
+        for i in range(1, numBlocks):
+            # Move to the start of the first line beginning at or after the target position, and then on to the first
+            # line of the next patient.
+            position = max(headerSize + ((fileSize - headerSize) * i) // numBlocks, boundaries[-1])
+            fidJournalTable.seek(position - 1)
+            position += len(fidJournalTable.readline()) - 1
+            firstPatient = None
+            for line in fidJournalTable:
+                patientID = line.split(b'\t', 1)[0]
+                if firstPatient is None:
+                    firstPatient = patientID
+                elif patientID != firstPatient:
+                    break
+                position += len(line)
+            boundaries.append(position)
+    boundaries.append(fileSize)
+    return [(i, j) for i, j in zip(boundaries, boundaries[1:]) if j > i]
@@ -0,0 +1,167 @@
+"""Classes to hold which codes each patient is associated with in a sparse patient by code incidence matrix.
+
+The matrix is held in compressed sparse row form, with the codes of each patient held consecutively in one array and a
+second array recording where each patient's codes start, along with a permutation of the entries that orders them by
+code. This allows the entries of any set of patients or codes to be found without scanning the entire matrix, so that
+filtering the patients and codes by the number of codes and patients they are associated with (see
+IncidenceMatrix.filter_min_degrees) costs in proportion to the number of entries removed.
+"""
+
+# Python imports.
+import array
+
+# 3rd party imports.
+import numpy as np
+
+
+class IncidenceMatrix:
+    """A sparse matrix recording which codes each of a set of patients is associated with."""
+
+    def __init__(self, rowStarts, codeIndices, numCodes):
+        """Initialise the matrix.
+
+        :param rowStarts:   The position of the first code of each patient in codeIndices, followed by the number of
+                                entries in the matrix.
+        :type rowStarts:    array.array | list[int]
+        :param codeIndices: The index of each code of each patient, with the codes of a patient held consecutively.
+        :type codeIndices:  array.array | list[int]
+        :param numCodes:    The number of codes.
+        :type numCodes:     int
+
+        """
+
+        self.rowStarts = np.asarray(rowStarts, dtype=np.int64)
+        self.codeIndices = np.asarray(codeIndices, dtype=np.int64)
+        self.rowIndices = np.repeat(np.arange(self.rowStarts.size - 1), np.diff(self.rowStarts))
+        self.numCodes = numCodes
+
+        # Order the entries by code, recording where the entries of each code start in the ordering.
+        self._codeOrder = np.argsort(self.codeIndices, kind="stable")
+        self._codeStarts = np.zeros(numCodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.codeIndices, minlength=numCodes), out=self._codeStarts[1:])
+
+    def __len__(self):
+        return self.codeIndices.size
+
+    @property
+    def numPatients(self):
+        """Get the number of patients.
+
+        :return:    The number of patients.
+        :rtype:     int
+
+        """
+
+        return self.rowStarts.size - 1
+
+    def filter_min_degrees(self, minCodes, minPatients):
+        """Repeatedly remove the patients associated with too few codes and the codes associated with too few patients.
+
+        Removing a code can leave a patient associated with fewer than minCodes codes, and removing a patient can leave
+        a code associated with fewer than minPatients patients, so the removals are repeated until neither threshold
+        removes anything. After the first iteration, only the entries of the patients and codes removed in the previous
+        step are visited, and only the patients and codes they affect are checked against the thresholds.
+
+        :param minCodes:    The minimum number of remaining codes a patient must be associated with to remain.
+        :type minCodes:     int
+        :param minPatients: The minimum number of remaining patients a code must be associated with to remain.
+        :type minPatients:  int
+        :return:            Whether each patient, code and entry remains, and the number of iterations taken. A code
+                                not associated with any patients only remains when minPatients is 0.
+        :rtype:             np.array, np.array, np.array, int
+
+        """
+
+        isEntryKept = np.ones(len(self), dtype=bool)
+        codesPerPatient = np.diff(self.rowStarts)
+        patientsPerCode = np.diff(self._codeStarts)
+        isPatientKept = np.ones(self.numPatients, dtype=bool)
+        isCodeKept = np.ones(self.numCodes, dtype=bool)
+        candidatePatients = np.arange(self.numPatients)  # The patients that may now have too few codes.
+        candidateCodes = np.arange(self.numCodes)  # The codes that may now have too few patients.
+        numIterations = 0
+        while True:
+            numIterations += 1
+
+            # Remove the patients associated with too few codes, along with their entries.
+            removedPatients = candidatePatients[
+                isPatientKept[candidatePatients] & (codesPerPatient[candidatePatients] < minCodes)
+            ]
+            isPatientKept[removedPatients] = False
+            removedEntries = _gather_ranges(self.rowStarts, removedPatients)
+            removedEntries = removedEntries[isEntryKept[removedEntries]]
+            isEntryKept[removedEntries] = False
+            affectedCodes = self.codeIndices[removedEntries]
+            np.subtract.at(patientsPerCode, affectedCodes, 1)
+            if numIterations > 1:
+                candidateCodes = np.unique(affectedCodes)
+
+            # Remove the codes associated with too few patients, along with their entries.
+            removedCodes = candidateCodes[isCodeKept[candidateCodes] & (patientsPerCode[candidateCodes] < minPatients)]
+            isCodeKept[removedCodes] = False
+            removedEntries = self._codeOrder[_gather_ranges(self._codeStarts, removedCodes)]
+            removedEntries = removedEntries[isEntryKept[removedEntries]]
+            isEntryKept[removedEntries] = False
+            affectedPatients = self.rowIndices[removedEntries]
+            np.subtract.at(codesPerPatient, affectedPatients, 1)
+            candidatePatients = np.unique(affectedPatients)
+
+            if not removedCodes.size:
+                # Removing the patients left every code with enough patients, and no codes were removed to leave a
+                # patient with too few codes.
+                break
+        return isPatientKept, isCodeKept, isEntryKept, numIterations
+
+
+class IncidenceBuilder:
+    """Collect the codes of patients one patient at a time before storing them in an IncidenceMatrix."""
+
+    def __init__(self):
+        self._codes = {}  # The index of each code.
+        self._rowStarts = array.array('q', [0])
+        self._codeIndices = array.array('q')
+
+    def add(self, codes):
+        """Add the codes of the next patient.
+
+        :param codes:   The codes the patient is associated with, with no code given more than once.
+        :type codes:    list[str]
+        :return:        The index of the patient.
+        :rtype:         int
+
+        """
+
+        for i in codes:
+            self._codeIndices.append(self._codes.setdefault(i, len(self._codes)))
+        self._rowStarts.append(len(self._codeIndices))
+        return len(self._rowStarts) - 2
+
+    def build(self):
+        """Create the matrix of the codes added.
+
+        :return:    The matrix of the codes, and the code corresponding to each column of the matrix.
+        :rtype:     IncidenceMatrix, list[str]
+
+        """
+
+        return IncidenceMatrix(self._rowStarts, self._codeIndices, len(self._codes)), list(self._codes)
+
+
+def _gather_ranges(starts, indices):
+    """Determine the positions in the ranges of a set of rows (or columns) of a compressed sparse matrix.
+
+    :param starts:  The position of the first entry of each row, followed by the number of entries.
+    :type starts:   np.array
+    :param indices: The indices of the rows.
+    :type indices:  np.array
+    :return:        The positions of the entries of the rows.
+    :rtype:         np.array
+
+    """
+
+    lengths = starts[indices + 1] - starts[indices]
+    numEntries = int(lengths.sum())
+    if not numEntries:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts[indices] - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(numEntries)
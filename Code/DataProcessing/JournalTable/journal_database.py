@@ -0,0 +1,110 @@
+"""Functions to read the journal and patient tables directly from a database through a DB-API connection.
+
+The rows are fetched in batches with fetchmany, and converted into the same fields that parsing the SQL dump of the
+tables gives (see parse_patient_entry), so that they can be processed in the same way without writing or parsing any
+SQL text. The journal table is ordered by patient ID and date by the database, so that each patient's entries are
+consecutive.
+"""
+
+# Python imports.
+import datetime
+
+# User imports.
+from . import demographics_store
+
+# Globals.
+BATCH_SIZE = 100000  # The default number of rows to fetch at once.
+JOURNAL_QUERY = "SELECT id, code, date, value1, value2, text FROM journal ORDER BY id, date"
+PATIENT_QUERY = "SELECT id, year_of_birth, gender FROM patient"
+
+
+def read_entries(connection, batchSize=BATCH_SIZE):
+    """Read the entries of the journal table in blocks, ordered by patient ID and date.
+
+    Each entry is converted to the fields that parse_patient_entry.main gives for the same row in an SQL dump, with
+    the values formatted to four decimal places, any values embedded in the code removed and a missing free text
+    recorded as null. Missing patient IDs, codes and dates are recorded as empty strings (so that the entry is treated
+    as invalid), and missing values as 0.
+
+    :param connection:  The DB-API connection to the database containing the journal table.
+    :type connection:   object
+    :param batchSize:   The number of rows to fetch at once.
+    :type batchSize:    int
+    :return:            A generator of blocks of the entries, with each entry a list of fields.
+    :rtype:             generator
+
+    """
+
+    for rows in _fetch_batches(connection, JOURNAL_QUERY, batchSize):
+        yield [
+            [
+                _to_string(patientID), _to_string(code).split(',')[0], _to_string(date),
+                "{:.4f}".format(0 if value1 is None else float(value1)),
+                "{:.4f}".format(0 if value2 is None else float(value2)), "null" if text is None else str(text)
+            ]
+            for patientID, code, date, value1, value2, text in rows
+        ]
+
+
+def read_patients(connection, batchSize=BATCH_SIZE):
+    """Read the demographics of the patients in the patient table.
+
+    :param connection:  The DB-API connection to the database containing the patient table.
+    :type connection:   object
+    :param batchSize:   The number of rows to fetch at once.
+    :type batchSize:    int
+    :return:            The demographics of the patients.
+    :rtype:             demographics_store.DemographicsStore
+
+    """
+
+    builder = demographics_store.DemographicsBuilder()
+    for rows in _fetch_batches(connection, PATIENT_QUERY, batchSize):
+        for patientID, yearOfBirth, patientGender in rows:
+            # A 1 indicates a male and a 0 a female.
+            builder.add(_to_string(patientID), int(yearOfBirth), 'M' if patientGender in (1, '1') else 'F')
+    return builder.build()
+
+
+def _fetch_batches(connection, query, batchSize):
+    """Run a query and fetch the rows of its results in batches.
+
+    :param connection:  The DB-API connection to run the query with.
+    :type connection:   object
+    :param query:       The query to run.
+    :type query:        str
+    :param batchSize:   The number of rows to fetch at once.
+    :type batchSize:    int
+    :return:            A generator of the batches of rows.
+    :rtype:             generator
+
+    """
+
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = batchSize
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(batchSize)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _to_string(value):
+    """Convert a value fetched from the database to the string recorded for it in an SQL dump.
+
+    :param value:   The value to convert.
+    :type value:    object
+    :return:        The value as a string, with dates in YYYY-MM-DD format and missing values as an empty string.
+    :rtype:         str
+
+    """
+
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
@@ -1,5 +1,8 @@
 """Function to parse a patient entry in the SQL insert style file."""
 
+# Python imports.
+import io
+
 
 def main(line):
     """Parse an entry in the file of the patient-code associations.
@@ -32,32 +35,90 @@ def main(line):
     # two values recorded as part of the code (often with the two values also recorded in the correct Val1
     # and Val2 entries as well. It's also possible that the free text has commas in it (which is used as the
     # delimiter in the insert statement). Simply splitting the insert statement on a comma to get the
-    # different values is therefore not feasible. Instead, the line has to be read character by character
-    # to make sure that the line parsing is done correctly.
+    # different values is therefore only possible when none of the commas are within a quote block.
     # The data values within the code are ignored, and the Val1 and Val2 values recorded in the correct
     # place used instead.
     # Any values that are treated in a European manner with a comma in place of the decimal point will
     # cause the parsing to fail, unless they are quoted.
-    entries = []
-    currentEntry = ""
-    inQuoteBlock = False
-    for i in line:
-        if i == ',' and not inQuoteBlock:
-            # Found a separator and we aren't in a quote block. Therefore, record the end of the current
-            # entry and initialise for the next entry.
-            entries.append(currentEntry)
-            currentEntry = ""
-        elif i in ["'", '"']:
-            # Either found the end or the start of a quote block.
-            inQuoteBlock = not inQuoteBlock
-        else:
-            # Either current character is not a comma or we are currently in a quote block as are
-            # ignoring commas.
-            currentEntry += i
-    entries.append(currentEntry)  # Add the final entry to the list of entries.
+    entries = _split_entries(line)
 
     # Update the code entry.
     code = entries[1].split(',')[0]  # If the code is recorded with its values, then just get the code.
     entries[1] = code
 
     return entries
+
+
+def main_batch(lines):
+    """Parse a collection of entries in the file of the patient-code associations.
+
+    Each line is parsed in the same manner as by main, but without the overhead of a function call per line.
+
+    :param lines:   The lines to parse, supplied either as a sequence of lines or as a single block of text containing
+                        newline terminated lines.
+    :type lines:    list[str] | str
+    :return:        The entries on each line, in the same order as the lines were supplied. The entries for a line are
+                        ordered as they are by main.
+    :rtype:         list[list]
+
+    """
+
+    if isinstance(lines, str):
+        # Split the block of text in the same manner as iterating over a file does.
+        lines = io.StringIO(lines)
+
+    # The fast path of _split_entries is repeated here to avoid the function call for the common case.
+    parsedLines = []
+    for i in lines:
+        blocks = i[75:][:-3].replace('"', "'").split("'")
+        if ',' not in ''.join(blocks[1::2]):
+            entries = ''.join(blocks).split(',')
+        else:
+            entries = _split_quote_blocks(blocks)
+        entries[1] = entries[1].split(',')[0]
+        parsedLines.append(entries)
+    return parsedLines
+
+
+def _split_entries(line):
+    """Split the values of an insert statement on the commas that are not within a quote block.
+
+    Both single and double quotes open and close a quote block, and are removed from the values. A comma is within a
+    quote block if it is preceded by an odd number of quote characters. Replacing all double quotes with single quotes
+    and splitting on single quotes therefore gives the text outside quote blocks at the even indices and the text
+    inside them at the odd indices.
+
+    :param line:    The values of the insert statement (e.g. 26044,'C10E','1998-04-16',0.0000,0.0000,null).
+    :type line:     str
+    :return:        The values with the quote characters removed.
+    :rtype:         list[str]
+
+    """
+
+    blocks = line.replace('"', "'").split("'")
+    if ',' not in ''.join(blocks[1::2]):
+        # No comma is within a quote block (the common case), so all commas are separators.
+        return ''.join(blocks).split(',')
+    return _split_quote_blocks(blocks)
+
+
+def _split_quote_blocks(blocks):
+    """Split the values of an insert statement when at least one comma is within a quote block.
+
+    :param blocks:  The values of the insert statement split on the quote characters, as produced by _split_entries.
+    :type blocks:   list[str]
+    :return:        The values with the quote characters removed.
+    :rtype:         list[str]
+
+    """
+
+    # Only split the text outside the quote blocks (the blocks at the even indices).
+    entries = ['']
+    for ind, i in enumerate(blocks):
+        if ind % 2:
+            entries[-1] += i
+        else:
+            values = i.split(',')
+            entries[-1] += values[0]
+            entries.extend(values[1:])
+    return entries
@@ -0,0 +1,138 @@
+"""Functions to write and read the index of the patient records in a processed journal table.
+
+The index is saved as PatientIndex.tsv alongside an uncompressed JournalTable.tsv, with one line per patient record
+recording the patient's ID, the byte offset of the record's first line in JournalTable.tsv and the number of lines in
+the record. A patient will only have more than one record if their history is not recorded consecutively. The index
+allows the records of a small set of patients to be read by seeking directly to them, rather than reading the entire
+journal table.
+"""
+
+# Python imports.
+import os
+
+# Globals.
+INDEX_FILE = "PatientIndex.tsv"  # The name of the index file within the processed data directory.
+MAX_FRACTION = 0.1  # The largest fraction of the journal table's rows for which seeking to the records is used.
+
+
+class IndexWriter:
+    """Write the index of the patient records of a processed journal table one record at a time."""
+
+    def __init__(self, fileIndex, start, isAppend=False):
+        """Initialise the writer, creating the index file unless appending to an existing index.
+
+        :param fileIndex:   The location of the index file.
+        :type fileIndex:    str
+        :param start:       The byte offset in the processed journal table of the first record that will be added.
+        :type start:        int
+        :param isAppend:    Whether the records should be appended to the existing index.
+        :type isAppend:     bool
+
+        """
+
+        self._offset = start
+        self._fidIndex = open(fileIndex, 'a' if isAppend else 'w')
+        if not isAppend:
+            self._fidIndex.write("PatientID\tOffset\tNumRows\n")
+
+    def add_record(self, patientID, numBytes, numRows):
+        """Add a patient record to the index.
+
+        :param patientID:   The ID of the patient.
+        :type patientID:    str
+        :param numBytes:    The number of bytes of the processed journal table the record takes up.
+        :type numBytes:     int
+        :param numRows:     The number of lines in the record.
+        :type numRows:      int
+
+        """
+
+        self._fidIndex.write("{:s}\t{:d}\t{:d}\n".format(patientID, self._offset, numRows))
+        self._offset += numBytes
+
+    def close(self):
+        """Close the index file."""
+
+        self._fidIndex.close()
+
+
+def find_records(dirProcessedData, validPatientData):
+    """Find the records of a set of patients in the index of a processed journal table.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param validPatientData:    The demographics of the patients to find the records of.
+    :type validPatientData:     demographics_store.DemographicsStore
+    :return:                    The byte offset and number of lines of each of the patients' records in the order they
+                                    appear in the journal table, or None if there is no index or the records make up
+                                    more than MAX_FRACTION of the journal table's rows (in which case reading the entire
+                                    journal table is quicker).
+    :rtype:                     list[tuple] | None
+
+    """
+
+    fileIndex = os.path.join(dirProcessedData, INDEX_FILE)
+    if not os.path.isfile(fileIndex):
+        return None
+    records = []
+    numRows = 0
+    numSelectedRows = 0
+    with open(fileIndex, 'r') as fidIndex:
+        _ = fidIndex.readline()  # Strip the header.
+        for line in fidIndex:
+            patientID, offset, recordRows = line.rstrip('\n').split('\t')
+            recordRows = int(recordRows)
+            numRows += recordRows
+            if patientID in validPatientData:
+                records.append((int(offset), recordRows))
+                numSelectedRows += recordRows
+    if numSelectedRows > MAX_FRACTION * numRows:
+        return None
+    return records
+
+
+def merge(fileShardIndices, fileShardJournals, fileIndex, start, isAppend=False):
+    """Merge the indices of processed journal table shards that are concatenated into one journal table.
+
+    :param fileShardIndices:    The locations of the indices of the shards, in the order the shards are concatenated.
+                                    The offsets in each index are relative to the start of its shard.
+    :type fileShardIndices:     list[str]
+    :param fileShardJournals:   The locations of the processed journal table shards.
+    :type fileShardJournals:    list[str]
+    :param fileIndex:           The location of the merged index.
+    :type fileIndex:            str
+    :param start:               The byte offset in the processed journal table that the first shard is written at.
+    :type start:                int
+    :param isAppend:            Whether the records should be appended to the existing index.
+    :type isAppend:             bool
+
+    """
+
+    with open(fileIndex, 'a' if isAppend else 'w') as fidIndex:
+        if not isAppend:
+            fidIndex.write("PatientID\tOffset\tNumRows\n")
+        for i, j in zip(fileShardIndices, fileShardJournals):
+            with open(i, 'r') as fidShard:
+                _ = fidShard.readline()  # Strip the header.
+                for line in fidShard:
+                    patientID, offset, numRows = line.split('\t')
+                    fidIndex.write("{:s}\t{:d}\t{:s}".format(patientID, int(offset) + start, numRows))
+            start += os.path.getsize(j)
+
+
+def read_records(fidJournalTable, records):
+    """Read the lines of a set of records of a processed journal table.
+
+    :param fidJournalTable: The uncompressed processed journal table, opened in binary mode.
+    :type fidJournalTable:  io.BufferedReader
+    :param records:         The byte offset and number of lines of each record, as returned by find_records.
+    :type records:          list[tuple]
+    :return:                A generator of the lines of the records.
+    :rtype:                 generator
+
+    """
+
+    for offset, numRows in records:
+        fidJournalTable.seek(offset)
+        for _ in range(numRows):
+            yield fidJournalTable.readline()
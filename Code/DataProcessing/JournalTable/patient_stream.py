@@ -0,0 +1,218 @@
+"""Functions to stream the histories of patients from the processed data as NumPy arrays, rather than as dataset files.
+
+The patients and codes are filtered and the histories read exactly as when generating the datasets, so the patients
+streamed are those that would be saved to the datasets. Each patient's history is given as parallel arrays with one
+element per entry, with the codes recorded as their column in the vocabulary of the datasets (the codes in sorted
+order). The histories can be turned into a binary indicator or code count vector for each time step of the datasets
+with time_step_vectors, and grouped into padded minibatches of a fixed number of patients with minibatches. This allows
+models to be trained directly from the processed data, without writing the datasets to disk and parsing them again.
+"""
+
+# Python imports.
+from collections import namedtuple
+
+# User imports.
+from . import generate_datasets
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+Patient = namedtuple(  # The history of a patient, with one element of each array per entry in the history.
+    "Patient", ["patientID", "gender", "codes", "ages", "visits", "years", "val1", "val2"]
+)
+TIME_STEPS = ("History", "Visits", "Visits_C", "Years", "Years_C")  # The time steps the vectors can be created for.
+
+
+class PatientStream:
+    """An iterable of the histories of the patients used in the datasets generated with a configuration."""
+
+    def __init__(self, dirProcessedData, config):
+        """Initialise the stream, filtering the patients and codes.
+
+        :param dirProcessedData:    The location of the directory containing the processed journal table files.
+        :type dirProcessedData:     str
+        :param config:              The object containing the configuration parameters for the flat file generation.
+        :type config:               JsonschemaManipulation.Configuration
+
+        """
+
+        filterResults = generate_datasets.filter_patients(dirProcessedData, config)
+        self._dirProcessedData = dirProcessedData
+        self._isFractional = config.get_param(["DataProcessing", "FractionalAges"])[1]
+        self._minVisits = config.get_param(["DataProcessing", "MinVisits"])[1]
+        self._minYears = config.get_param(["DataProcessing", "MinYears"])[1]
+        self._numPatients = None  # The number of patients streamed, determined when first needed.
+        self._validPatientData = filterResults["ValidPatientData"]
+        self._validCodes = filterResults["ValidCodes"]
+        self.codes = sorted(self._validCodes)  # The code in each column of the vocabulary.
+        self._codeColumns = {j: i for i, j in enumerate(self.codes)}
+
+    def __iter__(self):
+        """Read the histories of the patients, in the order they appear in the journal table.
+
+        As when saving the datasets, a patient is only streamed when they have at least MinVisits unique visits and
+        MinYears unique years, so the patients streamed are those in both the visit and year based datasets. Each
+        iteration reads the histories again from the processed data.
+
+        """
+
+        patientHistories = generate_datasets.read_histories(
+            self._dirProcessedData, self._validPatientData, self._validCodes, self._isFractional
+        )
+        numPatients = 0
+        for patientID, patientHistory in patientHistories:
+            visits = np.array([i["Visit"] for i in patientHistory], dtype=np.int32)
+            years = np.array([i["Year"] for i in patientHistory], dtype=np.int32)
+            if np.unique(visits).size < self._minVisits or np.unique(years).size < self._minYears:
+                # The patient does not have enough time steps to be saved.
+                continue
+            numPatients += 1
+            yield Patient(
+                patientID, self._validPatientData.gender(self._validPatientData.find(patientID)),
+                np.array([self._codeColumns[i["Code"]] for i in patientHistory], dtype=np.int32),
+                np.array([i["Age"] for i in patientHistory]), visits, years,
+                np.array([i["Val1"] for i in patientHistory], dtype=np.float32),
+                np.array([i["Val2"] for i in patientHistory], dtype=np.float32)
+            )
+        self._numPatients = numPatients
+
+    def __len__(self):
+        """Get the number of patients streamed.
+
+        This is only known once the histories have been read, so the first call reads them through if no iteration has
+        been completed.
+
+        """
+
+        if self._numPatients is None:
+            for _ in self:
+                pass
+        return self._numPatients
+
+
+def iter_patients(dirProcessedData, config):
+    """Stream the histories of the patients used in the datasets generated with a configuration.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param config:              The object containing the configuration parameters for the flat file generation.
+    :type config:               JsonschemaManipulation.Configuration
+    :return:                    An iterable of the history of each patient, recorded as a Patient with the ID (str),
+                                    gender ('M' or 'F') and arrays of the code (int32 column in the vocabulary), age
+                                    (int64, or float64 when the ages are fractional), visit (int32), year (int32), Val1
+                                    (float32) and Val2 (float32) of each entry. The codes attribute of the iterable
+                                    records the code in each column of the vocabulary.
+    :rtype:                     PatientStream
+
+    """
+
+    return PatientStream(dirProcessedData, config)
+
+
+def minibatches(patients, numCodes, batchSize, timeStep="History", isBinary=False, isDropLast=False):
+    """Group the time step vectors of patients into minibatches of a fixed number of patients.
+
+    The time steps of the patients in a minibatch are padded with zeros to the length of the longest, with the number of
+    time steps of each patient recorded alongside them.
+
+    :param patients:    The histories of the patients (e.g. a PatientStream).
+    :type patients:     iterable
+    :param numCodes:    The number of codes in the vocabulary.
+    :type numCodes:     int
+    :param batchSize:   The number of patients in each minibatch.
+    :type batchSize:    int
+    :param timeStep:    The time step to create the vectors for (one of TIME_STEPS).
+    :type timeStep:     str
+    :param isBinary:    Whether the vectors should be binary indicators rather than code counts.
+    :type isBinary:     bool
+    :param isDropLast:  Whether a final minibatch with fewer than batchSize patients should be dropped.
+    :type isDropLast:   bool
+    :return:            A generator of the minibatches, each recorded as:
+                            {"PatientIDs": [str], "Genders": np.array (uint8, 1 for male), "Lengths": np.array,
+                             "Ages": np.array (patients x time steps), "Vectors": np.array (patients x time steps x
+                             codes)}
+    :rtype:             generator
+
+    """
+
+    batch = []
+    for patient in patients:
+        batch.append((patient, time_step_vectors(patient, numCodes, timeStep, isBinary)))
+        if len(batch) == batchSize:
+            yield _stack_batch(batch, numCodes, isBinary)
+            batch = []
+    if batch and not isDropLast:
+        yield _stack_batch(batch, numCodes, isBinary)
+
+
+def time_step_vectors(patient, numCodes, timeStep="History", isBinary=False):
+    """Create a vector of the codes in each time step of a patient's history, as in the datasets.
+
+    The time steps are those of the datasets of the same name, so are the patient's entire history (History), each of
+    their visits (Visits) or each year (Years), ordered from oldest to most recent. The cumulative time steps
+    (Visits_C and Years_C) record the codes in a time step and all time steps before it.
+
+    :param patient:     The patient's history.
+    :type patient:      Patient
+    :param numCodes:    The number of codes in the vocabulary.
+    :type numCodes:     int
+    :param timeStep:    The time step to create the vectors for (one of TIME_STEPS).
+    :type timeStep:     str
+    :param isBinary:    Whether the vectors should be binary indicators rather than code counts.
+    :type isBinary:     bool
+    :return:            The age at the final entry in each time step and the vector of each time step (time steps x
+                            codes, uint8 binary indicators or int32 code counts).
+    :rtype:             np.array, np.array
+
+    """
+
+    if timeStep not in TIME_STEPS:
+        raise ValueError("{:s} is not a time step. Choose one of {:s}.".format(timeStep, ', '.join(TIME_STEPS)))
+    if timeStep == "History":
+        stepIndices = np.zeros(patient.codes.size, dtype=np.int64)
+        numSteps = 1 if patient.codes.size else 0
+    else:
+        keys = patient.visits if timeStep.startswith("Visits") else patient.years
+        steps, stepIndices = np.unique(keys, return_inverse=True)
+        numSteps = steps.size
+
+    # Count the codes in each time step, with the age of a time step taken from its final entry.
+    vectors = np.zeros((numSteps, numCodes), dtype=np.int32)
+    np.add.at(vectors, (stepIndices, patient.codes), 1)
+    lastEntries = stepIndices.size - 1 - np.unique(stepIndices[::-1], return_index=True)[1]
+    ages = patient.ages[lastEntries]
+    if timeStep.endswith("_C"):
+        vectors = np.cumsum(vectors, axis=0, dtype=np.int32)
+    if isBinary:
+        vectors = (vectors > 0).astype(np.uint8)
+    return ages, vectors
+
+
+def _stack_batch(batch, numCodes, isBinary):
+    """Stack the time step vectors of a minibatch of patients, padding them to the same number of time steps.
+
+    :param batch:       The history and time step ages and vectors of each patient in the minibatch.
+    :type batch:        list[tuple]
+    :param numCodes:    The number of codes in the vocabulary.
+    :type numCodes:     int
+    :param isBinary:    Whether the vectors are binary indicators rather than code counts.
+    :type isBinary:     bool
+    :return:            The minibatch (see minibatches).
+    :rtype:             dict
+
+    """
+
+    lengths = np.array([ages.size for _, (ages, _) in batch], dtype=np.int64)
+    maxLength = int(lengths.max())
+    ageType = np.result_type(*[ages.dtype for _, (ages, _) in batch])
+    batchAges = np.zeros((len(batch), maxLength), dtype=ageType)
+    batchVectors = np.zeros((len(batch), maxLength, numCodes), dtype=np.uint8 if isBinary else np.int32)
+    for ind, (_, (ages, vectors)) in enumerate(batch):
+        batchAges[ind, :ages.size] = ages
+        batchVectors[ind, :ages.size] = vectors
+    return {
+        "PatientIDs": [i.patientID for i, _ in batch],
+        "Genders": np.array([i.gender == 'M' for i, _ in batch], dtype=np.uint8), "Lengths": lengths,
+        "Ages": batchAges, "Vectors": batchVectors
+    }
@@ -0,0 +1,161 @@
+"""Class to match patient IDs and codes against the keep/ignore patterns in the configuration."""
+
+# Python imports.
+import re
+
+# Globals.
+REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")  # Characters that stop a pattern from being treated as a literal.
+
+
+class PatternMatcher:
+    """Match strings against a collection of patterns, each of which must match the entire string.
+
+    A string matches if any one pattern matches it, as if the patterns had been joined into a single alternation with
+    each pattern anchored at the start and end of the string. To keep the cost of a match from growing with the number
+    of patterns, each pattern is sorted into one of three kinds:
+        Literal - a pattern with no regular expression metacharacters (e.g. 26046). Matched with a set lookup.
+        Prefix - a literal followed by .* (e.g. C10.*). Matched by walking a prefix trie.
+        Regex - any other pattern (e.g. G30.. or C10[EF]). Matched with a single compiled regular expression.
+
+    """
+
+    def __init__(self, patterns, matchIfEmpty):
+        """Initialise the matcher.
+
+        :param patterns:        The patterns to match against.
+        :type patterns:         list[str]
+        :param matchIfEmpty:    Whether every string should match when there are no patterns (as is the case for
+                                    patterns of strings to keep), or no string should match (as is the case for
+                                    patterns of strings to ignore).
+        :type matchIfEmpty:     bool
+
+        """
+
+        self._isEmpty = not patterns
+        self._matchIfEmpty = matchIfEmpty
+        self._literals = set()
+        self._prefixes = _PrefixTrie()
+        self.counts = {"Literal": 0, "Prefix": 0, "Regex": 0}  # The number of patterns of each kind, with repeats.
+        regexes = []
+        for i in patterns:
+            if _is_literal(i):
+                self.counts["Literal"] += 1
+                self._literals.add(i)
+            elif i.endswith(".*") and _is_literal(i[:-2]):
+                self.counts["Prefix"] += 1
+                self._prefixes.add(i[:-2])
+            else:
+                self.counts["Regex"] += 1
+                regexes.append("{:s}$".format(i))
+        self._regex = re.compile('|'.join(regexes)) if regexes else None
+
+    @classmethod
+    def from_id_file(cls, fileIDs, matchIfEmpty):
+        """Create a matcher for the IDs listed in a file, with one ID per line.
+
+        Each ID is matched literally rather than as a pattern, so the IDs are read straight into the set of literals
+        without being classified. Blank lines and surrounding whitespace are ignored.
+
+        :param fileIDs:         The location of the file of IDs.
+        :type fileIDs:          str
+        :param matchIfEmpty:    Whether every string should match when the file contains no IDs.
+        :type matchIfEmpty:     bool
+        :return:                The matcher for the IDs.
+        :rtype:                 PatternMatcher
+
+        """
+
+        matcher = cls([], matchIfEmpty)
+        with open(fileIDs, 'r') as fidIDs:
+            ids = [i.strip() for i in fidIDs]
+        ids = [i for i in ids if i]
+        matcher._literals = set(ids)
+        matcher._isEmpty = not matcher._literals
+        matcher.counts["Literal"] = len(ids)
+        return matcher
+
+    def match(self, string):
+        """Determine whether a string matches any of the patterns.
+
+        :param string:  The string to match.
+        :type string:   str
+        :return:        Whether the string matches.
+        :rtype:         bool
+
+        """
+
+        if self._isEmpty:
+            return self._matchIfEmpty
+        return (string in self._literals) or self._prefixes.match(string) or \
+            (self._regex is not None and self._regex.match(string) is not None)
+
+
+class _PrefixTrie:
+    """A trie used to determine whether any of a collection of prefixes is a prefix of a string."""
+
+    _TERMINAL = None  # The key marking that the path to a node is a complete prefix.
+
+    def __init__(self):
+        """Initialise an empty trie."""
+
+        self._root = {}
+        self._numPrefixes = 0
+
+    def __len__(self):
+        """Get the number of prefixes in the trie.
+
+        :return:    The number of prefixes.
+        :rtype:     int
+
+        """
+
+        return self._numPrefixes
+
+    def add(self, prefix):
+        """Add a prefix to the trie.
+
+        :param prefix:  The prefix to add.
+        :type prefix:   str
+
+        """
+
+        node = self._root
+        for i in prefix:
+            node = node.setdefault(i, {})
+        if self._TERMINAL not in node:
+            node[self._TERMINAL] = True
+            self._numPrefixes += 1
+
+    def match(self, string):
+        """Determine whether any prefix in the trie is a prefix of a string.
+
+        :param string:  The string to match.
+        :type string:   str
+        :return:        Whether the string starts with any of the prefixes.
+        :rtype:         bool
+
+        """
+
+        node = self._root
+        if self._TERMINAL in node:
+            return True
+        for i in string:
+            node = node.get(i)
+            if node is None:
+                return False
+            if self._TERMINAL in node:
+                return True
+        return False
+
+
+def _is_literal(pattern):
+    """Determine whether a pattern contains no regular expression metacharacters.
+
+    :param pattern: The pattern to check.
+    :type pattern:  str
+    :return:        Whether the pattern only matches itself.
+    :rtype:         bool
+
+    """
+
+    return REGEX_METACHARACTERS.isdisjoint(pattern)
@@ -2,124 +2,886 @@
 
 # Python imports.
 from collections import defaultdict
-import datetime
+import functools
 import logging
+import multiprocessing
 import os
+import shutil
 import sys
 
 # User imports.
+from . import cache_manifest
+from . import columnar_cache
+from . import demographics_store
+from . import external_sort
+from . import journal_database
 from . import parse_patient_entry
+from . import patient_index
+from Utilities import compressed_files
+from Utilities import instrumentation
+from Utilities import iso_dates
+from Utilities import pipeline
+from Utilities import read_reversed_lines
 
 # Globals.
 LOGGER = logging.getLogger(__name__)
+PIPELINE_BATCH_SIZE = 64  # The number of patient records passed to the writing thread at once.
+READ_BLOCK_SIZE = 1 << 22  # The approximate number of bytes of the journal table to read at once.
+_WORKER_PATIENT_DATA = None  # The patient demographics made available to the worker processes.
 
 
-def main(dirSQLFiles, dirProcessedData):
+def main(dirSQLFiles, dirProcessedData, numProcesses=1, sortMemoryLimit=None, compression=None, queueSize=0):
     """Process a journal and patient table and convert them to a more standardised TSV format.
 
+    Alongside the TSV files, a binary columnar cache of the processed journal table is written for quicker dataset
+    generation (see columnar_cache for its format), along with a manifest of the source files that were processed
+    (see cache_manifest).
+
+    When more than one process is requested, the journal table is split into byte ranges that start and end on patient
+    boundaries. Each range is then processed independently and the results merged back together in file order, giving
+    the same output as processing the journal table in a single process.
+
+    By default a patient's entries are assumed to be recorded consecutively in the journal table. When a sort memory
+    limit is supplied, the entries are instead sorted by patient ID and date with an external merge sort (see
+    external_sort) before being processed, so that journal tables in any order can be processed. Sorting is performed
+    in a single process, and the processed data can not be updated incrementally (see update) as appended entries may
+    belong to any patient.
+
+    When a queue size is supplied, the journal table is read, processed and written by a pipeline of threads
+    connected by queues of at most that many blocks (see pipeline), so that reading and writing overlap the
+    processing. The pipeline is only used when the journal table is processed by a single process.
+
+    The SQL files may be compressed (see compressed_files for the codecs supported), in which case they are found by
+    their extension (e.g. journal.sql.gz). A compressed journal table is processed in a single process, and neither a
+    compressed journal table nor a compressed processed journal table can be updated incrementally.
+
     :param dirSQLFiles:         The location of the directory containing the SQL files of the patient data.
     :type dirSQLFiles:          str
     :param dirProcessedData:    The location to save the processed journal table data.
     :type dirProcessedData:     str
+    :param numProcesses:        The number of processes to use when processing the journal table.
+    :type numProcesses:         int
+    :param sortMemoryLimit:     The approximate number of bytes of memory to use when sorting the journal table, or None
+                                    if the journal table should not be sorted.
+    :type sortMemoryLimit:      int | None
+    :param compression:         The codec to compress the processed journal table with, or None for no compression.
+    :type compression:          str | None
+    :param queueSize:           The maximum number of blocks queued between the reading, processing and writing
+                                    threads, or 0 to read, process and write the journal table in a single thread.
+    :type queueSize:            int
+
+    """
+
+    fileJournalTable, filePatientTable = _get_source_files(dirSQLFiles)
+
+    LOGGER.info("Starting journal table pre-processing.")
+
+    # Record the state of the source files before processing them, so that only the bytes recorded are processed. The
+    # whole of a compressed journal table is processed, as its size does not give the amount of data in it.
+    sources = cache_manifest.describe_sources(dirSQLFiles)
+    isCompressed = compressed_files.get_codec(fileJournalTable) is not None
+    journalSize = None if isCompressed else sources["journal.sql"]["Size"]
+
+    # Convert the journal table into a standard format, ignoring any entries that are missing either a patient ID or
+    # a code.
+    patientData = demographics_store.load_patient_table(filePatientTable)
+    isSorted = sortMemoryLimit is not None
+    if isSorted:
+        if numProcesses > 1:
+            LOGGER.info("Sorting of the journal table uses a single process.")
+        statistics = _process_sorted_journal_table(
+            fileJournalTable, journalSize, patientData, dirProcessedData, sortMemoryLimit, compression, queueSize
+        )
+    else:
+        statistics = _process_journal_table(
+            fileJournalTable, 0, journalSize, patientData, dirProcessedData, numProcesses, False, compression,
+            queueSize
+        )
+    isUpdatable = not (isSorted or isCompressed or compression)
+    finalRecord = _find_final_record(fileJournalTable, journalSize) if isUpdatable else None
+    _write_summary(dirProcessedData, statistics)
+    cache_manifest.write(
+        dirProcessedData, sources, finalRecord,
+        {"NumEvents": statistics["NumEvents"], "NumValidEvents": statistics["NumValidEvents"]}, isSorted, compression
+    )
+    instrumentation.count("Rows", statistics["NumEvents"])
+    instrumentation.count_files("BytesRead", [fileJournalTable, filePatientTable])
+    instrumentation.count_files("BytesWritten", [dirProcessedData])
+
+
+def main_database(connection, dirProcessedData, batchSize=journal_database.BATCH_SIZE, compression=None, queueSize=0):
+    """Process the journal and patient tables of a database and convert them to the standardised TSV format.
+
+    The tables are read through a DB-API connection (see journal_database), with the database ordering the journal
+    table by patient ID and date, and the entries are then processed in the same way as those of an SQL dump. The
+    tables are read by a single process, and as there are no source files to record, no manifest is written and the
+    processed data can not be updated incrementally.
+
+    :param connection:          The DB-API connection to the database containing the journal and patient tables.
+    :type connection:           object
+    :param dirProcessedData:    The location to save the processed journal table data.
+    :type dirProcessedData:     str
+    :param batchSize:           The number of rows to fetch from the database at once.
+    :type batchSize:            int
+    :param compression:         The codec to compress the processed journal table with, or None for no compression.
+    :type compression:          str | None
+    :param queueSize:           The maximum number of batches of patient records queued for the writing thread, or 0
+                                    to write the records as they are completed. The rows are always fetched on the
+                                    calling thread, as DB-API connections can not generally be shared between threads.
+    :type queueSize:            int
+
+    """
+
+    LOGGER.info("Starting journal table pre-processing from a database.")
+    patientData = journal_database.read_patients(connection, batchSize)
+    entryBlocks = journal_database.read_entries(connection, batchSize)
+    statistics = _process_entry_blocks(entryBlocks, patientData, dirProcessedData, compression, queueSize)
+    _write_summary(dirProcessedData, statistics)
+    instrumentation.count("Rows", statistics["NumEvents"])
+    instrumentation.count_files("BytesWritten", [dirProcessedData])
+
+
+def update(dirSQLFiles, dirProcessedData, numProcesses=1, sources=None, queueSize=0):
+    """Update a processed journal table with the data that has been appended to its source files.
+
+    The final patient record in the processed data is removed and re-processed along with the appended data, as the
+    appended data may continue the final patient's history. The processed data must have a manifest recording a final
+    record (see cache_manifest.check).
+
+    The manifest is removed before the processed data is changed and only written again once the update has finished,
+    so that processed data left part way through an update (e.g. when the update fails) is stale and is re-created
+    from scratch by the next run.
+
+    :param dirSQLFiles:         The location of the directory containing the SQL files of the patient data.
+    :type dirSQLFiles:          str
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param numProcesses:        The number of processes to use when processing the journal table.
+    :type numProcesses:         int
+    :param sources:             The state of the source files to update to, as returned by cache_manifest.check.
+                                    Defaults to the current state of the source files.
+    :type sources:              dict
+    :param queueSize:           The maximum number of blocks queued between the reading, processing and writing
+                                    threads, or 0 to read, process and write the journal table in a single thread.
+    :type queueSize:            int
+
+    """
+
+    fileJournalTable, filePatientTable = _get_source_files(dirSQLFiles)
+    sources = sources if sources else cache_manifest.describe_sources(dirSQLFiles)
+    journalSize = sources["journal.sql"]["Size"]
+    manifest = cache_manifest.read(dirProcessedData)
+    finalRecord = manifest["FinalRecord"]
+    cache_manifest.remove(dirProcessedData)
+
+    LOGGER.info("Updating the processed journal table from byte {:d} of the journal table.".format(
+        finalRecord["Offset"]
+    ))
+
+    # Remove the final patient record from the processed data.
+    fileProcessedJournal = os.path.join(dirProcessedData, "JournalTable.tsv")
+    filePatientDemographics = os.path.join(dirProcessedData, "PatientDemographics.tsv")
+    _truncate_final_lines(fileProcessedJournal, finalRecord["NumValidEvents"])
+    _truncate_final_lines(filePatientDemographics, 1)
+    if os.path.isfile(os.path.join(dirProcessedData, patient_index.INDEX_FILE)):
+        _truncate_final_lines(os.path.join(dirProcessedData, patient_index.INDEX_FILE), 1)
+    columnar_cache.drop_final_record(os.path.join(dirProcessedData, columnar_cache.CACHE_DIRECTORY))
+
+    # Determine the statistics of the data that remains.
+    previousStatistics = {
+        "NumEvents": manifest["Statistics"]["NumEvents"] - finalRecord["NumEvents"],
+        "NumValidEvents": manifest["Statistics"]["NumValidEvents"] - finalRecord["NumValidEvents"],
+        "Patients": set(), "CodeValues": {}
+    }
+    with open(filePatientDemographics, 'r') as fidDemographics:
+        _ = fidDemographics.readline()  # Strip off the header.
+        for line in fidDemographics:
+            previousStatistics["Patients"].add(line.split('\t', 1)[0])
+    with open(os.path.join(dirProcessedData, "Codes.txt"), 'r') as fidCodes:
+        _ = fidCodes.readline()  # Strip off the header.
+        for line in fidCodes:
+            chunks = line.rstrip('\n').split('\t')
+            previousStatistics["CodeValues"][chunks[0]] = {"Val1": chunks[1] == '1', "Val2": chunks[2] == '1'}
+
+    # Process the final record and appended data.
+    patientData = demographics_store.load_patient_table(filePatientTable)
+    statistics = _process_journal_table(
+        fileJournalTable, finalRecord["Offset"], journalSize, patientData, dirProcessedData, numProcesses, True,
+        queueSize=queueSize
+    )
+    instrumentation.count("Rows", statistics["NumEvents"])
+    instrumentation.count("BytesRead", journalSize - finalRecord["Offset"])
+    instrumentation.count_files("BytesRead", [filePatientTable])
+    statistics = _merge_statistics([previousStatistics, statistics])
+    _write_summary(dirProcessedData, statistics)
+    cache_manifest.write(
+        dirProcessedData, sources, _find_final_record(fileJournalTable, journalSize),
+        {"NumEvents": statistics["NumEvents"], "NumValidEvents": statistics["NumValidEvents"]}
+    )
+
+
+def split_journal_table(fileJournalTable, numRanges, start=0, end=None):
+    """Split a journal table into byte ranges that begin and end on patient boundaries.
+
+    A boundary is placed at the first line of a patient's record, so no patient's (consecutively recorded) history is
+    split between two ranges. As a result, fewer ranges than requested may be returned when the journal table contains
+    few patients.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param numRanges:           The number of ranges to split the journal table into.
+    :type numRanges:            int
+    :param start:               The byte offset of the start of the portion of the journal table to split (must be the
+                                    start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the portion of the journal table to split (defaults to the
+                                    size of the file).
+    :type end:                  int
+    :return:                    The (start, end) byte offsets of the non-empty ranges in file order. A compressed
+                                    journal table can not be split, so is returned as a single range.
+    :rtype:                     list[tuple]
+
+    """
+
+    if compressed_files.get_codec(fileJournalTable) is not None:
+        return [(start, end)]
+    end = os.path.getsize(fileJournalTable) if end is None else end
+    boundaries = [start]
+    with open(fileJournalTable, 'rb') as fidJournalTable:
+        for i in range(1, max(numRanges, 1)):
+            boundary = _find_patient_boundary(fidJournalTable, start + ((end - start) * i) // numRanges)
+            boundaries.append(min(max(boundary, boundaries[-1]), end))
+    boundaries.append(end)
+    return [(i, j) for i, j in zip(boundaries, boundaries[1:]) if j > i]
+
+
+def _decode_line(line):
+    """Decode a line of the journal table read in binary mode.
+
+    A Windows line ending is converted to a newline in the same manner as reading the file in text mode, so that the
+    final value of the line is not left with the carriage return and part of the insert syntax when it is parsed.
+
+    :param line:    The line of the journal table.
+    :type line:     bytes
+    :return:        The decoded line.
+    :rtype:         str
+
+    """
+
+    if line.endswith(b"\r\n"):
+        line = line[:-2] + b"\n"
+    return line.decode()
+
+
+def _find_final_record(fileJournalTable, end):
+    """Find where the final patient record begins in a journal table.
+
+    The final record begins after the last valid line with a patient ID that differs from the ID on the final valid
+    line of the journal table.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param end:                 The byte offset of the end of the journal table.
+    :type end:                  int
+    :return:                    The byte offset where the final record begins along with the number of events and valid
+                                    events at or after the offset, recorded as
+                                    {"Offset": int, "NumEvents": int, "NumValidEvents": int}. None is returned if there
+                                    are no valid events in the journal table.
+    :rtype:                     dict | None
+
+    """
+
+    finalPatient = None
+    finalRecord = {"Offset": 0, "NumEvents": 0, "NumValidEvents": 0}
+    for offset, line in read_reversed_lines.main(fileJournalTable, end):
+        if not line.startswith(b"insert"):
+            continue
+        patientID = _get_valid_patient_id(_decode_line(line))
+        if patientID is not None:
+            if finalPatient is None:
+                finalPatient = patientID
+            elif patientID != finalPatient:
+                # Found the end of the preceding patient's record.
+                finalRecord["Offset"] = offset + len(line)
+                break
+            finalRecord["NumValidEvents"] += 1
+        finalRecord["NumEvents"] += 1
+    return finalRecord if finalPatient is not None else None
+
+
+def _find_patient_boundary(fidJournalTable, position):
+    """Find the first patient boundary in a journal table after a given byte offset.
+
+    The boundary is the start of the first valid line after the offset with a patient ID that differs from the ID of the
+    first valid line after the offset.
+
+    :param fidJournalTable: The journal table opened in binary mode.
+    :type fidJournalTable:  io.BufferedReader
+    :param position:        The byte offset to start searching from.
+    :type position:         int
+    :return:                The byte offset of the boundary (the size of the file if no boundary exists).
+    :rtype:                 int
+
+    """
+
+    # Move to the start of the next line.
+    fidJournalTable.seek(position)
+    if position > 0:
+        position += len(fidJournalTable.readline())
+
+    firstPatient = None
+    for line in fidJournalTable:
+        patientID = _get_valid_patient_id(_decode_line(line))
+        if patientID is not None:
+            if firstPatient is None:
+                firstPatient = patientID
+            elif patientID != firstPatient:
+                return position
+        position += len(line)
+    return position
+
+
+def _get_source_files(dirSQLFiles):
+    """Get the locations of the journal and patient table SQL files, exiting if either is missing.
+
+    :param dirSQLFiles: The location of the directory containing the SQL files of the patient data.
+    :type dirSQLFiles:  str
+    :return:            The locations of the journal table and patient table SQL files.
+    :rtype:             tuple
 
     """
 
     # Get the files for the SQL tables we're interested in. These would be the journal table and the patient table.
     isError = False
-    fileJournalTable = os.path.join(dirSQLFiles, "journal.sql")
-    if not os.path.isfile(fileJournalTable):
-        LOGGER.error("There is no journal.sql file within the input location supplied ({:s}).".format(fileJournalTable))
+    fileJournalTable = compressed_files.find_file(os.path.join(dirSQLFiles, "journal.sql"))
+    if fileJournalTable is None:
+        LOGGER.error(
+            "There is no journal.sql file (compressed or not) within the input location supplied ({:s}).".format(
+                dirSQLFiles
+            )
+        )
         isError = True
-    filePatientTable = os.path.join(dirSQLFiles, "patient.sql")
-    if not os.path.isfile(filePatientTable):
-        LOGGER.error("There is no patient.sql file within the input location supplied ({:s}).".format(filePatientTable))
+    filePatientTable = compressed_files.find_file(os.path.join(dirSQLFiles, "patient.sql"))
+    if filePatientTable is None:
+        LOGGER.error(
+            "There is no patient.sql file (compressed or not) within the input location supplied ({:s}).".format(
+                dirSQLFiles
+            )
+        )
         isError = True
     if isError:
         print("\nErrors were found while attempting to access the input files during flat file generation.\n")
         sys.exit()
+    return fileJournalTable, filePatientTable
 
-    LOGGER.info("Starting journal table pre-processing.")
 
-    # Extract the patient demographics of interest.
-    patientData = {}
-    with open(filePatientTable, 'r') as fidPatientTable:
-        for line in fidPatientTable:
-            if line.startswith("insert"):
-                # Found a line containing patient details.
-                line = line[84:]  # Strip of the SQL insert syntax at the beginning.
-                line = line[:-3]  # Strip off the ");\n" at the end.
-                chunks = line.split(',')
-                patientID = chunks[0]
-                DOB = chunks[1]
-                patientGender = 'M' if chunks[3] == '1' else 'F'  # A '1' indicates a male and a '0' a female.
-                patientData[patientID] = {"DOB": DOB, "Gender": patientGender}
+def _get_valid_patient_id(line):
+    """Get the ID of the patient recorded on a line of the journal table if the line is a valid event.
+
+    :param line:    The line of the journal table.
+    :type line:     str
+    :return:        The patient ID, or None if the line is not an event with both a patient ID and code.
+    :rtype:         str | None
+
+    """
+
+    if line.startswith("insert"):
+        entries = parse_patient_entry.main(line)
+        if entries[0] and entries[1]:
+            return entries[0]
+    return None
+
+
+def _initialise_worker(patientData):
+    """Make the patient demographics available to a worker process.
+
+    :param patientData: The demographics of each patient.
+    :type patientData:  demographics_store.DemographicsStore
+
+    """
+
+    global _WORKER_PATIENT_DATA
+    _WORKER_PATIENT_DATA = patientData
+    instrumentation.start_worker()
+
+
+def _merge_statistics(shardStatistics):
+    """Merge the statistics from the processing of multiple ranges of the journal table.
+
+    :param shardStatistics: The statistics from each range, as returned by _process_entries.
+    :type shardStatistics:  list[dict]
+    :return:                The combined statistics.
+    :rtype:                 dict
+
+    """
+
+    statistics = {"NumEvents": 0, "NumValidEvents": 0, "Patients": set(), "CodeValues": {}}
+    for i in shardStatistics:
+        statistics["NumEvents"] += i["NumEvents"]
+        statistics["NumValidEvents"] += i["NumValidEvents"]
+        statistics["Patients"] |= i["Patients"]
+        for code, values in i["CodeValues"].items():
+            if code in statistics["CodeValues"]:
+                statistics["CodeValues"][code]["Val1"] |= values["Val1"]
+                statistics["CodeValues"][code]["Val2"] |= values["Val2"]
+            else:
+                statistics["CodeValues"][code] = values
+    return statistics
+
+
+def _open_index(dirProcessedData, fidProcessed, compression=None, isAppend=False):
+    """Open the writer of the index of the patient records in the processed journal table, if it can be indexed.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param fidProcessed:        The file the processed journal table is being written to, positioned where the first
+                                    record will be written.
+    :type fidProcessed:         io.TextIOWrapper
+    :param compression:         The codec the processed journal table is compressed with, or None for no compression.
+    :type compression:          str | None
+    :param isAppend:            Whether the records should be appended to the existing index.
+    :type isAppend:             bool
+    :return:                    The writer of the index, or None if the processed journal table is compressed (and so
+                                    can not be read from a given offset) or is being appended to without an index.
+    :rtype:                     patient_index.IndexWriter | None
+
+    """
+
+    fileIndex = os.path.join(dirProcessedData, patient_index.INDEX_FILE)
+    if compression is not None or (isAppend and not os.path.isfile(fileIndex)):
+        return None
+    return patient_index.IndexWriter(fileIndex, fidProcessed.tell(), isAppend)
+
+
+def _parse_line_blocks(fileJournalTable, start, end, queueSize=0):
+    """Parse the entries within a byte range of the journal table in blocks.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param start:               The byte offset of the start of the range (must be the start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the range.
+    :type end:                  int
+    :param queueSize:           The maximum number of blocks of lines to read ahead on a separate thread, or 0 to read
+                                    the lines as they are needed.
+    :type queueSize:            int
+    :return:                    A generator of blocks of the parsed entries on the lines that contain information about
+                                    a row in the journal table.
+    :rtype:                     generator
+
+    """
+
+    lineBlocks = _read_line_blocks(fileJournalTable, start, end)
+    if queueSize:
+        lineBlocks = pipeline.Prefetcher(lineBlocks, "ProcessTableReader", queueSize)
+    for lines in lineBlocks:
+        yield parse_patient_entry.main_batch([i for i in lines if i.startswith("insert")])
+
+
+def _process_entries(entryBlocks, patientData, fidProcessed, fidDemographics, cacheWriter, indexWriter=None,
+                     queueSize=0):
+    """Convert parsed journal table entries into the standard format.
+
+    A patient's record is taken to be their consecutive entries, and any entries that are missing either a patient ID
+    or a code are ignored. When a queue size is supplied, the records are written by a separate thread.
+
+    :param entryBlocks:         The blocks of parsed journal table entries.
+    :type entryBlocks:          iterable
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param fidProcessed:        The file to write the processed journal table to.
+    :type fidProcessed:         io.TextIOWrapper
+    :param fidDemographics:     The file to write the patient demographics to.
+    :type fidDemographics:      io.TextIOWrapper
+    :param cacheWriter:         The writer of the columnar cache of the processed journal table.
+    :type cacheWriter:          columnar_cache.CacheWriter
+    :param indexWriter:         The writer of the index of the patient records, or None if no index is written.
+    :type indexWriter:          patient_index.IndexWriter | None
+    :param queueSize:           The maximum number of batches of patient records queued for the writing thread, or 0
+                                    to write the records as they are completed.
+    :type queueSize:            int
+    :return:                    The statistics about the entries, recorded as:
+                                    {"NumEvents": int, "NumValidEvents": int, "Patients": set,
+                                     "CodeValues": {code: {"Val1": bool, "Val2": bool}}}
+    :rtype:                     dict
+
+    """
 
-    # Convert the journal table into a standard format, ignoring any entries that are missing either a patient ID or
-    # a code.
-    fileProcessedJournal = os.path.join(dirProcessedData, "JournalTable.tsv")
-    filePatientDemographics = os.path.join(dirProcessedData, "PatientDemographics.tsv")
     numEvents = 0
     numValidEvents = 0
     currentPatient = None  # The ID of the patient who's record is currently being built.
     patientHistory = defaultdict(list)  # The data for the current patient.
     codesPatientHas = set()  # The codes that the current patient is associated with.
-    uniqueCodes = set()  # The codes used in the dataset.
-    uniquePatients = set()  # The patients in the dataset.
+    uniquePatients = set()  # The patients in the range.
     codeAssociatedValues = defaultdict(lambda: {"Val1": False, "Val2": False})  # Value types associated with codes.
-    with open(fileJournalTable, 'r') as fidJournalTable, open(fileProcessedJournal, 'w') as fidProcessed, \
-            open(filePatientDemographics, 'w') as fidDemographics:
-        # Write headers.
-        fidProcessed.write("PatientID\tCode\tDate\tYear\tVisitNumber\tVal1\tVal2\tFreeText\n")
-        fidDemographics.write("PatientID\tDOB\tGender\tCodesPatientHas\n")
-
-        # Process journal table.
-        for line in fidJournalTable:
-            if line.startswith("insert"):
-                # The line contains information about a row in the journal table.
-                numEvents += 1
-                entries = parse_patient_entry.main(line)
+    writerStage = (
+        pipeline.WriterStage("ProcessTableWriter", queueSize, PIPELINE_BATCH_SIZE) if queueSize else None
+    )
+    writePatient = _write_patient if writerStage is None else functools.partial(writerStage.submit, _write_patient)
+    for block in instrumentation.timed_iter(entryBlocks, "Parsing"):
+        numEvents += len(block)
+        with instrumentation.timer("Aggregation"):
+            for entries in block:
                 patientID = entries[0]
                 code = entries[1]
-                date = datetime.datetime.strptime(entries[2], "%Y-%m-%d")  # Convert YYYY-MM-DD date to datetime.
+                date = iso_dates.to_ordinal(entries[2])  # Convert YYYY-MM-DD date to a day ordinal.
 
                 if patientID and code:
                     # The entry is valid as it has both a patient ID and code recorded for it.
                     numValidEvents += 1
-                    uniqueCodes.add(code)
-                    codesPatientHas.add(code)
                     uniquePatients.add(patientID)
                     codeAssociatedValues[code]["Val1"] |= float(entries[3]) != 0
                     codeAssociatedValues[code]["Val2"] |= float(entries[4]) != 0
 
                     if patientID != currentPatient and currentPatient:
-                        # A new patient has been found and this is not the first line of the file, so record the old
+                        # A new patient has been found and this is not the first entry, so record the old
                         # patient and reset the patient data for the new patient.
-
-                        # Write out the patient demographic information.
-                        fidDemographics.write(
-                            "{:s}\t{:s}\t{:s}\t{:s}\n".format(
-                                currentPatient, patientData[currentPatient]["DOB"],
-                                patientData[currentPatient]["Gender"], ','.join(sorted(codesPatientHas))
+                        with instrumentation.timer("Writing"):
+                            writePatient(
+                                currentPatient, patientHistory, codesPatientHas, patientData, fidProcessed,
+                                fidDemographics, cacheWriter, indexWriter
                             )
-                        )
-
-                        # Write out the patient's history sorted by date from oldest to newest.
-                        visitNumber = -1
-                        for i in sorted(patientHistory):
-                            visitNumber += 1
-                            for j in patientHistory[i]:
-                                j.insert(3, j[2][:4])
-                                j.insert(4, str(visitNumber))
-                                fidProcessed.write("{:s}\n".format('\t'.join(j)))
-
-                        # Reset the history and record of codes the patient has to prepare for the next patient.
-                        patientHistory.clear()
+                        patientHistory = defaultdict(list)
                         codesPatientHas = set()
                     currentPatient = patientID
 
                     # Add the entry to the patient's history.
+                    codesPatientHas.add(code)
                     patientHistory[date].append(entries)
 
+    # Record the final patient.
+    if currentPatient:
+        with instrumentation.timer("Writing"):
+            writePatient(
+                currentPatient, patientHistory, codesPatientHas, patientData, fidProcessed, fidDemographics,
+                cacheWriter, indexWriter
+            )
+    if writerStage is not None:
+        writerStage.close()
+
+    return {
+        "NumEvents": numEvents, "NumValidEvents": numValidEvents, "Patients": uniquePatients,
+        "CodeValues": dict(codeAssociatedValues)
+    }
+
+
+def _process_entry_blocks(entryBlocks, patientData, dirProcessedData, compression=None, queueSize=0):
+    """Convert blocks of parsed journal table entries, ordered by patient, into the standard format in a single process.
+
+    :param entryBlocks:         The blocks of parsed entries, with each entry a list of fields as returned by
+                                    parse_patient_entry.main.
+    :type entryBlocks:          iterable
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param dirProcessedData:    The location to save the processed journal table data.
+    :type dirProcessedData:     str
+    :param compression:         The codec to compress the processed journal table with, or None for no compression.
+    :type compression:          str | None
+    :param queueSize:           The maximum number of batches of patient records queued for the writing thread, or 0
+                                    to write the records as they are completed.
+    :type queueSize:            int
+    :return:                    The statistics about the entries, as returned by _process_entries.
+    :rtype:                     dict
+
+    """
+
+    fileProcessedJournal = compressed_files.add_extension(
+        os.path.join(dirProcessedData, "JournalTable.tsv"), compression
+    )
+    filePatientDemographics = os.path.join(dirProcessedData, "PatientDemographics.tsv")
+    dirCache = os.path.join(dirProcessedData, columnar_cache.CACHE_DIRECTORY)
+    with compressed_files.open_file(fileProcessedJournal, 'w', newline='\n') as fidProcessed, \
+            open(filePatientDemographics, 'w') as fidDemographics:
+        _write_headers(fidProcessed, fidDemographics)
+        cacheWriter = columnar_cache.CacheWriter(dirCache)
+        indexWriter = _open_index(dirProcessedData, fidProcessed, compression)
+        statistics = _process_entries(
+            entryBlocks, patientData, fidProcessed, fidDemographics, cacheWriter, indexWriter, queueSize
+        )
+        cacheWriter.close()
+        if indexWriter is not None:
+            indexWriter.close()
+    return statistics
+
+
+def _process_journal_range(fileJournalTable, start, end, patientData, fidProcessed, fidDemographics, cacheWriter,
+                           indexWriter=None, queueSize=0):
+    """Convert a range of the journal table into the standard format.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param start:               The byte offset of the start of the range (must be the start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the range.
+    :type end:                  int
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param fidProcessed:        The file to write the processed journal table to.
+    :type fidProcessed:         io.TextIOWrapper
+    :param fidDemographics:     The file to write the patient demographics to.
+    :type fidDemographics:      io.TextIOWrapper
+    :param cacheWriter:         The writer of the columnar cache of the processed journal table.
+    :type cacheWriter:          columnar_cache.CacheWriter
+    :param indexWriter:         The writer of the index of the patient records, or None if no index is written.
+    :type indexWriter:          patient_index.IndexWriter | None
+    :param queueSize:           The maximum number of blocks queued between the reading, processing and writing
+                                    threads, or 0 to read, process and write the range in a single thread.
+    :type queueSize:            int
+    :return:                    The statistics about the range, as returned by _process_entries.
+    :rtype:                     dict
+
+    """
+
+    return _process_entries(
+        _parse_line_blocks(fileJournalTable, start, end, queueSize), patientData, fidProcessed, fidDemographics,
+        cacheWriter, indexWriter, queueSize
+    )
+
+
+def _process_journal_table(fileJournalTable, start, end, patientData, dirProcessedData, numProcesses, isAppend,
+                           compression=None, queueSize=0):
+    """Convert a range of the journal table into the standard format, in parallel if multiple processes are requested.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param start:               The byte offset of the start of the range (must be the start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the range.
+    :type end:                  int
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param dirProcessedData:    The location to save the processed journal table data.
+    :type dirProcessedData:     str
+    :param numProcesses:        The number of processes to use when processing the journal table.
+    :type numProcesses:         int
+    :param isAppend:            Whether the range should be appended to the existing processed data.
+    :type isAppend:             bool
+    :param compression:         The codec to compress the processed journal table with, or None for no compression.
+                                    Compressed files can not be appended to.
+    :type compression:          str | None
+    :param queueSize:           The maximum number of blocks queued between the reading, processing and writing
+                                    threads when the range is processed by a single process, or 0 to not use threads.
+    :type queueSize:            int
+    :return:                    The statistics about the range, as returned by _process_entries.
+    :rtype:                     dict
+
+    """
+
+    fileProcessedJournal = compressed_files.add_extension(
+        os.path.join(dirProcessedData, "JournalTable.tsv"), compression
+    )
+    filePatientDemographics = os.path.join(dirProcessedData, "PatientDemographics.tsv")
+    dirCache = os.path.join(dirProcessedData, columnar_cache.CACHE_DIRECTORY)
+    fileMode = 'a' if isAppend else 'w'
+    journalRanges = split_journal_table(fileJournalTable, numProcesses, start, end)
+    if numProcesses > 1 and compressed_files.get_codec(fileJournalTable) is not None:
+        LOGGER.info("The journal table is compressed, so it is processed using a single process.")
+    if len(journalRanges) > 1:
+        # Process the byte ranges of the journal table in parallel, with each range written to its own shard files.
+        LOGGER.info("Processing the journal table as {:d} byte ranges using {:d} processes.".format(
+            len(journalRanges), numProcesses
+        ))
+        dirShards = os.path.join(dirProcessedData, "_Shards_")
+        os.makedirs(dirShards, exist_ok=True)
+        shardArguments = [
+            (fileJournalTable, i[0], i[1], os.path.join(dirShards, "Shard_{:d}".format(ind)))
+            for ind, i in enumerate(journalRanges)
+        ]
+        with multiprocessing.Pool(processes=numProcesses, initializer=_initialise_worker,
+                                  initargs=(patientData,)) as pool:
+            shardResults = pool.starmap(_process_shard, shardArguments)
+
+        # Merge the shards back together in the order they occur in the journal table.
+        statistics = _merge_statistics([i[0] for i in shardResults])
+        for i in shardResults:
+            instrumentation.add_timers(i[4])
+        with compressed_files.open_file(fileProcessedJournal, fileMode, newline='\n') as fidProcessed, \
+                open(filePatientDemographics, fileMode) as fidDemographics:
+            if not isAppend:
+                _write_headers(fidProcessed, fidDemographics)
+            fileIndex = os.path.join(dirProcessedData, patient_index.INDEX_FILE)
+            if compression is None and (os.path.isfile(fileIndex) or not isAppend):
+                patient_index.merge(
+                    [i[5] for i in shardResults], [i[1] for i in shardResults], fileIndex, fidProcessed.tell(),
+                    isAppend
+                )
+            for _, fileShardJournal, fileShardDemographics, _, _, _ in shardResults:
+                with open(fileShardJournal, 'r') as fidShard:
+                    shutil.copyfileobj(fidShard, fidProcessed)
+                with open(fileShardDemographics, 'r') as fidShard:
+                    shutil.copyfileobj(fidShard, fidDemographics)
+        columnar_cache.merge([i[3] for i in shardResults], dirCache, isAppend)
+        shutil.rmtree(dirShards)
+    else:
+        with compressed_files.open_file(fileProcessedJournal, fileMode, newline='\n') as fidProcessed, \
+                open(filePatientDemographics, fileMode) as fidDemographics:
+            if not isAppend:
+                _write_headers(fidProcessed, fidDemographics)
+            cacheWriter = columnar_cache.CacheWriter(dirCache, isAppend)
+            indexWriter = _open_index(dirProcessedData, fidProcessed, compression, isAppend)
+            statistics = _process_journal_range(
+                fileJournalTable, start, end, patientData, fidProcessed, fidDemographics, cacheWriter, indexWriter,
+                queueSize
+            )
+            cacheWriter.close()
+            if indexWriter is not None:
+                indexWriter.close()
+    return statistics
+
+
+def _process_shard(fileJournalTable, start, end, fileShardStem):
+    """Process a range of the journal table within a worker process, writing the results to shard files.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param start:               The byte offset of the start of the range (must be the start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the range.
+    :type end:                  int
+    :param fileShardStem:       The location (without extension) to save the shard files to.
+    :type fileShardStem:        str
+    :return:                    The statistics about the range along with the locations of the processed journal table
+                                    and patient demographics shard files, the columnar cache shard directory, the
+                                    times recorded by the instrumentation timers and the location of the patient index
+                                    shard file.
+    :rtype:                     tuple
+
+    """
+
+    fileShardJournal = "{:s}_JournalTable.tsv".format(fileShardStem)
+    fileShardDemographics = "{:s}_PatientDemographics.tsv".format(fileShardStem)
+    dirShardCache = "{:s}_{:s}".format(fileShardStem, columnar_cache.CACHE_DIRECTORY)
+    fileShardIndex = "{:s}_{:s}".format(fileShardStem, patient_index.INDEX_FILE)
+    with open(fileShardJournal, 'w', newline='\n') as fidProcessed, \
+            open(fileShardDemographics, 'w') as fidDemographics:
+        cacheWriter = columnar_cache.CacheWriter(dirShardCache)
+        indexWriter = patient_index.IndexWriter(fileShardIndex, 0)
+        statistics = _process_journal_range(
+            fileJournalTable, start, end, _WORKER_PATIENT_DATA, fidProcessed, fidDemographics, cacheWriter,
+            indexWriter
+        )
+        cacheWriter.close()
+        indexWriter.close()
+    return (
+        statistics, fileShardJournal, fileShardDemographics, dirShardCache, instrumentation.take_timers(),
+        fileShardIndex
+    )
+
+
+def _process_sorted_journal_table(fileJournalTable, end, patientData, dirProcessedData, sortMemoryLimit,
+                                  compression=None, queueSize=0):
+    """Sort the entries of the journal table by patient ID and date and convert them into the standard format.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param end:                 The byte offset of the end of the journal table, or None to process the whole file.
+    :type end:                  int | None
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param dirProcessedData:    The location to save the processed journal table data.
+    :type dirProcessedData:     str
+    :param sortMemoryLimit:     The approximate number of bytes of memory to use when sorting the journal table.
+    :type sortMemoryLimit:      int
+    :param compression:         The codec to compress the processed journal table with, or None for no compression.
+    :type compression:          str | None
+    :param queueSize:           The maximum number of blocks queued between the reading, processing and writing
+                                    threads, or 0 to read, process and write the journal table in a single thread.
+    :type queueSize:            int
+    :return:                    The statistics about the journal table, as returned by _process_entries.
+    :rtype:                     dict
+
+    """
+
+    LOGGER.info("Sorting the journal table by patient and date.")
+    entryBlocks = external_sort.main(
+        _parse_line_blocks(fileJournalTable, 0, end, queueSize), sortMemoryLimit,
+        os.path.join(dirProcessedData, "_SortRuns_")
+    )
+    return _process_entry_blocks(entryBlocks, patientData, dirProcessedData, compression, queueSize)
+
+
+def _read_line_blocks(fileJournalTable, start, end):
+    """Read the lines within a byte range of the journal table in blocks.
+
+    :param fileJournalTable:    The location of the journal table SQL file.
+    :type fileJournalTable:     str
+    :param start:               The byte offset of the start of the range (must be the start of a line).
+    :type start:                int
+    :param end:                 The byte offset of the end of the range. Lines starting at or after this offset are
+                                    not read. If None, lines are read until the end of the file.
+    :type end:                  int | None
+    :return:                    A generator of blocks of decoded lines.
+    :rtype:                     generator
+
+    """
+
+    end = float("inf") if end is None else end
+    with compressed_files.open_file(fileJournalTable, 'rb') as fidJournalTable:
+        if start:
+            # Only an uncompressed journal table can be read from a position other than the start.
+            fidJournalTable.seek(start)
+        position = start
+        while position < end:
+            block = fidJournalTable.readlines(READ_BLOCK_SIZE)
+            if not block:
+                break
+            lines = []
+            for i in block:
+                if position >= end:
+                    break
+                position += len(i)
+                lines.append(_decode_line(i))
+            yield lines
+
+
+def _truncate_final_lines(fileName, numLines):
+    """Remove the final lines of a file.
+
+    :param fileName:    The location of the file to truncate.
+    :type fileName:     str
+    :param numLines:    The number of lines to remove.
+    :type numLines:     int
+
+    """
+
+    end = os.path.getsize(fileName)
+    for ind, (offset, _) in enumerate(read_reversed_lines.main(fileName)):
+        if ind == numLines:
+            break
+        end = offset
+    os.truncate(fileName, end)
+
+
+def _write_headers(fidProcessed, fidDemographics):
+    """Write the headers of the processed journal table and patient demographics files.
+
+    :param fidProcessed:    The file to write the processed journal table to.
+    :type fidProcessed:     io.TextIOWrapper
+    :param fidDemographics: The file to write the patient demographics to.
+    :type fidDemographics:  io.TextIOWrapper
+
+    """
+
+    fidProcessed.write("PatientID\tCode\tDate\tYear\tVisitNumber\tVal1\tVal2\tFreeText\n")
+    fidDemographics.write("PatientID\tDOB\tGender\tCodesPatientHas\n")
+
+
+def _write_summary(dirProcessedData, statistics):
+    """Log and write out the codes in the processed journal table and statistics about it.
+
+    :param dirProcessedData:    The location of the processed journal table data.
+    :type dirProcessedData:     str
+    :param statistics:          The statistics about the journal table, as returned by _process_entries.
+    :type statistics:           dict
+
+    """
+
+    numEvents = statistics["NumEvents"]
+    numValidEvents = statistics["NumValidEvents"]
+    uniquePatients = statistics["Patients"]
+    codeAssociatedValues = statistics["CodeValues"]
+    uniqueCodes = set(codeAssociatedValues)
+
     # Log statistics about the dataset.
     LOGGER.info("{:d} events found in the dataset.".format(numEvents))
     LOGGER.info("{:d} valid events found in the dataset.".format(numValidEvents))
@@ -143,3 +905,60 @@ def main(dirSQLFiles, dirProcessedData):
         fid.write("{:d} valid events found in the dataset.\n".format(numValidEvents))
         fid.write("{:d} unique patients found in the dataset.\n".format(len(uniquePatients)))
         fid.write("{:d} unique codes found in the dataset.\n".format(len(uniqueCodes)))
+
+
+def _write_patient(patientID, patientHistory, codesPatientHas, patientData, fidProcessed, fidDemographics,
+                   cacheWriter, indexWriter=None):
+    """Write out the demographics and history of a single patient.
+
+    :param patientID:           The ID of the patient.
+    :type patientID:            str
+    :param patientHistory:      The parsed journal table entries for the patient indexed by the day ordinal of the
+                                    date of the entry.
+    :type patientHistory:       dict
+    :param codesPatientHas:     The codes that the patient is associated with.
+    :type codesPatientHas:      set
+    :param patientData:         The demographics of each patient.
+    :type patientData:          demographics_store.DemographicsStore
+    :param fidProcessed:        The file to write the processed journal table to.
+    :type fidProcessed:         io.TextIOWrapper
+    :param fidDemographics:     The file to write the patient demographics to.
+    :type fidDemographics:      io.TextIOWrapper
+    :param cacheWriter:         The writer of the columnar cache of the processed journal table.
+    :type cacheWriter:          columnar_cache.CacheWriter
+    :param indexWriter:         The writer of the index of the patient records, or None if no index is written.
+    :type indexWriter:          patient_index.IndexWriter | None
+
+    """
+
+    # Write out the patient demographic information.
+    patientIndex = patientData.find(patientID)
+    if patientIndex < 0:
+        raise KeyError(patientID)
+    fidDemographics.write(
+        "{:s}\t{:d}\t{:s}\t{:s}\n".format(
+            patientID, patientData.year_of_birth(patientIndex), patientData.gender(patientIndex),
+            ','.join(sorted(codesPatientHas))
+        )
+    )
+
+    # Write out the patient's history sorted by date from oldest to newest.
+    patientRows = []
+    dateOrdinals = []
+    lines = []
+    visitNumber = -1
+    for i in sorted(patientHistory):
+        visitNumber += 1
+        for j in patientHistory[i]:
+            j.insert(3, j[2][:4])
+            j.insert(4, str(visitNumber))
+            lines.append("{:s}\n".format('\t'.join(j)))
+        patientRows.extend(patientHistory[i])
+        dateOrdinals.extend([i] * len(patientHistory[i]))
+    record = ''.join(lines)
+    fidProcessed.write(record)
+    cacheWriter.add_patient(patientID, patientRows, dateOrdinals)
+    if indexWriter is not None:
+        # The processed journal table is written without translating its newlines, so the record takes up the bytes of
+        # its encoding.
+        indexWriter.add_record(patientID, len(record.encode(fidProcessed.encoding)), len(patientRows))
@@ -3,10 +3,22 @@
 # Python imports.
 from collections import defaultdict
 
+# User imports.
+from Utilities import instrumentation
 
-def main(patientID, patientData, patientGender, outputFiles, minVisits=0, minYears=0):
+# 3rd party imports.
+import numpy as np
+
+
+def main(patientID, patientData, patientGender, outputFiles, minVisits=0, minYears=0, valueColumns=None,
+         rawValuePolicy="Last"):
     """Save the history of a given patient in all the desired formats.
 
+    Only the aggregations of the history needed by the datasets being written are computed. The time steps of the
+    datasets are built from the aggregations in TIME_STEPS, and the values written for each type of data are derived
+    from the code counts in the time steps by the functions in VALUE_TYPES. Types of data without an entry in
+    VALUE_TYPES are not written, except for the raw data, whose values are collected by _raw_values.
+
     :param patientID:       The ID of the patient.
     :type patientID:        str
     :param patientData:     The patient's history. The history will be sorted from oldest event to most recent.
@@ -15,7 +27,7 @@ def main(patientID, patientData, patientGender, outputFiles, minVisits=0, minYea
     :type patientData:      list[dict]
     :param patientGender:   The gender of the patient ('M' or 'F').
     :type patientGender:    str
-    :param outputFiles:     The locations of the cleaned dataset files.
+    :param outputFiles:     The writers of the cleaned dataset files, indexed by type of data and then time step.
     :type outputFiles:      dict
     :param minVisits:       The minimum number of unique dates for which a patient must have data recorded before their
                                 visit information is saved.
@@ -23,94 +35,233 @@ def main(patientID, patientData, patientGender, outputFiles, minVisits=0, minYea
     :param minYears:        The minimum number of unique years for which a patient must have data recorded before their
                                 year information is saved.
     :type minYears:         int
+    :param valueColumns:    The value (Val1 or Val2) and column of each raw data column of each code with values (see
+                                file_generator.value_columns), or None if no code has values.
+    :type valueColumns:     dict | None
+    :param rawValuePolicy:  How the raw data records a column with several values in one time step (one of
+                                RAW_VALUE_POLICIES).
+    :type rawValuePolicy:   str
+
+    """
+
+    # Format the history as rows of the age and code counts in each time step needed. The codes in each time step are
+    # recorded in the order they first occur in the time step.
+    countRows = {}
+    with instrumentation.timer("Aggregation"):
+        for i in outputFiles:
+            if i not in VALUE_TYPES:
+                continue
+            for j in outputFiles[i]:
+                if j not in countRows:
+                    countRows[j] = TIME_STEPS[j](patientData, countRows)
+        valueRows = {
+            j: _raw_values(patientData, RAW_TIME_STEPS[j], valueColumns or {}, rawValuePolicy)
+            for j in outputFiles.get("RawData", {})
+        }
+
+    # Write out the patient's history information for the non-raw value representations.
+    with instrumentation.timer("Writing"):
+        for i in outputFiles:
+            if i not in VALUE_TYPES:
+                continue
+            for j in outputFiles[i]:
+                if (j.startswith("Visits") and len(countRows[j]) < minVisits) or \
+                        (j.startswith("Years") and len(countRows[j]) < minYears):
+                    # The patient does not have enough time steps to be saved.
+                    continue
+                outputFiles[i][j].write_rows(patientID, patientGender, VALUE_TYPES[i](countRows[j]))
+
+        # Write out the patient's history information for the raw value representations.
+        for j in valueRows:
+            numTimeSteps, ages, rowOffsets, columns, values = valueRows[j]
+            if (j == "Visits" and numTimeSteps < minVisits) or (j == "Years" and numTimeSteps < minYears) or \
+                    (not ages):
+                # The patient does not have enough time steps to be saved or has no values recorded.
+                continue
+            outputFiles["RawData"][j].write_value_rows(patientID, patientGender, ages, rowOffsets, columns, values)
+
+
+def _binary_indicators(rows):
+    """Convert rows of code counts into rows of binary indicators of the presence of each code.
+
+    :param rows:    The age and code counts in each time step.
+    :type rows:     list[tuple]
+    :return:        The age and a value of 1 for each code present in each time step.
+    :rtype:         list[tuple]
+
+    """
+
+    return [(i, dict.fromkeys(j, 1)) for i, j in rows]
+
+
+def _code_counts(rows):
+    """Return rows of code counts unchanged.
+
+    :param rows:    The age and code counts in each time step.
+    :type rows:     list[tuple]
+    :return:        The age and code counts in each time step.
+    :rtype:         list[tuple]
+
+    """
+
+    return rows
+
+
+def _count_cumulative(timeStep):
+    """Create a function that accumulates the code counts of a time step over the patient's history.
+
+    :param timeStep:    The time step to accumulate the code counts of.
+    :type timeStep:     str
+    :return:            A function taking the patient's history and the rows already computed, and returning the age
+                            and running totals of the code counts in each time step.
+    :rtype:             function
+
+    """
+
+    def accumulate(patientData, countRows):
+        if timeStep not in countRows:
+            countRows[timeStep] = TIME_STEPS[timeStep](patientData, countRows)
+        runningCounts = {}
+        cumulativeRows = []
+        for age, counts in countRows[timeStep]:
+            for code in counts:
+                runningCounts[code] = runningCounts.get(code, 0) + counts[code]
+            cumulativeRows.append((age, dict(runningCounts)))
+        return cumulativeRows
+
+    return accumulate
+
+
+def _count_history(patientData, countRows):
+    """Count the codes over the patient's entire history.
+
+    :param patientData:     The patient's history.
+    :type patientData:      list[dict]
+    :param countRows:       The rows of the time steps already computed.
+    :type countRows:        dict
+    :return:                The patient's final age and their code counts, as a single row.
+    :rtype:                 list[tuple]
 
     """
 
-    # Get the file handles.
-    fidBinHist = outputFiles["BinaryIndicator"]["History"]
-    fidBinVis = outputFiles["BinaryIndicator"]["Visits"]
-    fidBinYear = outputFiles["BinaryIndicator"]["Years"]
-    fidCountHist = outputFiles["CodeCount"]["History"]
-    fidCountVis = outputFiles["CodeCount"]["Visits"]
-    fidCountYear = outputFiles["CodeCount"]["Years"]
-    fidRawHist = outputFiles["RawData"]["History"]
-    fidRawVis = outputFiles["RawData"]["Visits"]
-    fidRawYear = outputFiles["RawData"]["Years"]
-
-    # Extract the needed information about the patient's history and format it.
-    binHistory = set()
-    binVisits = defaultdict(set)
-    binYears = defaultdict(set)
     countsHistory = defaultdict(int)
-    countsVisits = defaultdict(lambda: defaultdict(int))
-    countsYears = defaultdict(lambda: defaultdict(int))
-    ages = {"Visits": {}, "Years": {}}
     for i in patientData:
-        # Extract information about the event.
-        age = i["Age"]
-        code = i["Code"]
-        visit = i["Visit"]
-        year = i["Year"]
-
-        # Update event records.
-        binHistory.add(code)
-        binVisits[visit].add(code)
-        binYears[year].add(code)
-        ages["Visits"][visit] = age
-        countsHistory[code] += 1
-        countsVisits[visit][code] += 1
-        countsYears[year][code] += 1
-        ages["Years"][year] = age
-    finalAge = patientData[-1]["Age"]
+        countsHistory[i["Code"]] += 1
+    return [(patientData[-1]["Age"], countsHistory)]
 
-    # Write out the patient's history information for the non-raw value representations.
-    patientInfo = "{:s}:{:s}\t{:s}:{:d}\t{:s}:{:s}\t{:s}\n"
-    fidBinHist.write(
-        patientInfo.format(
-            "_ID", patientID, "_Age", finalAge, "_Gender", patientGender,
-            '\t'.join(["{:s}:1".format(i) for i in binHistory])
-        )
-    )
-    if len(binVisits) >= minVisits:
-        binVisitsOutput = ""
-        for i in sorted(binVisits):
-            binVisitsOutput += patientInfo.format(
-                "_ID", patientID, "_Age", ages["Visits"][i], "_Gender", patientGender,
-                '\t'.join(["{:s}:1".format(j) for j in binVisits[i]])
-            )
-        fidBinVis.write(binVisitsOutput)
-    if len(binYears) >= minYears:
-        binYearsOutput = ""
-        for i in sorted(binYears):
-            binYearsOutput += patientInfo.format(
-                "_ID", patientID, "_Age", ages["Years"][i], "_Gender", patientGender,
-                '\t'.join(["{:s}:1".format(j) for j in binYears[i]])
+
+def _count_time_steps(key):
+    """Create a function that counts the codes in each time step of the patient's history.
+
+    :param key:     The key of the history entries that determines the time step of an entry (e.g. Visit).
+    :type key:      str
+    :return:        A function taking the patient's history and the rows already computed, and returning the age (at
+                        the final entry in the time step) and code counts in each time step, ordered by time step.
+    :rtype:         function
+
+    """
+
+    def count(patientData, countRows):
+        counts = defaultdict(lambda: defaultdict(int))
+        ages = {}
+        for i in patientData:
+            timeStep = i[key]
+            ages[timeStep] = i["Age"]
+            counts[timeStep][i["Code"]] += 1
+        return [(ages[i], counts[i]) for i in sorted(counts)]
+
+    return count
+
+
+def _raw_values(patientData, key, valueColumns, policy):
+    """Collect the non-zero values of the codes in each time step of the patient's history.
+
+    The values are gathered into float32 arrays, and then grouped by time step and column with NumPy. When a column
+    has several values in a time step, the policy determines whether the last one (in the order of the history), the
+    mean of them or all of them (in the order of the history) are recorded. Only time steps containing values get a
+    row.
+
+    :param patientData:     The patient's history.
+    :type patientData:      list[dict]
+    :param key:             The key of the history entries that determines the time step of an entry (e.g. Visit), or
+                                None to use the entire history as one time step.
+    :type key:              str | None
+    :param valueColumns:    The value (Val1 or Val2) and column of each raw data column of each code with values.
+    :type valueColumns:     dict
+    :param policy:          How a column with several values in one time step is recorded (one of RAW_VALUE_POLICIES).
+    :type policy:           str
+    :return:                The number of time steps in the history, the age (at the final entry in the time step) in
+                                each row, the offset of the first value of each row in the columns and values followed
+                                by their length, and the column and value of each value.
+    :rtype:                 tuple
+
+    """
+
+    # Record the column of each code's Val1 and Val2 (-1 when the code has no column for the value), and then gather
+    # the time step, columns and values of every entry so that the non-zero values can be selected at once.
+    codeColumns = {}
+    for i in {j["Code"] for j in patientData}:
+        codeColumns[i] = [-1, -1]
+        for valueKey, column in valueColumns.get(i, ()):
+            codeColumns[i][VALUE_KEYS.index(valueKey)] = column
+    if key is None:
+        entrySteps = np.zeros(len(patientData), dtype=np.int32)
+    else:
+        entrySteps = np.array([i[key] for i in patientData], dtype=np.int32)
+    entryColumns = np.array([codeColumns[i["Code"]] for i in patientData], dtype=np.int32).reshape(-1, 2)
+    entryValues = np.array([(i["Val1"], i["Val2"]) for i in patientData], dtype=np.float64).reshape(-1, 2)
+
+    # Select the values with a column, ordered by entry and then Val1 before Val2.
+    isValue = (entryColumns >= 0) & (entryValues != 0)
+    steps = np.repeat(entrySteps, 2)[isValue.ravel()]
+    columns = entryColumns[isValue]
+    values = entryValues[isValue].astype(np.float32)
+
+    # Group the values by time step and then column, keeping the values of a column in a time step in history order.
+    order = np.argsort(steps.astype(np.int64) * (columns.max(initial=0) + 1) + columns, kind="stable")
+    steps = steps[order]
+    columns = columns[order]
+    values = values[order]
+    if policy != "All" and values.size:
+        isGroupStart = np.ones(values.size, dtype=bool)
+        isGroupStart[1:] = (steps[1:] != steps[:-1]) | (columns[1:] != columns[:-1])
+        groupStarts = np.flatnonzero(isGroupStart)
+        groupEnds = np.append(groupStarts[1:], values.size)
+        if policy == "Last":
+            values = values[groupEnds - 1]
+        else:
+            values = (np.add.reduceat(values, groupStarts, dtype=np.float64) / (groupEnds - groupStarts)).astype(
+                np.float32
             )
-        fidBinYear.write(binYearsOutput)
-    fidCountHist.write(
-        patientInfo.format(
-            "_ID", patientID, "_Age", finalAge, "_Gender", patientGender,
-            '\t'.join(["{:s}:{:d}".format(i, countsHistory[i]) for i in countsHistory])
-        )
+        steps = steps[groupStarts]
+        columns = columns[groupStarts]
+
+    # The age of a time step is the age at its final entry.
+    rowSteps, rowStarts = np.unique(steps, return_index=True)
+    allSteps, lastEntries = np.unique(entrySteps[::-1], return_index=True)
+    lastEntries = entrySteps.size - 1 - lastEntries[np.searchsorted(allSteps, rowSteps)]
+    return (
+        allSteps.size, [patientData[i]["Age"] for i in lastEntries.tolist()], np.append(rowStarts, steps.size), columns,
+        values
     )
-    if len(countsVisits) >= minVisits:
-        countVisitsOutput = ""
-        for i in sorted(countsVisits):
-            countVisitsOutput += patientInfo.format(
-                "_ID", patientID, "_Age", ages["Visits"][i], "_Gender", patientGender,
-                '\t'.join(["{:s}:{:d}".format(j, countsVisits[i][j]) for j in countsVisits[i]])
-            )
-        fidCountVis.write(countVisitsOutput)
-    if len(countsYears) >= minYears:
-        countYearsOutput = ""
-        for i in sorted(countsYears):
-            countYearsOutput += patientInfo.format(
-                "_ID", patientID, "_Age", ages["Years"][i], "_Gender", patientGender,
-                '\t'.join(["{:s}:{:d}".format(j, countsYears[i][j]) for j in countsYears[i]])
-            )
-        fidCountYear.write(countYearsOutput)
 
-    # Write out the patient's history information for the raw value representations.
-    #fidRawHist.write()
-    #fidRawVis.write()
-    #fidRawYear.write()
+
+# Globals.
+RAW_TIME_STEPS = {  # The key of the history entries determining the time step of each raw data dataset.
+    "History": None,
+    "Visits": "Visit",
+    "Years": "Year"
+}
+RAW_VALUE_POLICIES = ("All", "Last", "Mean")  # How a column with several values in one time step can be recorded.
+TIME_STEPS = {  # The function computing the rows of each time step from the patient's history.
+    "History": _count_history,
+    "Visits": _count_time_steps("Visit"),
+    "Visits_C": _count_cumulative("Visits"),
+    "Years": _count_time_steps("Year"),
+    "Years_C": _count_cumulative("Years")
+}
+VALUE_KEYS = ("Val1", "Val2")  # The keys of the values of the history entries, in the order they are recorded.
+VALUE_TYPES = {  # The function deriving the values of each type of data from the code counts in the time steps.
+    "BinaryIndicator": _binary_indicators,
+    "CodeCount": _code_counts
+}
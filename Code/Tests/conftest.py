@@ -0,0 +1,95 @@
+"""Configuration and fixtures shared by the tests.
+
+Run from the top level directory with:
+    python -m pytest Code/Tests
+"""
+
+# Python imports.
+import json
+import os
+import sys
+
+# 3rd party imports.
+import pytest
+
+# Globals.
+DIR_CODE = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+DIR_CONFIGURATION = os.path.join(os.path.dirname(DIR_CODE), "ConfigurationFiles")
+if DIR_CODE not in sys.path:
+    # Import the code in the same manner as when it is run from the Code directory.
+    sys.path.insert(0, DIR_CODE)
+
+# User imports.
+from Benchmarks import generate_synthetic_data  # noqa: E402
+from DataProcessing.JournalTable import process_table  # noqa: E402
+
+
+@pytest.fixture
+def create_config(fileConfigSchema, tmp_path):
+    """Create configurations overriding the default configuration, skipping the test if the Libraries are missing.
+
+    The patterns of the patients to keep in the default configuration are removed, so that every patient is kept unless
+    the overrides give patterns.
+
+    :return:    A function taking the parameters overriding the default configuration, in the same form as a
+                    configuration file, and returning the configuration.
+    :rtype:     function
+
+    """
+
+    Configuration = pytest.importorskip("Libraries.JsonschemaManipulation.Configuration")
+    numConfigs = [0]
+
+    def create(overrides=None):
+        overrides = dict(overrides or {})
+        overrides["DataProcessing"] = dict({"PatientsToKeep": []}, **overrides.get("DataProcessing", {}))
+        numConfigs[0] += 1
+        fileConfig = str(tmp_path / "Config_{:d}.json".format(numConfigs[0]))
+        with open(fileConfig, 'w') as fidConfig:
+            json.dump(overrides, fidConfig)
+        config = Configuration.Configuration()
+        config.set_from_json(os.path.join(DIR_CONFIGURATION, "DefaultConfig.json"), fileConfigSchema)
+        config.set_from_json(fileConfig, fileConfigSchema)
+        return config
+
+    return create
+
+
+@pytest.fixture(scope="session")
+def dirProcessedData(dirSQLFiles, tmp_path_factory):
+    """Process the synthetic journal and patient tables, shared by the tests that only read the processed data.
+
+    :return:    The location of the directory containing the processed journal table files.
+    :rtype:     str
+
+    """
+
+    dirProcessedData = str(tmp_path_factory.mktemp("ProcessedData"))
+    process_table.main(dirSQLFiles, dirProcessedData)
+    return dirProcessedData
+
+
+@pytest.fixture(scope="session")
+def dirSQLFiles(tmp_path_factory):
+    """Generate a small synthetic journal and patient table, shared by the tests that only read them.
+
+    :return:    The location of the directory containing journal.sql and patient.sql.
+    :rtype:     str
+
+    """
+
+    dirSQLFiles = str(tmp_path_factory.mktemp("SQLFiles"))
+    generate_synthetic_data.main(dirSQLFiles, 150, numCodes=40, visitsPerPatient=8, codesPerVisit=2, seed=1)
+    return dirSQLFiles
+
+
+@pytest.fixture(scope="session")
+def fileConfigSchema():
+    """Locate the schema the configurations are validated against.
+
+    :return:    The location of the configuration schema.
+    :rtype:     str
+
+    """
+
+    return os.path.join(DIR_CONFIGURATION, "ConfigurationSchema.json")
@@ -0,0 +1,62 @@
+"""Tests of the calculation of ages from dates."""
+
+# Python imports.
+import datetime
+import itertools
+
+# User imports.
+from Utilities import calculate_age
+from Utilities import iso_dates
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+# Globals.
+BIRTH_DATES = [  # Dates of birth covering leap days, the ends of months and the ends of years.
+    datetime.datetime(1964, 2, 29), datetime.datetime(1970, 1, 1), datetime.datetime(1970, 3, 5),
+    datetime.datetime(1985, 2, 28), datetime.datetime(1999, 12, 31), datetime.datetime(2000, 2, 29),
+    datetime.datetime(2001, 3, 1)
+]
+COMPARISON_DATES = [  # Dates to calculate the ages at, covering the days around birthdays in leap and other years.
+    datetime.datetime(2000, 2, 28), datetime.datetime(2000, 2, 29), datetime.datetime(2000, 3, 1),
+    datetime.datetime(2001, 2, 28), datetime.datetime(2001, 3, 1), datetime.datetime(2004, 2, 29),
+    datetime.datetime(2010, 3, 5), datetime.datetime(2010, 12, 31), datetime.datetime(2011, 1, 1),
+    datetime.datetime(2012, 2, 29)
+]
+
+
+@pytest.mark.parametrize("isFraction", [False, True])
+def test_main_batch_matches_main(isFraction):
+    pairs = [(i, j) for i, j in itertools.product(BIRTH_DATES, COMPARISON_DATES) if i <= j]
+    ages = calculate_age.main_batch(
+        [i.toordinal() for i, _ in pairs], [j.toordinal() for _, j in pairs], isFraction
+    )
+    assert ages.tolist() == [calculate_age.main(i, j, isFraction) for i, j in pairs]
+
+
+def test_main_batch_accepts_datetime64():
+    born = np.array(["1964-02-29", "1970-03-05"], dtype="datetime64[D]")
+    comparison = np.array(["2001-02-28", "2010-03-05"], dtype="datetime64[D]")
+    assert np.array_equal(
+        calculate_age.main_batch(born, comparison, True),
+        calculate_age.main_batch(
+            [i.toordinal() for i in born.tolist()], [i.toordinal() for i in comparison.tolist()], True
+        )
+    )
+
+
+@pytest.mark.parametrize("isoDate", ["1998-04-16", "2000-02-29", "0001-01-01", "9999-12-31", "2010-1-5", "2010-01-5"])
+def test_to_ordinal_matches_strptime(isoDate):
+    assert iso_dates.to_ordinal(isoDate) == datetime.datetime.strptime(isoDate, "%Y-%m-%d").toordinal()
+
+
+@pytest.mark.parametrize("isoDate", ["1998-02-30", "1998/04/16", "16-04-1998"])
+def test_to_ordinal_rejects_invalid_dates(isoDate):
+    with pytest.raises(ValueError):
+        iso_dates.to_ordinal(isoDate)
+
+
+def test_to_datetime64_round_trip():
+    dates = [datetime.date(1970, 1, 1), datetime.date(1900, 2, 28), datetime.date(2000, 2, 29)]
+    assert iso_dates.to_datetime64([i.toordinal() for i in dates]).tolist() == dates
@@ -0,0 +1,105 @@
+"""Tests of the service generating datasets from processed data held in memory."""
+
+# Python imports.
+import filecmp
+import http.server
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+# User imports.
+from DataProcessing.JournalTable import dataset_service
+from DataProcessing.JournalTable import generate_datasets
+
+# 3rd party imports.
+import jsonschema
+import pytest
+
+# Globals.
+FRAGMENTS = [  # Configuration fragments of requests, covering filtering and output parameters.
+    {},
+    {"DataProcessing": {"MinVisits": 3, "MinYears": 2}},
+    {"DataProcessing": {"CodesToIgnore": ["a*"], "MinCodes": 4, "MinPatients": 5, "OutputFormat": "SVMLight"}},
+    {"DataProcessing": {"FractionalAges": True, "Outputs": ["RawData_Visits", "CodeCount_Years_C"]}},
+]
+
+
+@pytest.fixture
+def service(dirProcessedData, create_config, fileConfigSchema, tmp_path):
+    """Create a service for the processed data, saving the datasets of its requests in a Service directory.
+
+    :return:    The service.
+    :rtype:     dataset_service.DatasetService
+
+    """
+
+    dirOutput = tmp_path / "Service"
+    dirOutput.mkdir()
+    return dataset_service.DatasetService(dirProcessedData, str(dirOutput), create_config(), fileConfigSchema)
+
+
+def test_requests_match_main(service, dirProcessedData, create_config, tmp_path):
+    for ind, i in enumerate(FRAGMENTS):
+        result = service.generate(i)
+        assert result["Request"] == ind + 1
+        with open(os.path.join(result["Output"], "Config.json"), 'r') as fidConfig:
+            assert json.load(fidConfig) == i
+
+        dirExpected = tmp_path / "Expected_{:d}".format(ind)
+        dirExpected.mkdir()
+        generate_datasets.main(dirProcessedData, str(dirExpected), create_config(i))
+        datasetFiles = sorted(os.listdir(str(dirExpected)))
+        assert sorted(set(os.listdir(result["Output"])) - {"Config.json"}) == datasetFiles
+        _, mismatches, errors = filecmp.cmpfiles(str(dirExpected), result["Output"], datasetFiles, shallow=False)
+        assert mismatches + errors == []
+
+
+@pytest.mark.parametrize("fragment, exception", [
+    ({"DataProcessing": {"MinVisits": "three"}}, jsonschema.ValidationError),
+    ({"DataProcessing": {"OutputFormat": "CSV"}}, jsonschema.ValidationError),
+    ({"DataProcessing": {"PatientsToKeep": "MissingCohort.txt"}}, ValueError),
+])
+def test_invalid_fragments_raise(service, fragment, exception, tmp_path):
+    with pytest.raises(exception):
+        service.generate(fragment)
+    assert os.listdir(str(tmp_path / "Service")) == []
+
+
+def test_http_requests(service):
+    server = http.server.ThreadingHTTPServer((dataset_service.HOST, 0), dataset_service._RequestHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = "http://{:s}:{:d}".format(dataset_service.HOST, server.server_address[1])
+        status, content = _post(url + "/datasets", {"DataProcessing": {"MinVisits": 3}})
+        assert status == 200 and os.path.isdir(content["Output"])
+        assert _post(url + "/datasets", {"DataProcessing": {"MinVisits": -1}})[0] == 400
+        assert _post(url + "/datasets", [1, 2])[0] == 400
+        assert _post(url + "/other", {})[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _post(url, content):
+    """Send a POST request with a JSON body.
+
+    :param url:     The URL to send the request to.
+    :type url:      str
+    :param content: The content of the body.
+    :type content:  dict | list
+    :return:        The status code and the JSON content of the response.
+    :rtype:         int, dict
+
+    """
+
+    request = urllib.request.Request(url, data=json.dumps(content).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
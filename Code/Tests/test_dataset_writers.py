@@ -0,0 +1,66 @@
+"""Tests of the writers of the datasets in each output format."""
+
+# User imports.
+from DataProcessing.JournalTable import dataset_writers
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+# Globals.
+PATIENTS = [  # The ID, gender and rows of the patients written.
+    ("1", 'M', [(40, {"B": 2, "A": 1}), (41, {"C": 3})]),
+    ("2", 'F', []),
+    ("3", 'F', [(70, {"C": 1, "B": 1, "A": 4})]),
+]
+VOCABULARY = {"A": 0, "B": 1, "C": 2}
+
+
+def test_sparse_writer_requires_hooks(tmp_path):
+    class IncompleteWriter(dataset_writers._SparseWriter):
+        @staticmethod
+        def merge(fileShards, fileOutput, compression=None):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteWriter(str(tmp_path / "Dataset"), VOCABULARY)
+
+
+@pytest.mark.parametrize("writerClass", [dataset_writers.NPZWriter, dataset_writers.SVMLightWriter])
+def test_sparse_writers_match_tsv(writerClass, tmp_path):
+    fileTSV = str(tmp_path / "Dataset.tsv")
+    fileSparse = str(tmp_path / "Dataset{:s}".format(writerClass.extension))
+    for writer in [dataset_writers.TSVWriter(fileTSV, VOCABULARY), writerClass(fileSparse, VOCABULARY)]:
+        for patientID, patientGender, rows in PATIENTS:
+            writer.write_rows(patientID, patientGender, rows)
+        writer.close()
+
+    # Read the TSV dataset.
+    with open(fileTSV, 'r') as fidTSV:
+        lines = fidTSV.read().splitlines()
+    assert lines[0] == "_ID\t_Age\t_Gender\tA\tB\tC"
+    expectedMatrix = np.zeros((len(lines) - 1, len(VOCABULARY)), dtype=np.int32)
+    expectedRowInfo = []
+    for ind, i in enumerate(lines[1:]):
+        entries = [j.split(':') for j in i.split('\t')]
+        expectedRowInfo.append((entries[0][1], int(entries[1][1]), entries[2][1]))
+        for code, value in entries[3:]:
+            expectedMatrix[ind, VOCABULARY[code]] = int(value)
+
+    # Read the sparse dataset and its side file.
+    matrix = np.zeros_like(expectedMatrix)
+    if writerClass is dataset_writers.NPZWriter:
+        with np.load(fileSparse) as csr:
+            assert csr["shape"].tolist() == list(matrix.shape)
+            for row, (start, end) in enumerate(zip(csr["indptr"][:-1], csr["indptr"][1:])):
+                matrix[row, csr["indices"][start:end]] = csr["data"][start:end]
+    else:
+        with open(fileSparse, 'r') as fidSparse:
+            for row, i in enumerate(fidSparse):
+                for j in i.split('#')[0].split()[1:]:
+                    column, value = j.split(':')
+                    matrix[row, int(column)] = int(value)
+    with np.load(str(tmp_path / "Dataset_RowInfo.npz")) as rowInfo:
+        assert list(zip(rowInfo["ID"].tolist(), rowInfo["Age"].tolist(), rowInfo["Gender"].tolist())) == \
+            expectedRowInfo
+    assert np.array_equal(matrix, expectedMatrix)
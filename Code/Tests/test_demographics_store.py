@@ -0,0 +1,40 @@
+"""Tests of the compact store of patient demographics."""
+
+# Python imports.
+import os
+
+# User imports.
+from DataProcessing.JournalTable import demographics_store
+
+
+def test_store_matches_dictionary():
+    patients = [("30", 1980, 'M'), ("4", 1955, 'F'), ("120", 2001, 'F'), ("4", 1956, 'M')]
+    builder = demographics_store.DemographicsBuilder()
+    for i in patients:
+        builder.add(*i)
+    store = builder.build()
+
+    # The demographics given last for a patient are used.
+    expected = {i: {"YearOfBirth": j, "Gender": k} for i, j, k in patients}
+    assert len(store) == len(expected)
+    for patientID, demographics in expected.items():
+        index = store.find(patientID)
+        assert patientID in store
+        assert store.year_of_birth(index) == demographics["YearOfBirth"]
+        assert store.gender(index) == demographics["Gender"]
+    assert store.find("5") == -1 and "5" not in store
+    assert store.contains(["120", "5", "30", "999"]).tolist() == [True, False, True, False]
+
+
+def test_load_patient_table_loads_every_patient(dirSQLFiles):
+    filePatientTable = os.path.join(dirSQLFiles, "patient.sql")
+    expected = {}
+    with open(filePatientTable, 'r') as fidPatientTable:
+        for line in fidPatientTable:
+            if line.startswith("insert"):
+                chunks = line[84:-3].split(',')
+                expected[chunks[0]] = (int(chunks[1]), 'M' if chunks[3] == '1' else 'F')
+
+    store = demographics_store.load_patient_table(filePatientTable)
+    assert len(store) == len(expected)
+    assert {i: (store.year_of_birth(store.find(i)), store.gender(store.find(i))) for i in expected} == expected
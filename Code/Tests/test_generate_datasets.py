@@ -0,0 +1,73 @@
+"""Tests of the generation of the datasets from the processed journal table."""
+
+# Python imports.
+import filecmp
+import os
+import shutil
+
+# User imports.
+from DataProcessing.JournalTable import columnar_cache
+from DataProcessing.JournalTable import generate_datasets
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+
+def test_fractional_ages_round_down_to_whole_ages(dirProcessedData, create_config, tmp_path):
+    # The patients are treated as born on January 1st, so their whole age is the year of the entry less their year of
+    # birth.
+    datasetAges = {}
+    for isFractional in [False, True]:
+        config = create_config({"DataProcessing": {
+            "FractionalAges": isFractional, "Outputs": ["CodeCount_Visits"]
+        }})
+        dirOutput = _make_directory(tmp_path / "Fractional_{:s}".format(str(isFractional)))
+        generate_datasets.main(dirProcessedData, dirOutput, config)
+        with open(os.path.join(dirOutput, "CodeCount_Visits.tsv"), 'r') as fidDataset:
+            datasetAges[isFractional] = [float(i.split('\t')[1][len("_Age:"):]) for i in fidDataset.readlines()[1:]]
+    assert len(datasetAges[True]) == len(datasetAges[False])
+    assert any(i != int(i) for i in datasetAges[True])
+    assert [int(i) for i in datasetAges[True]] == datasetAges[False]
+
+
+@pytest.mark.parametrize("outputFormat", ["NPZ", "SVMLight", "TSV"])
+@pytest.mark.parametrize("isCached", [True, False])
+def test_multiple_processes_match_single_process(outputFormat, isCached, dirProcessedData, create_config, tmp_path):
+    if not isCached:
+        # Generate the datasets from the processed journal table rather than its columnar cache.
+        dirUncached = str(tmp_path / "Uncached")
+        shutil.copytree(
+            dirProcessedData, dirUncached, ignore=shutil.ignore_patterns(columnar_cache.CACHE_DIRECTORY)
+        )
+        dirProcessedData = dirUncached
+    config = create_config({"DataProcessing": {"MinVisits": 3, "OutputFormat": outputFormat}})
+    dirSingle = _make_directory(tmp_path / "Single")
+    dirMultiple = _make_directory(tmp_path / "Multiple")
+    generate_datasets.main(dirProcessedData, dirSingle, config)
+    generate_datasets.main(dirProcessedData, dirMultiple, config, numProcesses=3)
+
+    assert sorted(os.listdir(dirSingle)) == sorted(os.listdir(dirMultiple))
+    for i in os.listdir(dirSingle):
+        fileSingle = os.path.join(dirSingle, i)
+        fileMultiple = os.path.join(dirMultiple, i)
+        if i.endswith(".npz"):
+            with np.load(fileSingle) as single, np.load(fileMultiple) as multiple:
+                assert sorted(single.files) == sorted(multiple.files)
+                assert all(np.array_equal(single[j], multiple[j]) for j in single.files), i
+        else:
+            assert filecmp.cmp(fileSingle, fileMultiple, shallow=False), i
+
+
+def _make_directory(path):
+    """Create a directory for the datasets.
+
+    :param path:    The location of the directory.
+    :type path:     pathlib.Path
+    :return:        The location of the directory.
+    :rtype:         str
+
+    """
+
+    path.mkdir()
+    return str(path)
@@ -0,0 +1,78 @@
+"""Tests of the filtering of patients and codes held in a sparse incidence matrix."""
+
+# Python imports.
+import os
+
+# User imports.
+from DataProcessing.JournalTable import generate_datasets
+from DataProcessing.JournalTable import incidence_matrix
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("minCodes, minPatients", [(0, 0), (1, 1), (3, 2), (5, 4), (8, 8), (40, 1)])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_filter_min_degrees_matches_naive_filter(minCodes, minPatients, seed):
+    random = np.random.default_rng(seed)
+    patientCodes = [
+        sorted(set(random.integers(0, 30, random.integers(0, 12)).tolist())) for _ in range(60)
+    ]
+    builder = incidence_matrix.IncidenceBuilder()
+    for i in patientCodes:
+        builder.add(["Code{:d}".format(j) for j in i])
+    matrix, codes = builder.build()
+    isPatientKept, isCodeKept, isEntryKept, _ = matrix.filter_min_degrees(minCodes, minPatients)
+
+    expectedPatients, expectedCodes = _naive_filter(
+        {ind: {"Code{:d}".format(j) for j in i} for ind, i in enumerate(patientCodes)}, set(codes), minCodes,
+        minPatients
+    )
+    assert set(np.flatnonzero(isPatientKept).tolist()) == expectedPatients
+    assert {codes[i] for i in np.flatnonzero(isCodeKept)} == expectedCodes
+    assert np.array_equal(isEntryKept, isPatientKept[matrix.rowIndices] & isCodeKept[matrix.codeIndices])
+
+
+def test_iterative_filtering_matches_naive_filter(dirProcessedData, create_config):
+    config = create_config({"DataProcessing": {"IterativeFiltering": True, "MinCodes": 8, "MinPatients": 20}})
+    filterResults = generate_datasets.filter_patients(dirProcessedData, config)
+    validPatientData = filterResults["ValidPatientData"]
+    validCodes = filterResults["ValidCodes"]
+
+    with open(os.path.join(dirProcessedData, "PatientDemographics.tsv"), 'r') as fidPatientData:
+        patientCodes = {
+            i.split('\t')[0]: set(i.rstrip('\n').split('\t')[3].split(',')) for i in fidPatientData.readlines()[1:]
+        }
+    expectedPatients, expectedCodes = _naive_filter(
+        patientCodes, {j for i in patientCodes.values() for j in i}, 8, 20
+    )
+    assert 0 < len(validPatientData) < len(patientCodes)
+    assert {i for i in patientCodes if i in validPatientData} == expectedPatients
+    assert validCodes == expectedCodes
+
+
+def _naive_filter(patientCodes, codes, minCodes, minPatients):
+    """Remove patients with too few codes and codes with too few patients until neither removes anything.
+
+    :param patientCodes:    The codes associated with each patient.
+    :type patientCodes:     dict
+    :param codes:           The codes.
+    :type codes:            set
+    :param minCodes:        The minimum number of remaining codes a patient must be associated with to remain.
+    :type minCodes:         int
+    :param minPatients:     The minimum number of remaining patients a code must be associated with to remain.
+    :type minPatients:      int
+    :return:                The patients and codes remaining.
+    :rtype:                 set, set
+
+    """
+
+    patients = set(patientCodes)
+    codes = set(codes)
+    while True:
+        keptPatients = {i for i in patients if len(patientCodes[i] & codes) >= minCodes}
+        keptCodes = {i for i in codes if sum(i in patientCodes[j] for j in keptPatients) >= minPatients}
+        if keptPatients == patients and keptCodes == codes:
+            return patients, codes
+        patients, codes = keptPatients, keptCodes
@@ -0,0 +1,55 @@
+"""Tests of the recording of the time spent in each part of a stage."""
+
+# Python imports.
+import threading
+import time
+
+# User imports.
+from Utilities import instrumentation
+
+# 3rd party imports.
+import pytest
+
+
+@pytest.fixture
+def recorder():
+    """Enable recording for a test, disabling it again afterwards."""
+
+    instrumentation.enable()
+    yield
+    instrumentation._RECORDER = None
+
+
+def test_nested_timers_are_exclusive(recorder):
+    instrumentation.start_stage("Stage")
+    with instrumentation.timer("Outer"):
+        time.sleep(0.05)
+        with instrumentation.timer("Inner"):
+            time.sleep(0.2)
+    timers = instrumentation.take_timers()
+    instrumentation.end_stage()
+    assert 0.05 <= timers["Outer"] < 0.2
+    assert timers["Inner"] >= 0.2
+
+
+def test_timers_of_threads_are_separate(recorder):
+    # A timer running on another thread must neither pause nor be paused by the timers of this thread.
+    instrumentation.start_stage("Stage")
+    isStarted = threading.Event()
+
+    def parse():
+        with instrumentation.timer("Parsing"):
+            isStarted.set()
+            time.sleep(0.3)
+
+    thread = threading.Thread(target=parse)
+    thread.start()
+    isStarted.wait()
+    with instrumentation.timer("Writing"):
+        time.sleep(0.1)
+    thread.join()
+    instrumentation.end_stage()
+
+    stageTimers = instrumentation._RECORDER.stages[-1]["Timers"]
+    assert stageTimers["Parsing"] >= 0.3
+    assert stageTimers["Writing"] >= 0.1
@@ -0,0 +1,57 @@
+"""Tests that the parsing of journal table entries matches the original character by character parser."""
+
+# User imports.
+from Benchmarks import benchmark_parse_patient_entry
+from DataProcessing.JournalTable import parse_patient_entry
+
+# 3rd party imports.
+import pytest
+
+# Globals.
+CORPUS = [  # The values of insert statements covering the quoting and delimiting cases the parser must handle.
+    "26044,'C10E','1998-04-16',0.0000,0.0000,null",
+    "26044,'C10E','1998-04-16',120.0000,45.0000,'ONE TO BE TAKEN FOUR TIMES A DAY'",
+    "26044,'2469,v=130,w=80','1998-04-16',130.0000,80.0000,null",
+    "26044,'2469,v=130,w=80','1998-04-16',130.0000,80.0000,'TAKE ONE, TWICE A DAY'",
+    "26044,'XaJ8.','1998-04-16',0.0000,0.0000,'A, B, C'",
+    "26044,\"C10E\",\"1998-04-16\",0.0000,0.0000,\"DOUBLE, QUOTED\"",
+    "26044,'C10E\",'1998-04-16',0.0000,0.0000,null",
+    "26044,'','1998-04-16',0.0000,0.0000,null",
+    ",'C10E','1998-04-16',0.0000,0.0000,null",
+    "26044,'C10E','1998-04-16',0.0000,0.0000,'UNTERMINATED, QUOTE",
+    "26044,'C10E','1998-04-16',0.0000,0.0000,'IT''S, QUOTED'",
+    "26044,'C10E','1998-04-16',0.0000,0.0000,'',''",
+    "26044,'C10E','1998-04-16','1,5',0.0000,null",
+    "26044,'C10E','1998-04-16',0.0000,0.0000,',,,'",
+    "26044,'C10E','1998-04-16'",
+    ",",
+]
+CORPUS_LINES = [
+    "{:s}{:s});\n".format(benchmark_parse_patient_entry.INSERT_PREFIX, i) for i in CORPUS
+]
+RANDOM_LINES = benchmark_parse_patient_entry.generate_lines(2000, 0.2)
+
+
+@pytest.mark.parametrize("line", CORPUS_LINES)
+def test_main_matches_reference(line):
+    assert parse_patient_entry.main(line) == benchmark_parse_patient_entry.reference_parse(line)
+
+
+def test_main_matches_reference_on_random_lines():
+    assert [parse_patient_entry.main(i) for i in RANDOM_LINES] == \
+        [benchmark_parse_patient_entry.reference_parse(i) for i in RANDOM_LINES]
+
+
+def test_main_batch_matches_reference():
+    lines = CORPUS_LINES + RANDOM_LINES
+    assert parse_patient_entry.main_batch(lines) == [benchmark_parse_patient_entry.reference_parse(i) for i in lines]
+
+
+def test_main_batch_block_matches_reference():
+    assert parse_patient_entry.main_batch(''.join(RANDOM_LINES)) == \
+        [benchmark_parse_patient_entry.reference_parse(i) for i in RANDOM_LINES]
+
+
+def test_main_batch_of_no_lines():
+    assert parse_patient_entry.main_batch([]) == []
+    assert parse_patient_entry.main_batch("") == []
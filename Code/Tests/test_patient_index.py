@@ -0,0 +1,116 @@
+"""Tests of the index of the patient records in the processed journal table."""
+
+# Python imports.
+import builtins
+import filecmp
+import os
+import shutil
+
+# User imports.
+from DataProcessing.JournalTable import columnar_cache
+from DataProcessing.JournalTable import demographics_store
+from DataProcessing.JournalTable import generate_datasets
+from DataProcessing.JournalTable import patient_index
+from DataProcessing.JournalTable import process_table
+
+# 3rd party imports.
+import pytest
+
+
+def test_index_records_match_journal_table(dirProcessedData):
+    fileJournalTable = os.path.join(dirProcessedData, "JournalTable.tsv")
+    with open(fileJournalTable, 'rb') as fidJournalTable:
+        _ = fidJournalTable.readline()  # Strip the header.
+        expectedLines = fidJournalTable.readlines()
+
+    # Reading every record gives the lines of the journal table, with each record holding the lines of its patient.
+    with open(os.path.join(dirProcessedData, patient_index.INDEX_FILE), 'r') as fidIndex:
+        index = [i.rstrip('\n').split('\t') for i in fidIndex.readlines()[1:]]
+    with open(fileJournalTable, 'rb') as fidJournalTable:
+        recordLines = [
+            list(patient_index.read_records(fidJournalTable, [(int(offset), int(numRows))]))
+            for _, offset, numRows in index
+        ]
+    assert [i for j in recordLines for i in j] == expectedLines
+    assert all(j.split(b'\t')[0].decode() == i[0] for i, k in zip(index, recordLines) for j in k)
+
+
+def test_find_records_of_few_patients(dirProcessedData):
+    patientIDs = _select_patients(dirProcessedData, 5)
+    builder = demographics_store.DemographicsBuilder()
+    for i in patientIDs:
+        builder.add(i, 1970, 'F')
+    records = patient_index.find_records(dirProcessedData, builder.build())
+    assert records is not None and len(records) == len(patientIDs)
+
+    # Too many patients are quicker to find by reading the entire journal table.
+    builder = demographics_store.DemographicsBuilder()
+    for i in _select_patients(dirProcessedData, 50):
+        builder.add(i, 1970, 'F')
+    assert patient_index.find_records(dirProcessedData, builder.build()) is None
+
+
+def test_index_matches_scan(dirProcessedData, create_config, tmp_path):
+    # Copy the processed data without the columnar cache, so that the histories are read from the journal table, with
+    # and without the index.
+    dirIndexed = str(tmp_path / "Indexed")
+    shutil.copytree(dirProcessedData, dirIndexed, ignore=shutil.ignore_patterns(columnar_cache.CACHE_DIRECTORY))
+    dirScanned = str(tmp_path / "Scanned")
+    shutil.copytree(dirIndexed, dirScanned)
+    os.remove(os.path.join(dirScanned, patient_index.INDEX_FILE))
+
+    config = create_config({"DataProcessing": {"PatientsToKeep": _select_patients(dirProcessedData, 5)}})
+    datasetFiles = None
+    for i in [dirIndexed, dirScanned]:
+        dirOutput = os.path.join(i, "Datasets")
+        os.mkdir(dirOutput)
+        generate_datasets.main(i, dirOutput, config)
+        datasetFiles = datasetFiles or sorted(os.listdir(dirOutput))
+    _, mismatches, errors = filecmp.cmpfiles(
+        os.path.join(dirIndexed, "Datasets"), os.path.join(dirScanned, "Datasets"), datasetFiles, shallow=False
+    )
+    assert mismatches + errors == []
+
+
+@pytest.mark.parametrize("numProcesses", [1, 2])
+def test_offsets_with_windows_newlines(numProcesses, dirSQLFiles, monkeypatch, tmp_path):
+    # Translate the newlines of files written in text mode as Windows does.
+    builtinOpen = builtins.open
+
+    def open_windows(file, mode='r', *args, newline=None, **kwargs):
+        if newline is None and 'b' not in mode and ('w' in mode or 'a' in mode):
+            newline = "\r\n"
+        return builtinOpen(file, mode, *args, newline=newline, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", open_windows)
+    dirProcessed = str(tmp_path / "Processed")
+    os.mkdir(dirProcessed)
+    process_table.main(dirSQLFiles, dirProcessed, numProcesses=numProcesses)
+    monkeypatch.undo()
+
+    # Seeking to the offset of each record finds the first line of the patient's record.
+    with open(os.path.join(dirProcessed, patient_index.INDEX_FILE), 'r') as fidIndex:
+        index = [i.rstrip('\n').split('\t') for i in fidIndex.readlines()[1:]]
+    assert index
+    with open(os.path.join(dirProcessed, "JournalTable.tsv"), 'rb') as fidJournalTable:
+        for patientID, offset, numRows in index:
+            lines = list(patient_index.read_records(fidJournalTable, [(int(offset), int(numRows))]))
+            assert {i.split(b'\t')[0].decode() for i in lines} == {patientID}
+            assert all(i.endswith(b"\n") and not i.endswith(b"\r\n") for i in lines)
+
+
+def _select_patients(dirProcessedData, numPatients):
+    """Select patients spread through the processed journal table.
+
+    :param dirProcessedData:    The location of the directory containing the processed journal table files.
+    :type dirProcessedData:     str
+    :param numPatients:         The number of patients to select.
+    :type numPatients:          int
+    :return:                    The IDs of the patients selected.
+    :rtype:                     list[str]
+
+    """
+
+    with open(os.path.join(dirProcessedData, patient_index.INDEX_FILE), 'r') as fidIndex:
+        patientIDs = [i.split('\t')[0] for i in fidIndex.readlines()[1:]]
+    return patientIDs[::len(patientIDs) // numPatients][:numPatients]
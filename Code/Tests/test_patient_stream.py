@@ -0,0 +1,118 @@
+"""Tests of streaming the histories of patients from the processed data."""
+
+# Python imports.
+import os
+
+# User imports.
+from DataProcessing.JournalTable import generate_datasets
+from DataProcessing.JournalTable import patient_stream
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+# Globals.
+PATIENTS = [  # Histories of patients with differing numbers of visits and years.
+    patient_stream.Patient(
+        "1", 'M', np.array([0, 2, 1, 2], dtype=np.int32), np.array([30, 30, 31, 33]),
+        np.array([0, 0, 1, 2], dtype=np.int32), np.array([2000, 2000, 2001, 2003], dtype=np.int32),
+        np.zeros(4, dtype=np.float32), np.zeros(4, dtype=np.float32)
+    ),
+    patient_stream.Patient(
+        "2", 'F', np.array([1], dtype=np.int32), np.array([50]), np.array([0], dtype=np.int32),
+        np.array([1990], dtype=np.int32), np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.float32)
+    ),
+    patient_stream.Patient(
+        "3", 'F', np.array([2, 2, 0], dtype=np.int32), np.array([10, 11, 11]), np.array([0, 1, 1], dtype=np.int32),
+        np.array([2010, 2011, 2011], dtype=np.int32), np.zeros(3, dtype=np.float32), np.zeros(3, dtype=np.float32)
+    ),
+]
+
+
+def test_stream_applies_minimum_visits_and_years(dirProcessedData, create_config, tmp_path):
+    config = create_config({"DataProcessing": {
+        "MinVisits": 8, "MinYears": 6, "Outputs": ["CodeCount_Visits", "CodeCount_Years"]
+    }})
+    generate_datasets.main(dirProcessedData, str(tmp_path), config)
+    datasetPatients = {}
+    for i in ["CodeCount_Visits", "CodeCount_Years"]:
+        with open(os.path.join(str(tmp_path), "{:s}.tsv".format(i)), 'r') as fidDataset:
+            datasetPatients[i] = {j.split('\t')[0][len("_ID:"):] for j in fidDataset.readlines()[1:]}
+
+    # Only the patients in both the visit and year based datasets are streamed.
+    stream = patient_stream.iter_patients(dirProcessedData, config)
+    streamedPatients = [i.patientID for i in stream]
+    assert set(streamedPatients) == datasetPatients["CodeCount_Visits"] & datasetPatients["CodeCount_Years"]
+    assert len(stream) == len(streamedPatients)
+    assert len(streamedPatients) < len(patient_stream.iter_patients(dirProcessedData, create_config()))
+
+
+def test_length_of_stream_before_iterating(dirProcessedData, create_config):
+    config = create_config({"DataProcessing": {"MinVisits": 8}})
+    assert len(patient_stream.iter_patients(dirProcessedData, config)) == \
+        len(list(patient_stream.iter_patients(dirProcessedData, config)))
+
+
+def test_time_step_vectors_match_datasets(dirProcessedData, create_config, tmp_path):
+    config = create_config({"DataProcessing": {"Outputs": [
+        "{:s}_{:s}".format(i, j) for i in ["BinaryIndicator", "CodeCount"] for j in patient_stream.TIME_STEPS
+    ]}})
+    generate_datasets.main(dirProcessedData, str(tmp_path), config)
+    stream = patient_stream.iter_patients(dirProcessedData, config)
+    patients = list(stream)
+
+    for valueType in ["BinaryIndicator", "CodeCount"]:
+        for timeStep in patient_stream.TIME_STEPS:
+            datasetRows = {}
+            with open(str(tmp_path / "{:s}_{:s}.tsv".format(valueType, timeStep)), 'r') as fidDataset:
+                header = fidDataset.readline().rstrip('\n').split('\t')
+                assert header[3:] == stream.codes
+                for line in fidDataset:
+                    entries = [i.split(':') for i in line.rstrip('\n').split('\t')]
+                    datasetRows.setdefault(entries[0][1], []).append(
+                        (int(entries[1][1]), {i: int(j) for i, j in entries[3:]})
+                    )
+
+            streamRows = {}
+            for patient in patients:
+                ages, vectors = patient_stream.time_step_vectors(
+                    patient, len(stream.codes), timeStep, valueType == "BinaryIndicator"
+                )
+                assert vectors.dtype == (np.uint8 if valueType == "BinaryIndicator" else np.int32)
+                streamRows[patient.patientID] = [
+                    (int(i), {stream.codes[k]: int(j[k]) for k in np.flatnonzero(j)}) for i, j in zip(ages, vectors)
+                ]
+            assert streamRows == datasetRows, "{:s}_{:s}".format(valueType, timeStep)
+
+
+def test_time_step_vectors_of_unknown_time_step():
+    with pytest.raises(ValueError):
+        patient_stream.time_step_vectors(PATIENTS[0], 3, "Months")
+
+
+@pytest.mark.parametrize("isDropLast", [False, True])
+def test_minibatches_are_padded(isDropLast):
+    batches = list(patient_stream.minibatches(PATIENTS, 3, 2, "Visits", isDropLast=isDropLast))
+    assert len(batches) == (1 if isDropLast else 2)
+
+    # The vectors of each patient are padded with zeros to the most time steps of a patient in the minibatch.
+    assert batches[0]["PatientIDs"] == ["1", "2"]
+    assert batches[0]["Genders"].tolist() == [1, 0]
+    assert batches[0]["Lengths"].tolist() == [3, 1]
+    assert batches[0]["Ages"].tolist() == [[30, 31, 33], [50, 0, 0]]
+    assert batches[0]["Vectors"].shape == (2, 3, 3)
+    assert batches[0]["Vectors"].tolist() == [
+        [[1, 0, 1], [0, 1, 0], [0, 0, 1]],
+        [[0, 1, 0], [0, 0, 0], [0, 0, 0]]
+    ]
+    if not isDropLast:
+        assert batches[1]["PatientIDs"] == ["3"]
+        assert batches[1]["Lengths"].tolist() == [2]
+        assert batches[1]["Vectors"].tolist() == [[[0, 0, 1], [1, 0, 1]]]
+
+
+def test_minibatches_of_binary_cumulative_vectors():
+    batch = next(patient_stream.minibatches(PATIENTS[2:], 3, 4, "Years_C", isBinary=True))
+    assert batch["Vectors"].dtype == np.uint8
+    assert batch["Ages"].tolist() == [[10, 11]]
+    assert batch["Vectors"].tolist() == [[[0, 0, 1], [1, 0, 1]]]
@@ -0,0 +1,43 @@
+"""Tests of the matching of patient IDs and codes against the keep/ignore patterns."""
+
+# Python imports.
+import re
+
+# User imports.
+from DataProcessing.JournalTable import pattern_matcher
+
+# 3rd party imports.
+import pytest
+
+# Globals.
+PATTERNS = ["26046", "C10.*", "G30..", "C10[EF]", "26046", "C10.*", "", ".*X"]  # Patterns of each kind, with repeats.
+STRINGS = ["26046", "260461", "C10", "C10E", "C1", "G30..", "G30AB", "G30A", "AX", "X", "", "c10E"]
+
+
+@pytest.mark.parametrize("patterns", [PATTERNS, PATTERNS[:2], ["C10.*"], [".*"], []])
+def test_match_is_anchored_alternation(patterns):
+    matcher = pattern_matcher.PatternMatcher(patterns, True)
+    reference = re.compile('|'.join("(?:{:s})$".format(i) for i in patterns)) if patterns else None
+    for i in STRINGS:
+        assert matcher.match(i) == (reference is None or reference.match(i) is not None), i
+
+
+def test_empty_patterns():
+    assert pattern_matcher.PatternMatcher([], True).match("C10E")
+    assert not pattern_matcher.PatternMatcher([], False).match("C10E")
+
+
+def test_counts_include_repeated_patterns():
+    matcher = pattern_matcher.PatternMatcher(PATTERNS, True)
+    assert matcher.counts == {"Literal": 3, "Prefix": 2, "Regex": 3}
+
+
+def test_from_id_file(tmp_path):
+    fileIDs = tmp_path / "IDs.txt"
+    fileIDs.write_text("26046\n 26047 \n\n26046\nC10.*\n")
+    matcher = pattern_matcher.PatternMatcher.from_id_file(str(fileIDs), False)
+    assert matcher.counts == {"Literal": 4, "Prefix": 0, "Regex": 0}
+    assert [matcher.match(i) for i in ["26046", "26047", "C10.*", "C10E", ""]] == [True, True, True, False, False]
+
+    fileIDs.write_text("\n")
+    assert pattern_matcher.PatternMatcher.from_id_file(str(fileIDs), True).match("26046")
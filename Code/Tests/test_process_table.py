@@ -0,0 +1,198 @@
+"""Tests of the processing of the journal table."""
+
+# Python imports.
+import filecmp
+import os
+import shutil
+
+# User imports.
+from DataProcessing.JournalTable import cache_manifest
+from DataProcessing.JournalTable import columnar_cache
+from DataProcessing.JournalTable import process_table
+
+# 3rd party imports.
+import pytest
+
+# Globals.
+PROCESSED_FILES = ["Codes.txt", "JournalTable.tsv", "PatientDemographics.tsv", "PatientIndex.tsv", "Statistics.txt"]
+
+
+def test_multiple_processes_match_single_process(dirSQLFiles, tmp_path):
+    dirSingle = _make_directory(tmp_path / "Single")
+    dirMultiple = _make_directory(tmp_path / "Multiple")
+    process_table.main(dirSQLFiles, dirSingle)
+    process_table.main(dirSQLFiles, dirMultiple, numProcesses=3)
+    assert _differing_files(dirSingle, dirMultiple) == []
+
+
+def test_check_status_of_source_files(dirSQLFiles, tmp_path):
+    dirSQLCopy = str(tmp_path / "SQLFiles")
+    shutil.copytree(dirSQLFiles, dirSQLCopy)
+    dirProcessed = _make_directory(tmp_path / "Processed")
+    assert cache_manifest.check(dirSQLCopy, dirProcessed)["Status"] == cache_manifest.STALE
+    process_table.main(dirSQLCopy, dirProcessed)
+    assert cache_manifest.check(dirSQLCopy, dirProcessed)["Status"] == cache_manifest.FRESH
+    assert cache_manifest.check(dirSQLCopy, dirProcessed, isSorted=True)["Status"] == cache_manifest.STALE
+
+    # Appending to the journal table only needs the appended data processing, while changing it needs everything
+    # processing again.
+    fileJournalTable = os.path.join(dirSQLCopy, "journal.sql")
+    with open(fileJournalTable, 'r') as fidJournalTable:
+        lines = fidJournalTable.readlines()
+    with open(fileJournalTable, 'a') as fidJournalTable:
+        fidJournalTable.write(lines[-1])
+    status = cache_manifest.check(dirSQLCopy, dirProcessed)
+    assert status["Status"] == cache_manifest.APPENDED
+    assert status["Sources"] == cache_manifest.describe_sources(dirSQLCopy)
+    with open(fileJournalTable, 'w') as fidJournalTable:
+        fidJournalTable.writelines([lines[0], lines[2], lines[1]] + lines[3:])
+    assert cache_manifest.check(dirSQLCopy, dirProcessed)["Status"] == cache_manifest.STALE
+
+
+@pytest.mark.parametrize("numProcesses", [1, 2])
+def test_update_matches_full_processing(numProcesses, dirSQLFiles, tmp_path):
+    dirPartial, appendedLines = _split_journal_table(dirSQLFiles, tmp_path)
+    dirProcessed = _make_directory(tmp_path / "Processed")
+    process_table.main(dirPartial, dirProcessed)
+    with open(os.path.join(dirPartial, "journal.sql"), 'a') as fidJournalTable:
+        fidJournalTable.writelines(appendedLines)
+    status = cache_manifest.check(dirPartial, dirProcessed)
+    assert status["Status"] == cache_manifest.APPENDED
+    process_table.update(dirPartial, dirProcessed, numProcesses, status["Sources"])
+    assert cache_manifest.check(dirPartial, dirProcessed)["Status"] == cache_manifest.FRESH
+
+    dirFull = _make_directory(tmp_path / "Full")
+    process_table.main(dirSQLFiles, dirFull)
+    assert _differing_files(dirFull, dirProcessed) == []
+    cacheComparison = filecmp.dircmp(*[
+        os.path.join(i, columnar_cache.CACHE_DIRECTORY) for i in [dirFull, dirProcessed]
+    ])
+    assert cacheComparison.left_only == cacheComparison.right_only == cacheComparison.diff_files == []
+
+
+def test_failed_update_is_stale(dirSQLFiles, tmp_path):
+    dirPartial, appendedLines = _split_journal_table(dirSQLFiles, tmp_path)
+    dirProcessed = _make_directory(tmp_path / "Processed")
+    process_table.main(dirPartial, dirProcessed)
+
+    # Append the history of a patient that is not in the patient table, which fails the update part way through.
+    finalLine = appendedLines[-1]
+    with open(os.path.join(dirPartial, "journal.sql"), 'a') as fidJournalTable:
+        fidJournalTable.writelines(appendedLines)
+        fidJournalTable.write(finalLine.replace("values ({:s},".format(_line_patient(finalLine)), "values (99999999,"))
+    status = cache_manifest.check(dirPartial, dirProcessed)
+    assert status["Status"] == cache_manifest.APPENDED
+    with pytest.raises(KeyError):
+        process_table.update(dirPartial, dirProcessed, 1, status["Sources"])
+    assert cache_manifest.check(dirPartial, dirProcessed)["Status"] == cache_manifest.STALE
+
+
+def test_split_journal_table_on_patient_boundaries(dirSQLFiles):
+    fileJournalTable = os.path.join(dirSQLFiles, "journal.sql")
+    ranges = process_table.split_journal_table(fileJournalTable, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(fileJournalTable)
+    assert all(i[1] == j[0] for i, j in zip(ranges, ranges[1:]))
+
+    # The last patient of each range must not continue into the next range.
+    rangePatients = []
+    for start, end in ranges:
+        lineBlocks = process_table._read_line_blocks(fileJournalTable, start, end)
+        patients = [process_table._get_valid_patient_id(i) for j in lineBlocks for i in j]
+        rangePatients.append([i for i in patients if i is not None])
+    assert all(i[-1] != j[0] for i, j in zip(rangePatients, rangePatients[1:]))
+
+
+def test_windows_line_endings_match_unix_line_endings(dirSQLFiles, tmp_path):
+    # Write a copy of the SQL files with Windows line endings.
+    dirWindows = tmp_path / "Windows"
+    dirWindows.mkdir()
+    for i in ["journal.sql", "patient.sql"]:
+        with open(os.path.join(dirSQLFiles, i), 'rb') as fidUnix, open(str(dirWindows / i), 'wb') as fidWindows:
+            fidWindows.write(fidUnix.read().replace(b"\n", b"\r\n"))
+
+    dirUnix = _make_directory(tmp_path / "UnixProcessed")
+    process_table.main(dirSQLFiles, dirUnix)
+    for numProcesses in [1, 2]:
+        dirProcessed = _make_directory(tmp_path / "WindowsProcessed_{:d}".format(numProcesses))
+        process_table.main(str(dirWindows), dirProcessed, numProcesses=numProcesses)
+        assert _differing_files(dirUnix, dirProcessed) == []
+        shutil.rmtree(dirProcessed)
+
+
+def test_windows_line_ending_free_text(tmp_path):
+    fileJournalTable = str(tmp_path / "journal.sql")
+    with open(fileJournalTable, 'wb') as fidJournalTable:
+        fidJournalTable.write(
+            b"insert into `journal`(`id`,`code`,`date`,`value1`,`value2`,`text`) values "
+            b"(26044,'C10E','1998-04-16',0.0000,0.0000,null);\r\n"
+        )
+    entries = list(process_table._parse_line_blocks(fileJournalTable, 0, None))
+    assert entries == [[["26044", "C10E", "1998-04-16", "0.0000", "0.0000", "null"]]]
+
+
+def _differing_files(dirExpected, dirActual):
+    """Find the processed files that differ between two directories.
+
+    :param dirExpected: The location of the directory containing the expected files.
+    :type dirExpected:  str
+    :param dirActual:   The location of the directory containing the files to compare.
+    :type dirActual:    str
+    :return:            The names of the PROCESSED_FILES that differ or are missing.
+    :rtype:             list[str]
+
+    """
+
+    _, mismatches, errors = filecmp.cmpfiles(dirExpected, dirActual, PROCESSED_FILES, shallow=False)
+    return mismatches + errors
+
+
+def _line_patient(line):
+    """Extract the patient ID from a line of a journal table SQL file.
+
+    :param line:    The line of the journal table.
+    :type line:     str
+    :return:        The ID of the patient.
+    :rtype:         str
+
+    """
+
+    return line.split("values (", 1)[1].split(',', 1)[0]
+
+
+def _make_directory(path):
+    """Create a directory for processed data.
+
+    :param path:    The location of the directory.
+    :type path:     pathlib.Path
+    :return:        The location of the directory.
+    :rtype:         str
+
+    """
+
+    path.mkdir()
+    return str(path)
+
+
+def _split_journal_table(dirSQLFiles, tmp_path):
+    """Copy the SQL files with the journal table cut part way through the history of a patient.
+
+    :param dirSQLFiles:     The location of the directory containing the SQL files to copy.
+    :type dirSQLFiles:      str
+    :param tmp_path:        The location of the directory to save the copy in.
+    :type tmp_path:         pathlib.Path
+    :return:                The location of the directory containing the copied SQL files and the lines of the journal
+                                table that were cut off.
+    :rtype:                 str, list[str]
+
+    """
+
+    dirPartial = str(tmp_path / "PartialSQLFiles")
+    shutil.copytree(dirSQLFiles, dirPartial)
+    with open(os.path.join(dirSQLFiles, "journal.sql"), 'r') as fidJournalTable:
+        lines = fidJournalTable.readlines()
+    cut = (2 * len(lines)) // 3
+    while _line_patient(lines[cut - 1]) != _line_patient(lines[cut]):
+        cut += 1
+    with open(os.path.join(dirPartial, "journal.sql"), 'w') as fidJournalTable:
+        fidJournalTable.writelines(lines[:cut])
+    return dirPartial, lines[cut:]
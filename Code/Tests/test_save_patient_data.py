@@ -0,0 +1,93 @@
+"""Tests of the recording of the raw values of a patient's history."""
+
+# User imports.
+from DataProcessing.JournalTable import dataset_writers
+from DataProcessing.JournalTable import save_patient_data
+
+# 3rd party imports.
+import numpy as np
+import pytest
+
+# Globals.
+HISTORY = [  # A patient's history with repeated values of a code within visits and years.
+    {"Age": 40, "Code": "A", "Val1": 144.7562, "Val2": 0.0, "Visit": 0, "Year": 1990},
+    {"Age": 40, "Code": "B", "Val1": 1.0, "Val2": 2.0, "Visit": 0, "Year": 1990},
+    {"Age": 40, "Code": "A", "Val1": 3.5, "Val2": 0.0, "Visit": 0, "Year": 1990},
+    {"Age": 41, "Code": "C", "Val1": 9.0, "Val2": 0.0, "Visit": 1, "Year": 1991},
+    {"Age": 41, "Code": "B", "Val1": 0.0, "Val2": 1234567.0, "Visit": 2, "Year": 1991},
+    {"Age": 43, "Code": "A", "Val1": 0.1, "Val2": 5.0, "Visit": 3, "Year": 1993},
+]
+VALUE_COLUMNS = {"A": (("Val1", 0),), "B": (("Val1", 1), ("Val2", 2))}  # Code C has no values recorded.
+COLUMN_NAMES = ["A_Val1", "B_Val1", "B_Val2"]
+
+
+@pytest.mark.parametrize("key", [None, "Visit", "Year"])
+@pytest.mark.parametrize("policy", save_patient_data.RAW_VALUE_POLICIES)
+def test_raw_values_match_reference(key, policy):
+    numTimeSteps, ages, rowOffsets, columns, values = save_patient_data._raw_values(
+        HISTORY, key, VALUE_COLUMNS, policy
+    )
+    expectedNumTimeSteps, expectedRows = _reference_raw_values(HISTORY, key, VALUE_COLUMNS, policy)
+    assert numTimeSteps == expectedNumTimeSteps
+    assert values.dtype == np.float32
+    rows = [
+        (ages[i], list(zip(columns[j:k].tolist(), values[j:k].tolist())))
+        for i, (j, k) in enumerate(zip(rowOffsets[:-1], rowOffsets[1:]))
+    ]
+    assert rows == expectedRows
+
+
+def test_write_value_rows_is_lossless(tmp_path):
+    fileOutput = str(tmp_path / "RawData_Visits.tsv")
+    writer = dataset_writers.TSVWriter(fileOutput, {j: i for i, j in enumerate(COLUMN_NAMES)})
+    values = np.array([144.7562, 1234567, 0.1, 3.4e38, -2.5e-7], dtype=np.float32)
+    writer.write_value_rows(
+        "1", 'M', [40, 41], np.array([0, 2, 5]), np.array([0, 1, 2, 0, 1], dtype=np.int32), values
+    )
+    writer.close()
+
+    with open(fileOutput, 'r') as fidOutput:
+        lines = fidOutput.read().splitlines()
+    assert lines[0] == "_ID\t_Age\t_Gender\tA_Val1\tB_Val1\tB_Val2"
+    assert lines[1].startswith("_ID:1\t_Age:40\t_Gender:M\tA_Val1:144.7562\tB_Val1:")
+    entries = [i.rsplit(':', 1) for j in lines[1:] for i in j.split('\t')[3:]]
+    assert [i for i, _ in entries] == ["A_Val1", "B_Val1", "B_Val2", "A_Val1", "B_Val1"]
+    assert np.array_equal(np.array([i for _, i in entries], dtype=np.float32), values)
+
+
+def _reference_raw_values(patientData, key, valueColumns, policy):
+    """Collect the raw values of each time step one value at a time.
+
+    :param patientData:     The patient's history.
+    :type patientData:      list[dict]
+    :param key:             The key of the history entries that determines the time step of an entry, or None.
+    :type key:              str | None
+    :param valueColumns:    The value and column of each raw data column of each code with values.
+    :type valueColumns:     dict
+    :param policy:          How a column with several values in one time step is recorded.
+    :type policy:           str
+    :return:                The number of time steps, and the age and (column, value) pairs of each row with values.
+    :rtype:                 int, list[tuple]
+
+    """
+
+    stepAges = {}
+    stepValues = {}
+    for i in patientData:
+        timeStep = 0 if key is None else i[key]
+        stepAges[timeStep] = i["Age"]
+        for valueKey, column in valueColumns.get(i["Code"], ()):
+            if i[valueKey] != 0:
+                stepValues.setdefault(timeStep, {}).setdefault(column, []).append(float(np.float32(i[valueKey])))
+    rows = []
+    for timeStep in sorted(stepValues):
+        entries = []
+        for column in sorted(stepValues[timeStep]):
+            columnValues = stepValues[timeStep][column]
+            if policy == "Last":
+                columnValues = columnValues[-1:]
+            elif policy == "Mean":
+                columnValues = [float(np.float32(sum(columnValues) / len(columnValues)))]
+            entries.extend((column, i) for i in columnValues)
+        rows.append((stepAges[timeStep], entries))
+    return len(stepAges), rows
@@ -1,8 +1,14 @@
-"""A function to calculate the age of a person at a given timepoint."""
+"""Functions to calculate the age of a person at a given timepoint, either for one timepoint or a batch of them."""
 
 # Python imports.
 import datetime
 
+# User imports.
+from Utilities import iso_dates
+
+# 3rd party imports.
+import numpy as np
+
 
 def main(born, comparison=None, isFraction=False):
     """Calculate a person's age at a given timepoint.
@@ -56,3 +62,77 @@ def main(born, comparison=None, isFraction=False):
         return yearsOld + ((meanSecondsInYear - daysUntilBirthday.total_seconds()) / meanSecondsInYear)
     else:
         return yearsOld
+
+
+def main_batch(born, comparison, isFraction=False):
+    """Calculate the ages of people at given dates, with the same results as calling main on each pair of dates.
+
+    :param born:        The dates when the people were born, as day ordinals (see datetime.date.toordinal) or
+                            datetime64 values.
+    :type born:         np.array | list[int]
+    :param comparison:  The dates to calculate the ages at, in the same form as the dates of birth.
+    :type comparison:   np.array | list[int]
+    :param isFraction:  Whether the ages should be returned as fractional years or whole years.
+    :type isFraction:   bool
+    :return:            The age at each comparison date.
+    :rtype:             np.array
+
+    """
+
+    born = _to_days(born)
+    comparison = _to_days(comparison)
+    bornYear, bornMonth, bornDay = _split_dates(born)
+    comparisonYear, comparisonMonth, comparisonDay = _split_dates(comparison)
+
+    # Determine if each birthday would have occurred already in the year that the comparison occurs in.
+    birthdayOccurred = (bornMonth < comparisonMonth) | ((bornMonth == comparisonMonth) & (bornDay < comparisonDay))
+
+    # Get the integer number of years.
+    yearsOld = comparisonYear - bornYear - (~birthdayOccurred)
+    if not isFraction:
+        return yearsOld
+
+    # Determine days until each person's next birthday. Building the birthday from the month and day as an offset from
+    # the start of the year turns February 29th into March 1st in years that are not leap years.
+    nextBirthdayYear = comparisonYear + birthdayOccurred
+    nextBirthday = (
+        (nextBirthdayYear - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (bornMonth - 1)
+    ).astype("datetime64[D]") + (bornDay - 1)
+    daysUntilBirthday = (nextBirthday - comparison).astype(np.int64)
+
+    # Return the ages.
+    meanSecondsInYear = 365.25 * 24 * 60 * 60
+    return yearsOld + ((meanSecondsInYear - daysUntilBirthday * 24 * 60 * 60) / meanSecondsInYear)
+
+
+def _split_dates(dates):
+    """Split dates into their year, month and day.
+
+    :param dates:   The dates to split.
+    :type dates:    np.array
+    :return:        The year, month (1-12) and day of the month (1-31) of each date.
+    :rtype:         tuple
+
+    """
+
+    months = dates.astype("datetime64[M]")
+    return (
+        dates.astype("datetime64[Y]").astype(np.int64) + 1970, months.astype(np.int64) % 12 + 1,
+        (dates - months.astype("datetime64[D]")).astype(np.int64) + 1
+    )
+
+
+def _to_days(dates):
+    """Convert dates given as day ordinals or datetime64 values to datetime64[D] values.
+
+    :param dates:   The dates to convert.
+    :type dates:    np.array | list[int]
+    :return:        The dates as datetime64[D] values.
+    :rtype:         np.array
+
+    """
+
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype("datetime64[D]")
+    return iso_dates.to_datetime64(dates)
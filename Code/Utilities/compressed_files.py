@@ -0,0 +1,239 @@
+"""Functions to read and write files that may be compressed, with the compression codec determined by the extension.
+
+gzip compression is always available, while zstd and lz4 compression are available when the zstandard and lz4
+packages are installed. Compressed text files are written by a ThreadedWriter, which compresses and writes the text on
+a background thread so that compression overlaps with the work producing the text.
+"""
+
+# Python imports.
+import gzip
+import io
+import os
+import queue
+import threading
+
+# 3rd party imports.
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Globals.
+BUFFER_SIZE = 1 << 20  # The number of characters buffered before being passed to the compression thread.
+CODECS = {"gzip": ".gz", "lz4": ".lz4", "zstd": ".zst"}  # The file extension of each compression codec.
+GZIP_LEVEL = 6  # The compression level used when writing gzip files.
+QUEUE_SIZE = 8  # The maximum number of buffers waiting to be compressed.
+
+
+def add_extension(fileName, codec):
+    """Add the extension of a compression codec to a file name.
+
+    :param fileName:    The file name to add the extension to.
+    :type fileName:     str
+    :param codec:       The compression codec (one of the keys of CODECS), or None for no compression.
+    :type codec:        str | None
+    :return:            The file name with the extension of the codec added.
+    :rtype:             str
+
+    """
+
+    return fileName if codec is None else "{:s}{:s}".format(fileName, CODECS[codec])
+
+
+def find_file(fileName):
+    """Find a file, or a version of it compressed with an available codec.
+
+    :param fileName:    The location of the uncompressed file.
+    :type fileName:     str
+    :return:            The location of the file found (the uncompressed file is preferred), or None if no file exists.
+    :rtype:             str | None
+
+    """
+
+    for i in [None] + sorted(CODECS):
+        if i is None or is_available(i):
+            candidate = add_extension(fileName, i)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def get_codec(fileName):
+    """Determine the compression codec of a file from its extension.
+
+    :param fileName:    The location of the file.
+    :type fileName:     str
+    :return:            The compression codec of the file, or None if the file is not compressed.
+    :rtype:             str | None
+
+    """
+
+    for codec, extension in CODECS.items():
+        if fileName.endswith(extension):
+            return codec
+    return None
+
+
+def is_available(codec):
+    """Determine whether a compression codec can be used.
+
+    :param codec:   The compression codec (one of the keys of CODECS).
+    :type codec:    str
+    :return:        Whether the package needed for the codec is installed.
+    :rtype:         bool
+
+    """
+
+    return codec == "gzip" or (codec == "lz4" and lz4 is not None) or (codec == "zstd" and zstandard is not None)
+
+
+def open_file(fileName, mode='r', newline=None):
+    """Open a file that may be compressed.
+
+    Compressed files can be opened for reading in text or binary mode, and for writing in text mode. Compressed files
+    can not be appended to or have their position changed other than by reading. Text written to a compressed file
+    always has its newlines written as '\n'.
+
+    :param fileName:    The location of the file.
+    :type fileName:     str
+    :param mode:        The mode to open the file in ('r', 'rb' or 'w' for compressed files).
+    :type mode:         str
+    :param newline:     How the newlines of an uncompressed file opened in text mode are translated (see open).
+    :type newline:      str | None
+    :return:            The opened file.
+    :rtype:             io.IOBase | ThreadedWriter
+
+    """
+
+    codec = get_codec(fileName)
+    if codec is None:
+        return open(fileName, mode, newline=newline)
+    elif mode == 'w':
+        return ThreadedWriter(fileName)
+    elif mode in ['r', 'rt']:
+        return _open_compressed(fileName, codec, 'rt')
+    elif mode == 'rb':
+        return _open_compressed(fileName, codec, 'rb')
+    raise ValueError("Compressed files can not be opened in mode {:s}.".format(mode))
+
+
+def _open_compressed(fileName, codec, mode):
+    """Open a compressed file.
+
+    :param fileName:    The location of the file.
+    :type fileName:     str
+    :param codec:       The compression codec of the file.
+    :type codec:        str
+    :param mode:        The mode to open the file in.
+    :type mode:         str
+    :return:            The opened file.
+    :rtype:             io.IOBase
+
+    """
+
+    if not is_available(codec):
+        raise ValueError("The package needed to use {:s} compression is not installed.".format(codec))
+    if codec == "gzip":
+        if mode.startswith('w'):
+            return gzip.open(fileName, mode, compresslevel=GZIP_LEVEL)
+        return gzip.open(fileName, mode)
+    elif codec == "lz4":
+        return lz4.frame.open(fileName, mode)
+    elif mode == 'rb':
+        # The zstd reader only supports reading a number of bytes, so is buffered to allow reading by line.
+        return io.BufferedReader(zstandard.open(fileName, mode), BUFFER_SIZE)
+    return zstandard.open(fileName, mode)
+
+
+class ThreadedWriter:
+    """Write text to a compressed file, with the compression and writing performed on a background thread."""
+
+    def __init__(self, fileName):
+        """Initialise the writer and start its compression thread.
+
+        :param fileName:    The location of the file to write, with the extension of the compression codec to use.
+        :type fileName:     str
+
+        """
+
+        self._fid = _open_compressed(fileName, get_codec(fileName), 'wb')
+        self._buffer = []
+        self._bufferSize = 0
+        self._error = None  # Any exception raised by the compression thread.
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._compress, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """Compress and write any remaining text and close the file."""
+
+        if self._thread is None:
+            return
+        self._submit()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._fid.close()
+        if self._error is not None:
+            raise self._error
+
+    def write(self, text):
+        """Write text to the file.
+
+        :param text:    The text to write.
+        :type text:     str
+        :return:        The number of characters written.
+        :rtype:         int
+
+        """
+
+        self._buffer.append(text)
+        self._bufferSize += len(text)
+        if self._bufferSize >= BUFFER_SIZE:
+            self._submit()
+        return len(text)
+
+    def writelines(self, lines):
+        """Write a sequence of lines to the file.
+
+        :param lines:   The lines to write (including any line endings).
+        :type lines:    iterable
+
+        """
+
+        for i in lines:
+            self.write(i)
+
+    def _compress(self):
+        """Compress and write the buffers passed to the thread until a None is received."""
+
+        while True:
+            block = self._queue.get()
+            if block is None:
+                break
+            if self._error is None:
+                try:
+                    self._fid.write(block)
+                except Exception as e:
+                    # Keep consuming the buffers so that the writing thread is not blocked.
+                    self._error = e
+
+    def _submit(self):
+        """Pass the buffered text to the compression thread."""
+
+        if self._error is not None:
+            raise self._error
+        if self._buffer:
+            self._queue.put(''.join(self._buffer).encode())
+            self._buffer = []
+            self._bufferSize = 0
@@ -0,0 +1,100 @@
+"""Functions to save and load a validated configuration, so that it need not be validated against the schema again.
+
+Validating the default and user configuration files against the schema makes up most of the time taken to start a run.
+The merged configuration is therefore saved in the _ConfigCache_ directory alongside the configuration files, with one
+pickle file per combination of configuration files. Each file is named after a fingerprint of the contents of the
+schema, the configuration files and the module defining the configuration object, along with the encoding that strings
+are converted to and the version of the cache format, so a change to any of them results in the configuration being
+validated again. The number of files kept is capped, with the least recently used files removed first. Failing to save
+the configuration only means that it is validated again on the next run, so is not an error.
+"""
+
+# Python imports.
+import hashlib
+import logging
+import os
+import pickle
+
+# Globals.
+CONFIG_CACHE_DIRECTORY = "_ConfigCache_"  # The name of the cache directory within the configuration files directory.
+CONFIG_CACHE_VERSION = 1  # The version of the cache format.
+LOGGER = logging.getLogger(__name__)
+MAX_ENTRIES = 8  # The maximum number of configurations to keep saved.
+
+
+def fingerprint(fileNames, encoding=None):
+    """Create the fingerprint that the configuration created from a set of files is saved under.
+
+    :param fileNames:   The locations of the files that the configuration is created from, in the order they are used.
+    :type fileNames:    list[str]
+    :param encoding:    The encoding that strings in the configuration are converted to, if any.
+    :type encoding:     str | None
+    :return:            The fingerprint.
+    :rtype:             str
+
+    """
+
+    hasher = hashlib.sha256("{:d}\n{!r}\n".format(CONFIG_CACHE_VERSION, encoding).encode())
+    for i in fileNames:
+        with open(i, 'rb') as fidConfig:
+            content = fidConfig.read()
+        hasher.update("{:d}\n".format(len(content)).encode())
+        hasher.update(content)
+    return hasher.hexdigest()
+
+
+def load(dirCache, key):
+    """Load a saved configuration.
+
+    Loading a file marks it as the most recently used.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+    :param key:         The fingerprint the configuration was saved under.
+    :type key:          str
+    :return:            The configuration, or None if no configuration is saved under the fingerprint.
+    :rtype:             JsonschemaManipulation.Configuration | None
+
+    """
+
+    fileConfig = os.path.join(dirCache, "{:s}.pkl".format(key))
+    try:
+        with open(fileConfig, 'rb') as fidConfig:
+            config = pickle.load(fidConfig)
+        os.utime(fileConfig)
+    except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+    return config
+
+
+def save(dirCache, key, config, maxEntries=MAX_ENTRIES):
+    """Save a validated configuration, removing the least recently used configurations over the cap.
+
+    :param dirCache:    The location of the cache directory.
+    :type dirCache:     str
+    :param key:         The fingerprint to save the configuration under.
+    :type key:          str
+    :param config:      The validated configuration.
+    :type config:       JsonschemaManipulation.Configuration
+    :param maxEntries:  The maximum number of configurations to keep saved.
+    :type maxEntries:   int
+
+    """
+
+    try:
+        os.makedirs(dirCache, exist_ok=True)
+
+        # Write the configuration to a temporary file first, so that a partially written file is never loaded.
+        fileConfig = os.path.join(dirCache, "{:s}.pkl".format(key))
+        fileTemporary = "{:s}.{:d}.tmp".format(fileConfig, os.getpid())
+        with open(fileTemporary, 'wb') as fidConfig:
+            pickle.dump(config, fidConfig, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fileTemporary, fileConfig)
+
+        # Remove the least recently used configurations.
+        savedConfigs = [os.path.join(dirCache, i) for i in os.listdir(dirCache) if i.endswith(".pkl")]
+        savedConfigs.sort(key=os.path.getmtime, reverse=True)
+        for i in savedConfigs[maxEntries:]:
+            os.remove(i)
+    except (OSError, pickle.PicklingError, AttributeError, TypeError) as e:
+        LOGGER.warning("The validated configuration could not be saved for reuse.\n{:s}".format(str(e)))
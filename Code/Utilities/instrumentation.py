@@ -0,0 +1,494 @@
+"""Functions to record the performance of the stages of a run and report the progress of long running loops.
+
+Recording is disabled until enable is called, and while it is disabled every function returns immediately (timer
+returns a shared object that does nothing), so instrumented code runs at full speed. Once enabled, each stage records
+its wall and CPU time (including that of any finished child processes), the counters added to it (e.g. Rows,
+BytesRead and BytesWritten) and the peak resident set size of the process by the end of the stage. Within a stage,
+named timers (e.g. Parsing, Aggregation and Writing) record how the time was split. Timers are exclusive, so time spent
+in a nested timer is not also counted towards the timer enclosing it. Each thread nests its timers separately, and the
+times of all threads are added together, so a stage whose threads run at once can record more time than it took.
+
+Worker processes started by forking inherit whether recording is enabled. After calling start_worker, they can pass the
+times their timers recorded back to the main process with take_timers, to be added to the current stage with
+add_timers.
+"""
+
+# Python imports.
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Globals.
+PROGRESS_COUNT = 1000  # The number of items between progress reports when no reporting interval is given.
+_RECORDER = None  # The recorder of the metrics, or None when recording is disabled.
+
+
+def add_queue(name, statistics):
+    """Add the statistics of a queue between the threads of a pipeline (see pipeline) to the current stage.
+
+    When a queue with the same name has already been added to the stage, the statistics are combined.
+
+    :param name:        The name of the queue.
+    :type name:         str
+    :param statistics:  The statistics of the queue, recorded as:
+                            {"Items": int, "MaxDepth": int, "MeanDepth": float, "ProducerStallSeconds": float,
+                             "ConsumerStallSeconds": float}
+    :type statistics:   dict
+
+    """
+
+    if _RECORDER is None or _RECORDER.currentStage is None:
+        return
+    with _RECORDER.lock:
+        queues = _RECORDER.currentStage.setdefault("Queues", {})
+        if name not in queues:
+            queues[name] = dict(statistics)
+            return
+        combined = queues[name]
+        numItems = combined["Items"] + statistics["Items"]
+        if numItems:
+            combined["MeanDepth"] = (
+                combined["MeanDepth"] * combined["Items"] + statistics["MeanDepth"] * statistics["Items"]
+            ) / numItems
+        combined["Items"] = numItems
+        combined["MaxDepth"] = max(combined["MaxDepth"], statistics["MaxDepth"])
+        combined["ProducerStallSeconds"] += statistics["ProducerStallSeconds"]
+        combined["ConsumerStallSeconds"] += statistics["ConsumerStallSeconds"]
+
+
+def add_timers(timers):
+    """Add the times recorded by timers elsewhere (e.g. in a worker process) to the current stage.
+
+    :param timers:  The seconds recorded by each timer, as returned by take_timers.
+    :type timers:   dict
+
+    """
+
+    if _RECORDER is None or _RECORDER.currentStage is None:
+        return
+    with _RECORDER.lock:
+        stageTimers = _RECORDER.currentStage["Timers"]
+        for i in timers:
+            stageTimers[i] = stageTimers.get(i, 0) + timers[i]
+
+
+def count(name, value):
+    """Add a value to a counter of the current stage.
+
+    :param name:    The name of the counter (e.g. Rows).
+    :type name:     str
+    :param value:   The value to add.
+    :type value:    int
+
+    """
+
+    if _RECORDER is None or _RECORDER.currentStage is None:
+        return
+    with _RECORDER.lock:
+        counters = _RECORDER.currentStage["Counters"]
+        counters[name] = counters.get(name, 0) + value
+
+
+def count_files(name, fileNames):
+    """Add the total size of a collection of files or directories to a counter of the current stage.
+
+    :param name:        The name of the counter (e.g. BytesRead).
+    :type name:         str
+    :param fileNames:   The locations of the files and directories. Those that do not exist are ignored.
+    :type fileNames:    list[str]
+
+    """
+
+    if _RECORDER is None or _RECORDER.currentStage is None:
+        return
+    count(name, sum(_get_size(i) for i in fileNames))
+
+
+def enable():
+    """Start recording metrics, discarding any recorded previously."""
+
+    global _RECORDER
+    _RECORDER = _Recorder()
+
+
+def end_stage():
+    """Finish recording the metrics of the current stage."""
+
+    if _RECORDER is None or _RECORDER.currentStage is None:
+        return
+    currentStage = _RECORDER.currentStage
+    currentStage["WallSeconds"] = time.perf_counter() - currentStage.pop("_StartWall")
+    currentStage["CPUSeconds"] = _get_cpu_time() - currentStage.pop("_StartCPU")
+    currentStage["PeakRSS"] = get_peak_rss(True)
+    if "Rows" in currentStage["Counters"] and currentStage["WallSeconds"] > 0:
+        currentStage["RowsPerSecond"] = currentStage["Counters"]["Rows"] / currentStage["WallSeconds"]
+    _RECORDER.stages.append(currentStage)
+    _RECORDER.currentStage = None
+
+
+def get_peak_rss(includeChildren=False):
+    """Determine the peak resident set size of this process.
+
+    The high water mark recorded in /proc is used where it is available, as the maximum resident set size reported by
+    getrusage is carried across the exec that starts a spawned process, and so can be that of the parent process.
+
+    :param includeChildren: Whether to return the largest peak of this process and its finished child processes.
+    :type includeChildren:  bool
+    :return:                The peak resident set size in bytes.
+    :rtype:                 int
+
+    """
+
+    peakRSS = None
+    try:
+        with open("/proc/self/status", 'r') as fidStatus:
+            for line in fidStatus:
+                if line.startswith("VmHWM:"):
+                    peakRSS = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if peakRSS is None:
+        peakRSS = _rusage_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    if includeChildren:
+        peakRSS = max(peakRSS, _rusage_bytes(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+    return peakRSS
+
+
+def is_enabled():
+    """Determine whether metrics are being recorded.
+
+    :return:    Whether metrics are being recorded.
+    :rtype:     bool
+
+    """
+
+    return _RECORDER is not None
+
+
+def save(fileMetrics):
+    """Save the recorded metrics as JSON.
+
+    :param fileMetrics: The location of the file to save the metrics to.
+    :type fileMetrics:  str
+
+    """
+
+    if _RECORDER is None:
+        return
+    with open(fileMetrics, 'w') as fidMetrics:
+        json.dump(
+            {"WallSeconds": time.perf_counter() - _RECORDER.startTime, "PeakRSS": get_peak_rss(True),
+             "Stages": _RECORDER.stages},
+            fidMetrics, indent=2
+        )
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record the metrics of a stage of the run, as a context manager around start_stage and end_stage.
+
+    :param name:    The name of the stage.
+    :type name:     str
+
+    """
+
+    start_stage(name)
+    try:
+        yield
+    finally:
+        end_stage()
+
+
+def start_stage(name):
+    """Start recording the metrics of a stage of the run.
+
+    Stages can not be nested, and each must be finished by calling end_stage. The metrics of the stage are recorded once
+    it ends, as:
+        {"Name": str, "WallSeconds": float, "CPUSeconds": float, "PeakRSS": int, "Timers": {name: float},
+         "Counters": {name: int}, "RowsPerSecond": float, "Queues": {name: dict}}
+    with RowsPerSecond only recorded when a Rows counter was added to, and Queues only recorded when the statistics of
+    a queue were added (see add_queue).
+
+    :param name:    The name of the stage.
+    :type name:     str
+
+    """
+
+    if _RECORDER is None:
+        return
+    _RECORDER.currentStage = {
+        "Name": name, "Timers": {}, "Counters": {}, "_StartWall": time.perf_counter(), "_StartCPU": _get_cpu_time()
+    }
+
+
+def start_worker():
+    """Discard the times and running timers that a forked worker process inherited from the main process.
+
+    This should be called when a worker process starts, so that only the times it records are returned by take_timers.
+
+    """
+
+    if _RECORDER is None:
+        return
+    _RECORDER.lock = threading.Lock()
+    _RECORDER.threadState = threading.local()
+    _RECORDER.timers = {}
+
+
+def take_timers():
+    """Remove and return the times recorded by the timers since they were last taken.
+
+    This allows a worker process to pass the times it recorded back to the main process.
+
+    :return:    The seconds recorded by each timer.
+    :rtype:     dict
+
+    """
+
+    if _RECORDER is None:
+        return {}
+    with _RECORDER.lock:
+        timers = _RECORDER.timers
+        _RECORDER.timers = {}
+    return timers
+
+
+def timed_iter(iterable, name):
+    """Record the time spent producing the items of an iterable under a timer.
+
+    :param iterable:    The iterable to time (e.g. a generator that parses a file).
+    :type iterable:     iterable
+    :param name:        The name of the timer.
+    :type name:         str
+    :return:            The iterable, wrapped so that producing each item is timed when recording is enabled.
+    :rtype:             iterable
+
+    """
+
+    if _RECORDER is None:
+        return iterable
+    return _timed_iter(iterable, name)
+
+
+def timer(name):
+    """Time a block of code under a named timer of the current stage.
+
+    :param name:    The name of the timer (e.g. Parsing).
+    :type name:     str
+    :return:        A context manager timing the block.
+    :rtype:         _Timer | _NullTimer
+
+    """
+
+    if _RECORDER is None:
+        return _NULL_TIMER
+    return _Timer(_RECORDER, name)
+
+
+class ProgressReporter:
+    """Log the progress of a loop over a known number of items.
+
+    When a reporting interval is given, a report including the throughput and the estimated time remaining is logged
+    at most once per interval. Otherwise a report is logged every PROGRESS_COUNT items.
+
+    """
+
+    def __init__(self, logger, message, total, interval=None):
+        """Initialise the reporter.
+
+        :param logger:      The logger to report the progress to.
+        :type logger:       logging.Logger
+        :param message:     The message describing the progress, formatted with the number of items completed (e.g.
+                                "Saved {:d} patients").
+        :type message:      str
+        :param total:       The total number of items.
+        :type total:        int
+        :param interval:    The minimum number of seconds between reports, or None to report every PROGRESS_COUNT items.
+        :type interval:     float | None
+
+        """
+
+        self._logger = logger
+        self._message = message
+        self._total = total
+        self._interval = interval
+        self._completed = 0
+        self._nextCount = PROGRESS_COUNT
+        self._startTime = time.perf_counter()
+        self._nextTime = self._startTime + interval if interval else None
+
+    def update(self, numCompleted=1):
+        """Record that items have been completed, and report the progress if a report is due.
+
+        :param numCompleted:    The number of items completed since the last update.
+        :type numCompleted:     int
+
+        """
+
+        self._completed += numCompleted
+        if self._interval is None:
+            if self._completed >= self._nextCount:
+                self._nextCount = (self._completed // PROGRESS_COUNT + 1) * PROGRESS_COUNT
+                self._logger.info("{:s} ({:.2f}%).".format(
+                    self._message.format(self._completed), (self._completed / self._total) * 100
+                ))
+            return
+
+        currentTime = time.perf_counter()
+        if currentTime >= self._nextTime:
+            self._nextTime = currentTime + self._interval
+            rate = self._completed / (currentTime - self._startTime)
+            remaining = (self._total - self._completed) / rate if rate > 0 else 0
+            self._logger.info("{:s} ({:.2f}%) at {:.1f} per second, with an estimated {:s} remaining.".format(
+                self._message.format(self._completed), (self._completed / self._total) * 100, rate,
+                time.strftime("%H:%M:%S", time.gmtime(max(remaining, 0)))
+            ))
+
+
+class _NullTimer:
+    """A timer that records nothing, used while recording is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+class _Recorder:
+    """The metrics recorded since recording was enabled."""
+
+    def __init__(self):
+        self.currentStage = None  # The stage being recorded.
+        self.lock = threading.Lock()  # The lock guarding the times and counters, which are added to by several threads.
+        self.stages = []  # The metrics of the finished stages.
+        self.startTime = time.perf_counter()
+        self.threadState = threading.local()  # The running timers of each thread.
+        self.timers = {}  # The seconds recorded by each timer since the timers were last taken.
+
+    @property
+    def timerStack(self):
+        """Get the running timers of the calling thread.
+
+        :return:    The running timers, with the innermost last.
+        :rtype:     list[_Timer]
+
+        """
+
+        try:
+            return self.threadState.timerStack
+        except AttributeError:
+            self.threadState.timerStack = []
+            return self.threadState.timerStack
+
+
+class _Timer:
+    """A timer that adds the time spent in a block of code, excluding that spent in nested timers, to a named timer."""
+
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        currentTime = time.perf_counter()
+        timerStack = self._recorder.timerStack
+        if timerStack:
+            # Pause the enclosing timer.
+            timerStack[-1]._record(currentTime)
+        self._start = currentTime
+        timerStack.append(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        currentTime = time.perf_counter()
+        timerStack = self._recorder.timerStack
+        self._record(currentTime)
+        timerStack.pop()
+        if timerStack:
+            # Resume the enclosing timer.
+            timerStack[-1]._start = currentTime
+        return False
+
+    def _record(self, currentTime):
+        """Add the time since the timer was started or resumed to the current stage and to the recorder's timers."""
+
+        elapsed = currentTime - self._start
+        self._start = currentTime
+        with self._recorder.lock:
+            self._recorder.timers[self._name] = self._recorder.timers.get(self._name, 0) + elapsed
+            if self._recorder.currentStage is not None:
+                stageTimers = self._recorder.currentStage["Timers"]
+                stageTimers[self._name] = stageTimers.get(self._name, 0) + elapsed
+
+
+def _get_cpu_time():
+    """Determine the CPU time used by this process and its finished child processes.
+
+    :return:    The CPU seconds used.
+    :rtype:     float
+
+    """
+
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _get_size(fileName):
+    """Determine the size of a file, or the total size of the files within a directory.
+
+    :param fileName:    The location of the file or directory.
+    :type fileName:     str
+    :return:            The size in bytes, or 0 if the location does not exist.
+    :rtype:             int
+
+    """
+
+    if os.path.isdir(fileName):
+        return sum(
+            os.path.getsize(os.path.join(root, i)) for root, _, files in os.walk(fileName) for i in files
+        )
+    return os.path.getsize(fileName) if os.path.isfile(fileName) else 0
+
+
+def _rusage_bytes(maxRSS):
+    """Convert a maximum resident set size reported by getrusage to bytes.
+
+    :param maxRSS:  The maximum resident set size, in kilobytes on Linux and bytes on macOS.
+    :type maxRSS:   int
+    :return:        The maximum resident set size in bytes.
+    :rtype:         int
+
+    """
+
+    return maxRSS if sys.platform == "darwin" else maxRSS * 1024
+
+
+def _timed_iter(iterable, name):
+    """Yield the items of an iterable, timing the production of each item.
+
+    :param iterable:    The iterable to time.
+    :type iterable:     iterable
+    :param name:        The name of the timer.
+    :type name:         str
+    :return:            A generator of the items of the iterable.
+    :rtype:             generator
+
+    """
+
+    iterator = iter(iterable)
+    while True:
+        with _Timer(_RECORDER, name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# Globals.
+_NULL_TIMER = _NullTimer()  # The timer returned while recording is disabled.
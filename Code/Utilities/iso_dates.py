@@ -0,0 +1,49 @@
+"""Functions to convert ISO format (YYYY-MM-DD) dates to and from integer day ordinals.
+
+Day ordinals are those of datetime.date.toordinal, with January 1st of year 1 being day 1. As a journal table contains
+few distinct dates compared to its number of entries, the conversion of each date string is cached.
+"""
+
+# Python imports.
+import datetime
+import functools
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+CACHE_SIZE = 1 << 16  # The number of date strings whose ordinals are cached.
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()  # The ordinal of the NumPy datetime64 epoch.
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def to_ordinal(isoDate):
+    """Convert a YYYY-MM-DD date to its day ordinal.
+
+    Dates in the fixed YYYY-MM-DD format are converted directly, while any other date accepted by
+    datetime.datetime.strptime with the format %Y-%m-%d (e.g. 2010-1-5) is converted using strptime.
+
+    :param isoDate: The date to convert.
+    :type isoDate:  str
+    :return:        The day ordinal of the date.
+    :rtype:         int
+
+    """
+
+    if len(isoDate) == 10 and isoDate[4] == '-' and isoDate[7] == '-' and isoDate[:4].isdigit() and \
+            isoDate[5:7].isdigit() and isoDate[8:].isdigit():
+        return datetime.date(int(isoDate[:4]), int(isoDate[5:7]), int(isoDate[8:])).toordinal()
+    return datetime.datetime.strptime(isoDate, "%Y-%m-%d").toordinal()
+
+
+def to_datetime64(ordinals):
+    """Convert day ordinals to NumPy dates.
+
+    :param ordinals:    The day ordinals to convert.
+    :type ordinals:     np.array | list[int]
+    :return:            The dates as datetime64[D] values.
+    :rtype:             np.array
+
+    """
+
+    return (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
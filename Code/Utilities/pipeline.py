@@ -0,0 +1,248 @@
+"""Classes to run the reading and writing stages of a loop on background threads connected by bounded queues.
+
+A Prefetcher produces the items of an iterable (e.g. blocks of lines read from a file) on a background thread, while a
+WriterStage runs the calls submitted to it (e.g. writing rows to the dataset files) on a background thread. The reading
+and writing therefore overlap the parsing and aggregation performed by the main thread. As the queues are bounded, a
+stage that gets ahead blocks until the stage it is waiting on catches up, rather than holding an unbounded amount of
+data in memory. Small items (e.g. patients) can be passed between the threads in batches, to reduce the overhead of
+the queues. The time each side of a queue spent blocked and the depth of the queue are logged when the stage
+finishes, and added to the current stage of the instrumentation for tuning the queue sizes.
+"""
+
+# Python imports.
+import logging
+import queue
+import threading
+import time
+
+# User imports.
+from Utilities import instrumentation
+
+# Globals.
+LOGGER = logging.getLogger(__name__)
+QUEUE_SIZE = 8  # The default maximum number of batches of items waiting in a queue.
+_END = object()  # The item marking the end of a queue.
+
+
+class _Stage:
+    """Base class for the stages, recording the statistics of the queue feeding or fed by the background thread."""
+
+    def __init__(self, name, maxSize):
+        """Initialise the queue and its statistics.
+
+        :param name:    The name of the stage, used when reporting the statistics of its queue.
+        :type name:     str
+        :param maxSize: The maximum number of batches of items waiting in the queue.
+        :type maxSize:  int
+
+        """
+
+        self._name = name
+        self._queue = queue.Queue(maxSize)
+        self._error = None  # Any exception raised by the background thread.
+        self._thread = None
+        self._numItems = 0
+        self._depthTotal = 0  # The sum of the depth of the queue after each item is added.
+        self._maxDepth = 0
+        self._putStall = 0  # The seconds spent waiting for space in the queue.
+        self._getStall = 0  # The seconds spent waiting for an item in the queue.
+
+    def _get(self):
+        """Remove the next item from the queue, waiting until there is one.
+
+        :return:    The item.
+        :rtype:     object
+
+        """
+
+        startTime = time.perf_counter()
+        item = self._queue.get()
+        self._getStall += time.perf_counter() - startTime
+        return item
+
+    def _put(self, item):
+        """Add an item to the queue, waiting until there is space for it.
+
+        :param item:    The item to add.
+        :type item:     object
+
+        """
+
+        startTime = time.perf_counter()
+        self._queue.put(item)
+        self._putStall += time.perf_counter() - startTime
+        if item is not _END:
+            depth = self._queue.qsize()
+            self._numItems += 1
+            self._depthTotal += depth
+            self._maxDepth = max(self._maxDepth, depth)
+
+    def _report(self):
+        """Log the statistics of the queue and add them to the instrumentation."""
+
+        statistics = {
+            "Items": self._numItems, "MaxDepth": self._maxDepth,
+            "MeanDepth": self._depthTotal / self._numItems if self._numItems else 0,
+            "ProducerStallSeconds": self._putStall, "ConsumerStallSeconds": self._getStall
+        }
+        LOGGER.info(
+            "{:s} queue: {:d} items, mean depth {:.1f} (max {:d}), producer stalled for {:.2f}s, consumer stalled for "
+            "{:.2f}s.".format(
+                self._name, self._numItems, statistics["MeanDepth"], self._maxDepth, self._putStall, self._getStall
+            )
+        )
+        instrumentation.add_queue(self._name, statistics)
+
+
+class Prefetcher(_Stage):
+    """Produce the items of an iterable on a background thread ahead of them being needed."""
+
+    def __init__(self, iterable, name, maxSize=QUEUE_SIZE, batchSize=1):
+        """Initialise the prefetcher and start producing the items.
+
+        :param iterable:    The iterable to produce the items of.
+        :type iterable:     iterable
+        :param name:        The name of the stage, used when reporting the statistics of its queue.
+        :type name:         str
+        :param maxSize:     The maximum number of batches of items produced ahead of being needed.
+        :type maxSize:      int
+        :param batchSize:   The number of items passed between the threads at once.
+        :type batchSize:    int
+
+        """
+
+        super().__init__(name, maxSize)
+        self._iterable = iterable
+        self._batchSize = batchSize
+        self._isStopped = threading.Event()  # Whether the consumer has stopped taking items.
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            batch = self._get()
+            if batch is _END:
+                break
+            yield from batch
+        self.close()
+
+    def close(self):
+        """Stop producing items and wait for the background thread to finish."""
+
+        if self._thread is None:
+            return
+        self._isStopped.set()
+        while self._thread.is_alive():
+            # Make space in the queue so that the background thread is not blocked from seeing that it should stop.
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                self._thread.join(0.01)
+        self._thread = None
+        self._report()
+        if self._error is not None:
+            raise self._error
+
+    def _produce(self):
+        """Add the items of the iterable to the queue until it is exhausted or the consumer stops."""
+
+        try:
+            batch = []
+            for i in self._iterable:
+                if self._isStopped.is_set():
+                    break
+                batch.append(i)
+                if len(batch) == self._batchSize:
+                    self._put(batch)
+                    batch = []
+            if batch:
+                self._put(batch)
+        except Exception as e:
+            self._error = e
+        finally:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+            self._put(_END)
+
+
+class WriterStage(_Stage):
+    """Run the calls submitted to the stage in order on a background thread."""
+
+    def __init__(self, name, maxSize=QUEUE_SIZE, batchSize=1):
+        """Initialise the stage and start its background thread.
+
+        :param name:        The name of the stage, used when reporting the statistics of its queue.
+        :type name:         str
+        :param maxSize:     The maximum number of batches of calls waiting to be run.
+        :type maxSize:      int
+        :param batchSize:   The number of calls passed to the background thread at once.
+        :type batchSize:    int
+
+        """
+
+        super().__init__(name, maxSize)
+        self._batchSize = batchSize
+        self._batch = []  # The calls submitted since the last batch was passed to the background thread.
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """Wait for the submitted calls to finish and stop the background thread."""
+
+        if self._thread is None:
+            return
+        if self._batch:
+            self._put(self._batch)
+            self._batch = []
+        self._put(_END)
+        self._thread.join()
+        self._thread = None
+        self._report()
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, function, *args):
+        """Submit a call to be run on the background thread, waiting if too many calls are already waiting.
+
+        The arguments must not be changed after they are submitted.
+
+        :param function:    The function to call.
+        :type function:     function
+        :param args:        The arguments to call the function with.
+        :type args:         object
+
+        """
+
+        if self._error is not None:
+            raise self._error
+        self._batch.append((function, args))
+        if len(self._batch) == self._batchSize:
+            self._put(self._batch)
+            self._batch = []
+
+    def _consume(self):
+        """Run the submitted calls until the end of the queue is reached."""
+
+        while True:
+            batch = self._get()
+            if batch is _END:
+                break
+            if self._error is None:
+                try:
+                    for function, args in batch:
+                        function(*args)
+                except Exception as e:
+                    # Keep consuming the calls so that the submitting thread is not blocked.
+                    self._error = e
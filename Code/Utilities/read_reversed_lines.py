@@ -0,0 +1,43 @@
+"""A function to read the lines of a file from the last line to the first."""
+
+# Globals.
+BLOCK_SIZE = 1 << 20  # The number of bytes to read from the file at once.
+
+
+def main(fileName, end=None):
+    """Read the lines of a file in reverse order without reading the whole file.
+
+    :param fileName:    The location of the file to read.
+    :type fileName:     str
+    :param end:         The byte offset to treat as the end of the file (or the size of the file if no offset is
+                            supplied). This must be the start of a line.
+    :type end:          int
+    :return:            A generator of the byte offset of the start of each line and the line (as bytes including any
+                            line ending), from the last line to the first.
+    :rtype:             generator
+
+    """
+
+    with open(fileName, 'rb') as fid:
+        if end is None:
+            fid.seek(0, 2)
+            end = fid.tell()
+        position = end
+        remainder = b''  # The start of a line that began in a block that has not been read yet.
+        while position > 0:
+            # Read the block preceding the current position. The remainder starts where the block ends, so the block
+            # index of a character plus the offset of the block gives the character's offset in the file.
+            blockStart = max(0, position - BLOCK_SIZE)
+            fid.seek(blockStart)
+            block = fid.read(position - blockStart) + remainder
+            lineEnd = len(block)
+            lineBreak = block.rfind(b'\n', 0, max(lineEnd - 1, 0))
+            while lineBreak != -1:
+                lineStart = lineBreak + 1
+                yield blockStart + lineStart, block[lineStart:lineEnd]
+                lineEnd = lineStart
+                lineBreak = block.rfind(b'\n', 0, max(lineEnd - 1, 0))
+            remainder = block[:lineEnd]
+            position = blockStart
+        if remainder:
+            yield 0, remainder
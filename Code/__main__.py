@@ -2,16 +2,22 @@
 
 # Python imports.
 import argparse
+import copy
+import importlib
 import json
 import logging
 import logging.config
 import os
 import shutil
 import sys
+import time
 
 # User imports.
 from DataProcessing import JournalTable
 from Libraries.JsonschemaManipulation import Configuration
+from Utilities import compressed_files
+from Utilities import config_cache
+from Utilities import instrumentation
 
 # 3rd party imports.
 import jsonschema
@@ -28,6 +34,14 @@ parser.add_argument("input", help="The location of the input files. The specifie
                                   "the processing that will be carried out.")
 
 # Optional arguments.
+parser.add_argument("-b", "--batch",
+                    help="The locations of the configuration files of several studies whose datasets should be "
+                         "generated from a single pass over the data. The parameters in each file override those of "
+                         "the configuration used to process the data, and each study's datasets are saved in a "
+                         "directory named after its file. Default: only the datasets of the configuration used to "
+                         "process the data are generated.",
+                    nargs='+',
+                    type=str)
 parser.add_argument("-c", "--config",
                     help="The location of the file containing the configuration parameters to use. "
                          "Default: a file called DefaultConfig.json in the ConfigurationFiles directory.",
@@ -37,6 +51,10 @@ parser.add_argument("-e", "--encode",
                     help="The encoding to convert strings in the JSON configuration file to. Default: no "
                          "conversion performed.",
                     type=str)
+parser.add_argument("-m", "--metrics",
+                    action="store_true",
+                    help="Whether to record the performance of each stage of the run in a file called metrics.json in "
+                         "the output directory. Default: performance is not recorded.")
 parser.add_argument("-n", "--noProcess",
                     action="store_true",
                     help="Whether the data should be prevented from being processed. Default: data can be processed.")
@@ -44,6 +62,22 @@ parser.add_argument("-o", "--output",
                     help="The location of the directory to save the output to. Default: a top level "
                          "directory called Results.",
                     type=str)
+parser.add_argument("-p", "--processes",
+                    default=1,
+                    help="The number of processes to use when pre-processing the data and generating the datasets. "
+                         "Default: 1.",
+                    type=int)
+parser.add_argument("-r", "--report",
+                    default=None,
+                    help="The minimum number of seconds between reports of the progress of the dataset generation, "
+                         "including the throughput and estimated time remaining. Default: report every 1000 patients.",
+                    type=float)
+parser.add_argument("-s", "--serve",
+                    default=None,
+                    help="The port on localhost to serve requests to generate datasets on once the data is processed, "
+                         "keeping the processed data in memory between requests. Default: generate the datasets once "
+                         "and exit.",
+                    type=int)
 parser.add_argument("-w", "--overwrite",
                     action="store_true",
                     help="Whether the output directory should be overwritten. Default: do not overwrite.")
@@ -51,7 +85,10 @@ parser.add_argument("-w", "--overwrite",
 # ============================ #
 # Parse and Validate Arguments #
 # ============================ #
+startupTimes = {"Start": time.perf_counter()}  # The time at which each step of starting the run finished.
 args = parser.parse_args()
+if args.metrics:
+    instrumentation.enable()
 dirCurrent = os.path.dirname(os.path.join(os.getcwd(), __file__))  # Directory containing this file.
 dirTop = os.path.abspath(os.path.join(dirCurrent, os.pardir))
 dirOutput = os.path.join(dirTop, "Results")
@@ -89,51 +126,69 @@ logConfigInfo["handlers"]["file"]["filename"] = fileLogOutput
 logConfigInfo["handlers"]["file_timed"]["filename"] = fileLogOutput
 logging.config.dictConfig(logConfigInfo)
 logger = logging.getLogger("__main__")
+startupTimes["Logging"] = time.perf_counter()
 
-# Validate the input location.
 inputContent = args.input
-if not os.path.exists(inputContent):
-    logger.error("The input location does not exist.")
-    isErrors = True
 
-# Set default parameter values.
-config = Configuration.Configuration()
-try:
-    if args.encode:
-        config.set_from_json(fileDefaultConfig, fileConfigSchema, args.encode)
-    else:
-        config.set_from_json(fileDefaultConfig, fileConfigSchema)
-except jsonschema.SchemaError as e:
-    exceptionInfo = sys.exc_info()
-    logger.error(
-        "The configuration schema is not a valid JSON schema. Please correct any changes made to the "
-        "schema or download the original and save it at {:s}.\n{:s}".format(fileConfigSchema, str(exceptionInfo[1]))
-    )
+# Validate the number of processes.
+numProcesses = args.processes
+if numProcesses < 1:
+    logger.error("The number of processes to use must be at least 1.")
     isErrors = True
-except jsonschema.ValidationError as e:
-    exceptionInfo = sys.exc_info()
-    logger.error(
-        "The default configuration file is not valid against the schema. Please correct any changes made to "
-        "the file or download the original and save it at {:s}.\n{:s}".format(fileDefaultConfig, str(exceptionInfo[1]))
-    )
+if args.serve is not None and args.batch:
+    logger.error("A batch of studies can not be generated when serving requests.")
     isErrors = True
-except jsonschema.RefResolutionError as e:
-    exceptionInfo = sys.exc_info()
-    logger.error(
-        "The configuration schema contains an invalid reference. Please correct any changes made to the "
-        "schema or download the original and save it at {:s}.\n{:s}".format(fileConfigSchema, str(exceptionInfo[1]))
-    )
-    isErrors = True
-except LookupError as e:
-    logger.exception("Requested encoding {:s} to convert JSON strings to wasn't found.".format(args.encode))
+
+# Load the configuration. The merged configuration is reused from a previous run with identical configuration files
+# when possible, as validating the files against the schema takes up most of the time spent starting a run.
+instrumentation.start_stage("LoadConfiguration")
+if args.config and not os.path.isfile(args.config):
+    logger.error("The supplied location of the configuration file is not a file.")
     isErrors = True
+dirConfigCache = os.path.join(dirTop, "ConfigurationFiles", config_cache.CONFIG_CACHE_DIRECTORY)
+configFiles = [fileConfigSchema, fileDefaultConfig, Configuration.__file__] + ([args.config] if args.config else [])
+configKey = None if isErrors else config_cache.fingerprint(configFiles, args.encode)
+config = None if isErrors else config_cache.load(dirConfigCache, configKey)
+isConfigCached = config is not None
+startupTimes["ConfigurationCache"] = time.perf_counter()
 
-# Validate and set any user supplied configuration parameters.
-if args.config:
-    if not os.path.isfile(args.config):
-        logger.error("The supplied location of the configuration file is not a file.")
+if not isConfigCached:
+    # Set default parameter values.
+    config = Configuration.Configuration()
+    try:
+        if args.encode:
+            config.set_from_json(fileDefaultConfig, fileConfigSchema, args.encode)
+        else:
+            config.set_from_json(fileDefaultConfig, fileConfigSchema)
+    except jsonschema.SchemaError as e:
+        exceptionInfo = sys.exc_info()
+        logger.error(
+            "The configuration schema is not a valid JSON schema. Please correct any changes made to the "
+            "schema or download the original and save it at {:s}.\n{:s}".format(fileConfigSchema, str(exceptionInfo[1]))
+        )
         isErrors = True
-    else:
+    except jsonschema.ValidationError as e:
+        exceptionInfo = sys.exc_info()
+        logger.error(
+            "The default configuration file is not valid against the schema. Please correct any changes made to "
+            "the file or download the original and save it at {:s}.\n{:s}".format(
+                fileDefaultConfig, str(exceptionInfo[1]))
+        )
+        isErrors = True
+    except jsonschema.RefResolutionError as e:
+        exceptionInfo = sys.exc_info()
+        logger.error(
+            "The configuration schema contains an invalid reference. Please correct any changes made to the "
+            "schema or download the original and save it at {:s}.\n{:s}".format(fileConfigSchema, str(exceptionInfo[1]))
+        )
+        isErrors = True
+    except LookupError as e:
+        logger.exception("Requested encoding {:s} to convert JSON strings to wasn't found.".format(args.encode))
+        isErrors = True
+    startupTimes["DefaultConfiguration"] = time.perf_counter()
+
+    # Validate and set any user supplied configuration parameters.
+    if args.config and os.path.isfile(args.config):
         try:
             if args.encode:
                 config.set_from_json(args.config, fileConfigSchema, args.encode)
@@ -149,6 +204,78 @@ if args.config:
         except LookupError as e:
             logger.exception("Requested encoding {:s} to convert JSON strings to wasn't found.".format(args.encode))
             isErrors = True
+        startupTimes["UserConfiguration"] = time.perf_counter()
+
+    # Save the configuration for reuse if it is valid.
+    if not isErrors:
+        config_cache.save(dirConfigCache, configKey, config)
+
+# Load the configuration of each study in a batch, with the parameters of each study's file overriding those of the
+# configuration loaded above.
+batchStudies = []  # The configuration of each study and the location of the directory to save its datasets in.
+if args.batch and not isErrors:
+    batchNames = [os.path.splitext(os.path.basename(i))[0] for i in args.batch]
+    if len(set(batchNames)) < len(batchNames):
+        logger.error("The configuration files of the studies in a batch must have different names.")
+        isErrors = True
+    for fileBatchConfig, batchName in zip(args.batch, batchNames):
+        if not os.path.isfile(fileBatchConfig):
+            logger.error("The supplied location of the configuration file {:s} is not a file.".format(fileBatchConfig))
+            isErrors = True
+            continue
+        batchKey = config_cache.fingerprint(configFiles + [fileBatchConfig], args.encode)
+        batchConfig = config_cache.load(dirConfigCache, batchKey)
+        if batchConfig is None:
+            batchConfig = copy.deepcopy(config)
+            try:
+                if args.encode:
+                    batchConfig.set_from_json(fileBatchConfig, fileConfigSchema, args.encode)
+                else:
+                    batchConfig.set_from_json(fileBatchConfig, fileConfigSchema)
+            except jsonschema.ValidationError as e:
+                exceptionInfo = sys.exc_info()
+                logger.error(
+                    "The configuration file {:s} is not valid against the schema.\n{:s}".format(
+                        fileBatchConfig, str(exceptionInfo[1]))
+                )
+                isErrors = True
+                continue
+            config_cache.save(dirConfigCache, batchKey, batchConfig)
+        batchStudies.append((batchConfig, os.path.join(dirOutputDataPrep, batchName)))
+    startupTimes["BatchConfiguration"] = time.perf_counter()
+
+instrumentation.end_stage()
+
+# Validate the input location. Only an input read from the file system needs to exist, as the input of a database
+# converter may instead be a connection string.
+if not isErrors:
+    isFileInput = config.get_param(["DataProcessing", "Converter"])[1] != "JournalDatabase" or \
+        config.get_param(["DataProcessing", "DatabaseModule"])[1] == "sqlite3"
+    if isFileInput and not os.path.exists(inputContent):
+        logger.error("The input location does not exist.")
+        isErrors = True
+
+# Validate the locations of any files of IDs given in place of lists of patterns.
+if not isErrors:
+    for i in ["CodesToIgnore", "CodesToKeep", "PatientsToIgnore", "PatientsToKeep"]:
+        for j in [config] + [k[0] for k in batchStudies]:
+            patterns = j.get_param(["DataProcessing", i])[1]
+            if isinstance(patterns, str) and not os.path.isfile(patterns):
+                logger.error("The file of IDs given for {:s} ({:s}) is not a file.".format(i, patterns))
+                isErrors = True
+startupTimes["InputValidation"] = time.perf_counter()
+
+# Log how the time spent starting the run was split between its steps.
+stepTimes = []
+previousTime = startupTimes["Start"]
+for i, j in startupTimes.items():
+    if i != "Start":
+        stepTimes.append("{:s} {:.3f}s".format(i, j - previousTime))
+        previousTime = j
+logger.info("Started the run in {:.3f}s ({:s}), {:s}.".format(
+    previousTime - startupTimes["Start"], ", ".join(stepTimes),
+    "loading the validated configuration from the cache" if isConfigCached else "validating the configuration"
+))
 
 # Display errors if any were found.
 if isErrors:
@@ -162,6 +289,17 @@ if not args.noProcess:
     # Processing of the data is to be performed.
     conversionToUse = config.get_param(["DataProcessing", "Converter"])[1]
 
+    # Determine the codec to compress the outputs with, if they are to be compressed.
+    compression = config.get_param(["DataProcessing", "OutputCompression"])[1]
+    compression = None if compression == "None" else compression
+    if compression is not None and not compressed_files.is_available(compression):
+        logger.error("The package needed to use {:s} compression is not installed.".format(compression))
+        print("\nErrors were encountered prior to processing the journal table..\n")
+        sys.exit()
+
+    # Determine the size of the queues between the reading, processing and writing threads (0 for no threads).
+    queueSize = config.get_param(["DataProcessing", "PipelineQueueSize"])[1]
+
     if conversionToUse == "JournalTable":
         # Convert the data from a journal table format to a flat file.
 
@@ -172,18 +310,91 @@ if not args.noProcess:
             sys.exit()
 
         dirProcessedData = os.path.join(inputContent, "_ProcessedJournalTable_")
-        if os.path.isdir(dirProcessedData):
-            # The data has been processed previously.
-            JournalTable.generate_datasets.main(dirProcessedData, dirOutputDataPrep, config)
-        elif not os.path.exists(dirProcessedData):
-            os.makedirs(dirProcessedData)
-            JournalTable.process_table.main(inputContent, dirProcessedData)
-            JournalTable.generate_datasets.main(dirProcessedData, dirOutputDataPrep, config)
-        else:
+        if os.path.exists(dirProcessedData) and not os.path.isdir(dirProcessedData):
             logger.error("The location to save the processed journal table data already exists and is not a directory.")
             print("\nErrors were encountered prior to processing the journal table..\n")
             sys.exit()
 
+        # Determine the memory to use when sorting the journal table, if it is to be sorted.
+        isSorted = config.get_param(["DataProcessing", "SortJournalTable"])[1]
+        sortMemoryLimit = config.get_param(["DataProcessing", "SortMemoryLimit"])[1] * (1 << 20) if isSorted else None
+
+        # Determine whether the data has been processed previously and is still up to date with the input files.
+        with instrumentation.stage("ProcessTable"):
+            cacheStatus = JournalTable.cache_manifest.check(inputContent, dirProcessedData, isSorted, compression)
+            if cacheStatus["Status"] == JournalTable.cache_manifest.FRESH:
+                JournalTable.cache_manifest.refresh(dirProcessedData, cacheStatus["Sources"])
+            elif cacheStatus["Status"] == JournalTable.cache_manifest.APPENDED:
+                # Data has been appended to the input files, so only the new data needs processing.
+                logger.info("The input files have been appended to since they were processed.")
+                JournalTable.process_table.update(
+                    inputContent, dirProcessedData, numProcesses, cacheStatus["Sources"], queueSize
+                )
+            elif cacheStatus["Status"] == JournalTable.cache_manifest.STALE:
+                if os.path.isdir(dirProcessedData):
+                    logger.info("The processed journal table data is out of date and will be re-created.")
+                    shutil.rmtree(dirProcessedData)
+                os.makedirs(dirProcessedData)
+                JournalTable.process_table.main(
+                    inputContent, dirProcessedData, numProcesses, sortMemoryLimit, compression, queueSize
+                )
+        if args.serve is not None:
+            service = JournalTable.dataset_service.DatasetService(
+                dirProcessedData, dirOutputDataPrep, config, fileConfigSchema, args.encode
+            )
+            service.serve(args.serve)
+        else:
+            with instrumentation.stage("GenerateDatasets"):
+                if batchStudies:
+                    JournalTable.generate_datasets.main_batch(dirProcessedData, batchStudies, args.report)
+                else:
+                    JournalTable.generate_datasets.main(
+                        dirProcessedData, dirOutputDataPrep, config, numProcesses, args.report
+                    )
+
+    elif conversionToUse == "JournalDatabase":
+        # Convert the data from the journal and patient tables of a database to a flat file.
+
+        databaseModuleName = config.get_param(["DataProcessing", "DatabaseModule"])[1]
+        try:
+            databaseModule = importlib.import_module(databaseModuleName)
+        except ImportError:
+            logger.error("The database module {:s} could not be imported.".format(databaseModuleName))
+            print("\nErrors were encountered prior to processing the journal table..\n")
+            sys.exit()
+        try:
+            connection = databaseModule.connect(inputContent)
+        except databaseModule.Error as e:
+            logger.error("Could not connect to the database.\n{:s}".format(str(e)))
+            print("\nErrors were encountered prior to processing the journal table..\n")
+            sys.exit()
+
+        # The tables are processed on every run, as there are no source files to check for changes.
+        dirProcessedData = os.path.join(dirOutput, "_ProcessedJournalTable_")
+        with instrumentation.stage("ProcessTable"):
+            os.makedirs(dirProcessedData)
+            JournalTable.process_table.main_database(
+                connection, dirProcessedData, config.get_param(["DataProcessing", "DatabaseBatchSize"])[1],
+                compression, queueSize
+            )
+        connection.close()
+        if args.serve is not None:
+            service = JournalTable.dataset_service.DatasetService(
+                dirProcessedData, dirOutputDataPrep, config, fileConfigSchema, args.encode
+            )
+            service.serve(args.serve)
+        else:
+            with instrumentation.stage("GenerateDatasets"):
+                if batchStudies:
+                    JournalTable.generate_datasets.main_batch(dirProcessedData, batchStudies, args.report)
+                else:
+                    JournalTable.generate_datasets.main(
+                        dirProcessedData, dirOutputDataPrep, config, numProcesses, args.report
+                    )
+
     else:
         # The converter specified is not valid.
         logger.error("The specified converter {:s} is not a valid converter choice.".format(conversionToUse))
+
+# Save the performance of each stage of the run next to the log file.
+instrumentation.save(os.path.join(dirOutput, "metrics.json"))